@@ -0,0 +1,158 @@
+"""
+Adaptive Scheduler Module - Per-camera analysis rate driven by recent activity
+
+Each camera sits on one of three levels:
+
+    IDLE    no persons, LOW threat        -> ANALYSIS_INTERVAL_IDLE   (floor rate)
+    ACTIVE  persons or signals present    -> ANALYSIS_INTERVAL_ACTIVE
+    ALERT   HIGH / CRITICAL threat        -> ANALYSIS_INTERVAL_ALERT  (ceiling rate)
+
+Stepping up is immediate. Stepping down is one level at a time and only
+after the camera has stayed below its current level for
+SCHEDULER_STEP_DOWN_AFTER seconds, so a scene does not flap between rates.
+
+Usage:
+    interval = scheduler.update(camera_id, persons, threat_level, signals)
+    ...
+    if scheduler.should_analyze(camera_id):
+        analyze(frame)
+"""
+
+import time
+import threading
+from typing import Dict
+
+from config import Config
+
+
+IDLE, ACTIVE, ALERT = 0, 1, 2
+LEVEL_NAMES = ("IDLE", "ACTIVE", "ALERT")
+
+ALERT_THREAT_LEVELS = {"HIGH", "CRITICAL"}
+
+
+class _CameraSchedule:
+    __slots__ = ("level", "calm_since", "next_due", "last_seen", "updates")
+
+    def __init__(self, level, now):
+        self.level = level
+        self.calm_since = None
+        self.next_due = now
+        self.last_seen = now
+        self.updates = 0
+
+
+class AnalysisScheduler:
+    """Tracks an analysis level per camera and when it is next due"""
+
+    def __init__(self, idle_interval=None, active_interval=None, alert_interval=None,
+                 step_down_after=None, enabled=None):
+        self.intervals = (
+            Config.ANALYSIS_INTERVAL_IDLE if idle_interval is None else idle_interval,
+            Config.ANALYSIS_INTERVAL_ACTIVE if active_interval is None else active_interval,
+            Config.ANALYSIS_INTERVAL_ALERT if alert_interval is None else alert_interval,
+        )
+        self.step_down_after = (Config.SCHEDULER_STEP_DOWN_AFTER
+                                if step_down_after is None else step_down_after)
+        self.enabled = Config.ADAPTIVE_SCHEDULING if enabled is None else enabled
+        # Cameras silent for this long are forgotten
+        self.stale_after = max(self.intervals) * 10 + self.step_down_after
+
+        self._lock = threading.Lock()
+        self._cameras: Dict[str, _CameraSchedule] = {}
+        self._updates = 0
+
+    # -------------------------------------------------
+    # LEVELS
+    # -------------------------------------------------
+    @staticmethod
+    def target_level(persons, threat_level, signals=0) -> int:
+        """Level a single observation asks for"""
+        if str(threat_level).upper() in ALERT_THREAT_LEVELS:
+            return ALERT
+        if persons or signals or str(threat_level).upper() != "LOW":
+            return ACTIVE
+        return IDLE
+
+    def _schedule(self, camera_id, now) -> _CameraSchedule:
+        state = self._cameras.get(camera_id)
+        if state is None:
+            # Unknown cameras start active until they prove quiet
+            state = self._cameras[camera_id] = _CameraSchedule(ACTIVE, now)
+        return state
+
+    def update(self, camera_id, persons, threat_level, signals=0, now: float = None) -> float:
+        """
+        Record an analysis result and return the seconds until the camera's
+        next analysis.
+        """
+        if not self.enabled:
+            return Config.CAPTURE_INTERVAL
+
+        now = time.monotonic() if now is None else now
+        target = self.target_level(persons, threat_level, signals)
+
+        with self._lock:
+            state = self._schedule(camera_id, now)
+            if target > state.level:
+                state.level = target
+                state.calm_since = None
+            elif target < state.level:
+                if state.calm_since is None:
+                    state.calm_since = now
+                elif now - state.calm_since >= self.step_down_after:
+                    state.level -= 1
+                    # Each further step down needs its own quiet period
+                    state.calm_since = now if target < state.level else None
+            else:
+                state.calm_since = None
+
+            interval = self.intervals[state.level]
+            state.next_due = now + interval
+            state.last_seen = now
+            state.updates += 1
+
+            self._updates += 1
+            if self._updates % 256 == 0:
+                self._prune(now)
+        return interval
+
+    def should_analyze(self, camera_id, now: float = None) -> bool:
+        """True when the camera's next analysis is due"""
+        if not self.enabled:
+            return True
+        now = time.monotonic() if now is None else now
+        state = self._cameras.get(camera_id)
+        return state is None or now >= state.next_due
+
+    def interval(self, camera_id) -> float:
+        state = self._cameras.get(camera_id)
+        return self.intervals[ACTIVE if state is None else state.level]
+
+    def level(self, camera_id) -> str:
+        state = self._cameras.get(camera_id)
+        return LEVEL_NAMES[ACTIVE if state is None else state.level]
+
+    def _prune(self, now):
+        stale = [cam for cam, state in self._cameras.items()
+                 if now - state.last_seen > self.stale_after]
+        for cam in stale:
+            del self._cameras[cam]
+
+    # -------------------------------------------------
+    # METRICS
+    # -------------------------------------------------
+    def snapshot(self) -> Dict:
+        with self._lock:
+            levels = [state.level for state in self._cameras.values()]
+        counts = {name: levels.count(idx) for idx, name in enumerate(LEVEL_NAMES)}
+        # Analyses/sec the current mix asks for; levels at 0s (every frame) are not counted
+        demand = sum(1.0 / self.intervals[lvl] for lvl in levels if self.intervals[lvl] > 0)
+        return {
+            "enabled": self.enabled,
+            "cameras": len(levels),
+            "levels": counts,
+            "intervals_s": dict(zip(LEVEL_NAMES, self.intervals)),
+            "step_down_after_s": self.step_down_after,
+            "scheduled_analyses_per_sec": round(demand, 2),
+        }
@@ -0,0 +1,216 @@
+"""
+Admission Control Module - Bounded inference queue with priority-aware
+load shedding
+
+Every inference request must ``admit()`` before touching the model. At
+most ``max_concurrency`` requests run at once; the rest wait in a bounded
+priority queue. A request is rejected up front (HTTP 503 + Retry-After)
+when the queue is full or its projected wait exceeds its deadline, and is
+dropped from the queue if the deadline passes while waiting. Cameras that
+recently produced a HIGH/CRITICAL threat are served first.
+"""
+
+import math
+import time
+import heapq
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from config import Config
+
+
+PRIORITY_THREAT = 0
+PRIORITY_NORMAL = 1
+
+PRIORITY_LEVELS = {"HIGH", "CRITICAL"}
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; ``retry_after`` is in whole seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("priority", "cost", "granted", "evicted")
+
+    def __init__(self, priority, cost):
+        self.priority = priority
+        self.cost = cost
+        self.granted = False
+        self.evicted = False
+
+
+class AdmissionController:
+    """Concurrency limiter with a bounded, priority-ordered wait queue"""
+
+    def __init__(self, max_concurrency=None, max_queue=None, priority_window=None,
+                 initial_service_time=0.25, ewma_alpha=0.2):
+        self.max_concurrency = max_concurrency or Config.INFERENCE_CONCURRENCY
+        self.max_queue = Config.INFERENCE_QUEUE_SIZE if max_queue is None else max_queue
+        self.priority_window = (Config.PRIORITY_WINDOW
+                                if priority_window is None else priority_window)
+        self.ewma_alpha = ewma_alpha
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._active_cost = 0
+        self._queue = []  # heap of (priority, seq, ticket)
+        self._queued_cost = 0
+        self._seq = itertools.count()
+        self._unit_service_time = initial_service_time
+        self._hot_cameras = {}  # camera_id -> priority expiry (monotonic)
+        self.stats = {"admitted": 0, "rejected_full": 0, "rejected_deadline": 0,
+                      "expired_in_queue": 0, "evicted": 0, "priority_admitted": 0}
+
+    # -------------------------------------------------
+    # PRIORITY
+    # -------------------------------------------------
+    def observe(self, camera_id, threat_level) -> None:
+        """Feed back a result so hot cameras get priority for a while"""
+        if camera_id is None or str(threat_level).upper() not in PRIORITY_LEVELS:
+            return
+        with self._cond:
+            self._hot_cameras[camera_id] = time.monotonic() + self.priority_window
+
+    def priority_for(self, camera_id) -> int:
+        expiry = self._hot_cameras.get(camera_id)
+        if expiry is None:
+            return PRIORITY_NORMAL
+        if expiry < time.monotonic():
+            self._hot_cameras.pop(camera_id, None)
+            return PRIORITY_NORMAL
+        return PRIORITY_THREAT
+
+    # -------------------------------------------------
+    # ADMISSION
+    # -------------------------------------------------
+    def _projected_wait(self, cost_ahead) -> float:
+        """Seconds until a request behind ``cost_ahead`` units of work starts"""
+        return (cost_ahead + self._active_cost) * self._unit_service_time / self.max_concurrency
+
+    def _retry_after(self) -> int:
+        backlog = self._projected_wait(self._queued_cost)
+        return max(1, int(math.ceil(backlog)))
+
+    @contextmanager
+    def admit(self, camera_id=None, deadline: float = None, cost: int = 1):
+        """
+        Hold an inference slot for the duration of the ``with`` block.
+
+        Args:
+            camera_id: Used for threat-based priority
+            deadline: Seconds the caller is willing to wait for a slot
+            cost: Work units (images) the request will run
+
+        Raises:
+            Overloaded: Queue full, projected wait past deadline, or the
+                        deadline expired while queued
+        """
+        deadline = Config.REQUEST_DEADLINE if deadline is None else deadline
+        expires = time.monotonic() + deadline
+
+        with self._cond:
+            priority = self.priority_for(camera_id)
+            if self._active < self.max_concurrency and not self._queue:
+                ticket = _Ticket(priority, cost)
+                self._grant(ticket)
+            else:
+                ticket = self._enqueue(priority, cost, deadline)
+                while not ticket.granted and not ticket.evicted:
+                    remaining = expires - time.monotonic()
+                    if remaining <= 0:
+                        self._remove(ticket)
+                        self.stats["expired_in_queue"] += 1
+                        raise Overloaded("Deadline expired while queued", self._retry_after())
+                    self._cond.wait(remaining)
+                if ticket.evicted:
+                    raise Overloaded("Displaced by higher priority request", self._retry_after())
+
+        started = time.monotonic()
+        try:
+            yield ticket
+        finally:
+            elapsed = time.monotonic() - started
+            with self._cond:
+                unit = elapsed / max(cost, 1)
+                self._unit_service_time += self.ewma_alpha * (unit - self._unit_service_time)
+                self._active -= 1
+                self._active_cost -= cost
+                self._dispatch()
+
+    def _enqueue(self, priority, cost, deadline) -> _Ticket:
+        cost_ahead = sum(t.cost for p, _, t in self._queue if p <= priority)
+        projected = self._projected_wait(cost_ahead)
+        if projected > deadline:
+            self.stats["rejected_deadline"] += 1
+            raise Overloaded(
+                f"Projected wait {projected:.1f}s exceeds deadline {deadline:.1f}s",
+                self._retry_after(),
+            )
+
+        if len(self._queue) >= self.max_queue:
+            # A priority request may displace the newest normal-priority waiter
+            victims = [entry for entry in self._queue if entry[0] > priority]
+            if not victims:
+                self.stats["rejected_full"] += 1
+                raise Overloaded("Inference queue full", self._retry_after())
+            victim = max(victims, key=lambda entry: (entry[0], entry[1]))
+            self._remove(victim[2])
+            victim[2].evicted = True
+            self.stats["evicted"] += 1
+            self._cond.notify_all()
+
+        ticket = _Ticket(priority, cost)
+        heapq.heappush(self._queue, (priority, next(self._seq), ticket))
+        self._queued_cost += cost
+        return ticket
+
+    def _remove(self, ticket):
+        for idx, entry in enumerate(self._queue):
+            if entry[2] is ticket:
+                self._queue.pop(idx)
+                heapq.heapify(self._queue)
+                self._queued_cost -= ticket.cost
+                return
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        self._active += 1
+        self._active_cost += ticket.cost
+        self.stats["admitted"] += 1
+        if ticket.priority == PRIORITY_THREAT:
+            self.stats["priority_admitted"] += 1
+
+    def _dispatch(self):
+        while self._queue and self._active < self.max_concurrency:
+            _, _, ticket = heapq.heappop(self._queue)
+            self._queued_cost -= ticket.cost
+            self._grant(ticket)
+        self._cond.notify_all()
+
+    # -------------------------------------------------
+    # METRICS
+    # -------------------------------------------------
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                "active": self._active,
+                "max_concurrency": self.max_concurrency,
+                "queued": len(self._queue),
+                "max_queue": self.max_queue,
+                "service_time_ms": round(self._unit_service_time * 1000, 2),
+                "projected_wait_ms": round(self._projected_wait(self._queued_cost) * 1000, 2),
+                "priority_cameras": sum(1 for exp in self._hot_cameras.values()
+                                        if exp >= time.monotonic()),
+                **self.stats,
+            }
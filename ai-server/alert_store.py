@@ -0,0 +1,654 @@
+"""
+Alert Store Module - Append-only local archive for incidents and evidence
+
+Incidents are queued from the capture path and written by a background
+thread into size-rotated segment files under ``Config.ALERT_DIR``. Every
+record gets a fixed-size entry in ``index.bin`` (timestamp, segment,
+offset, camera and type keys) so range queries only touch the records
+they return. Records that could not be delivered are flagged as pending
+and can later be forwarded to the backend in bulk (drain mode).
+
+The CLI opens the archive read-only (no recovery, no writer), so it is
+safe to run next to a live detector; drains in any process are serialized
+by a lock file, so the shared cursor never sends a batch twice.
+
+Usage:
+    python alert_store.py query --camera cam01 --since 1700000000
+    python alert_store.py drain
+"""
+
+import os
+import json
+import mmap
+import time
+import base64
+import queue
+import struct
+import zlib
+import argparse
+import threading
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: drains are only serialized within one process
+
+import numpy as np
+import requests
+
+from config import Config
+
+
+RECORD_MAGIC = 0x414C5254  # "ALRT"
+RECORD_HEADER = struct.Struct("<IIII")  # magic, meta_len, blob_len, crc32
+INDEX_ENTRY = struct.Struct("<dQIIIII")  # ts, offset, segment, length, camera_key, type_key, flags
+INDEX_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("offset", "<u8"),
+    ("segment", "<u4"),
+    ("length", "<u4"),
+    ("camera_key", "<u4"),
+    ("type_key", "<u4"),
+    ("flags", "<u4"),
+])
+
+FLAG_PENDING = 0x1
+
+SEGMENT_PREFIX = "seg-"
+SEGMENT_SUFFIX = ".log"
+INDEX_FILE = "index.bin"
+CURSOR_FILE = "drain.cursor"
+DRAIN_LOCK_FILE = "drain.lock"
+REJECTED_FILE = "drain.rejected"  # JSON lines: incidents the backend refused
+
+
+def _key(value) -> int:
+    """Compact 32-bit key used in the index for camera ids and crime types"""
+    return zlib.crc32(str(value).encode("utf-8"))
+
+
+class AlertRecord:
+    """A single archived incident: metadata plus optional evidence bytes"""
+
+    __slots__ = ("position", "timestamp", "meta", "blob", "pending")
+
+    def __init__(self, position, timestamp, meta, blob, pending):
+        self.position = position
+        self.timestamp = timestamp
+        self.meta = meta
+        self.blob = blob
+        self.pending = pending
+
+    def to_payload(self) -> Dict:
+        """Rebuild the backend incident payload for this record"""
+        payload = dict(self.meta)
+        if self.blob:
+            encoded = base64.b64encode(self.blob).decode("utf-8")
+            payload["imageBase64"] = f"data:image/jpeg;base64,{encoded}"
+        return payload
+
+
+class AlertStore:
+    """
+    Append-only, segment-rotated incident archive with a timestamp index.
+
+    ``append`` never touches the disk itself: records are handed to a
+    writer thread which batches writes and fsyncs at most once every
+    ``fsync_interval`` seconds.
+
+    ``read_only=True`` opens an archive another process may be writing:
+    no recovery, no writer thread, and the segments and index are never
+    modified (``drain`` still updates its own cursor files).
+    """
+
+    def __init__(self, directory=None, segment_max_bytes=None,
+                 fsync_interval=None, queue_size=1000, read_only=False):
+        self.directory = directory or Config.ALERT_DIR
+        self.segment_max_bytes = segment_max_bytes or Config.ALERT_SEGMENT_MAX_BYTES
+        self.fsync_interval = (Config.ALERT_FSYNC_INTERVAL
+                               if fsync_interval is None else fsync_interval)
+
+        self.read_only = read_only
+        if not read_only:
+            os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, INDEX_FILE)
+        self.cursor_path = os.path.join(self.directory, CURSOR_FILE)
+        self.rejected_path = os.path.join(self.directory, REJECTED_FILE)
+        self.drain_lock_path = os.path.join(self.directory, DRAIN_LOCK_FILE)
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._io_lock = threading.Lock()
+        self._maps = {}  # segment -> (mmap, mapped_length)
+        self._ts_order = (0, True)  # (index entries checked, timestamps non-decreasing)
+        self._drain_thread = None
+        self._stop_drain = threading.Event()
+        self._writer = None
+        if read_only:
+            return
+
+        self._segment, self._segment_size = self._recover()
+        self._segment_fd = self._open_segment(self._segment)
+        self._index_fd = os.open(self.index_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._last_fsync = time.time()
+        self._dirty = False
+
+        self._writer = threading.Thread(target=self._writer_loop, name="alert-store-writer",
+                                        daemon=True)
+        self._writer.start()
+
+    # -------------------------------------------------
+    # WRITE PATH
+    # -------------------------------------------------
+    def append(self, meta: Dict, blob: bytes = b"", timestamp: float = None,
+               pending: bool = False) -> bool:
+        """
+        Queue an incident for archiving without blocking on disk I/O.
+
+        Args:
+            meta: JSON-serialisable incident fields (type, cameraId, ...)
+            blob: Evidence bytes (usually a JPEG), stored verbatim
+            timestamp: Incident time (defaults to now)
+            pending: True when the incident still needs to reach the backend
+
+        Returns:
+            False if the writer queue stayed full and the record was dropped
+        """
+        if self.read_only:
+            raise RuntimeError("Alert store was opened read-only")
+        ts = time.time() if timestamp is None else float(timestamp)
+        # The index fields travel inside the record so recovery can rebuild it
+        stored = dict(meta, _ts=ts, _pending=pending)
+        try:
+            self._queue.put((ts, stored, bytes(blob or b""), pending), timeout=1.0)
+            return True
+        except queue.Full:
+            print("⚠️ Alert store queue full - incident dropped")
+            return False
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Block until every queued record is written and fsynced"""
+        if self._writer is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """Stop background threads and release file handles"""
+        self.stop_drain()
+        if self._writer is None:
+            with self._io_lock:
+                self._maps.clear()
+            return
+        self.flush()
+        self._queue.put(None)
+        self._writer.join(timeout=5.0)
+        with self._io_lock:
+            for mapped, _ in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+        os.close(self._segment_fd)
+        os.close(self._index_fd)
+
+    def _writer_loop(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=self.fsync_interval or None)
+            except queue.Empty:
+                self._maybe_fsync(force=True)
+                continue
+
+            batch = [item]
+            while len(batch) < 256:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            waiters = []
+            records = []
+            for entry in batch:
+                if entry is None:
+                    stop = True
+                elif isinstance(entry, threading.Event):
+                    waiters.append(entry)
+                else:
+                    records.append(entry)
+
+            if records:
+                try:
+                    self._write_records(records)
+                except OSError as e:
+                    print(f"❌ Alert store write failed: {e}")
+
+            self._maybe_fsync(force=bool(waiters) or stop)
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
+
+    def _write_records(self, records):
+        data = bytearray()
+        index = bytearray()
+        for ts, meta, blob, pending in records:
+            meta_bytes = json.dumps(meta, separators=(",", ":"), default=str).encode("utf-8")
+            crc = zlib.crc32(blob, zlib.crc32(meta_bytes))
+            record = RECORD_HEADER.pack(RECORD_MAGIC, len(meta_bytes), len(blob), crc) \
+                + meta_bytes + blob
+
+            if self._segment_size + len(data) + len(record) > self.segment_max_bytes \
+                    and (self._segment_size or data):
+                self._flush_segment(data, index)
+                data, index = bytearray(), bytearray()
+                self._rotate()
+
+            offset = self._segment_size + len(data)
+            data += record
+            index += INDEX_ENTRY.pack(
+                ts, offset, self._segment, len(record),
+                _key(meta.get("cameraId", "")), _key(meta.get("type", "")),
+                FLAG_PENDING if pending else 0,
+            )
+
+        self._flush_segment(data, index)
+
+    def _flush_segment(self, data, index):
+        if not data:
+            return
+        # Data first, index second: an index entry never points at bytes
+        # that are not on disk yet.
+        os.write(self._segment_fd, data)
+        self._segment_size += len(data)
+        os.write(self._index_fd, index)
+        self._dirty = True
+
+    def _maybe_fsync(self, force=False):
+        if not self._dirty:
+            return
+        now = time.time()
+        if force or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self._segment_fd)
+            os.fsync(self._index_fd)
+            self._last_fsync = now
+            self._dirty = False
+
+    def _rotate(self):
+        os.fsync(self._segment_fd)
+        os.close(self._segment_fd)
+        self._segment += 1
+        self._segment_size = 0
+        self._segment_fd = self._open_segment(self._segment)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{segment:06d}{SEGMENT_SUFFIX}")
+
+    def _open_segment(self, segment):
+        return os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+
+    # -------------------------------------------------
+    # RECOVERY
+    # -------------------------------------------------
+    def _recover(self):
+        """
+        Bring index and active segment back in sync after an unclean stop.
+
+        Drops index entries that point past the end of their segment,
+        re-indexes valid records written after the last index entry and
+        truncates a torn record at the tail of the active segment.
+        """
+        segments = sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+        if not segments:
+            open(self.index_path, "ab").close()
+            return 1, 0
+
+        active = segments[-1]
+        active_path = self._segment_path(active)
+        active_size = os.path.getsize(active_path)
+
+        index = self._load_index()
+        valid = len(index)
+        while valid > 0:
+            last = index[valid - 1]
+            seg_size = active_size if last["segment"] == active else \
+                os.path.getsize(self._segment_path(int(last["segment"])))
+            if int(last["offset"]) + int(last["length"]) <= seg_size:
+                break
+            valid -= 1
+        if valid != len(index):
+            with open(self.index_path, "r+b") as f:
+                f.truncate(valid * INDEX_ENTRY.size)
+
+        scan_from = 0
+        if valid and index[valid - 1]["segment"] == active:
+            scan_from = int(index[valid - 1]["offset"]) + int(index[valid - 1]["length"])
+        del index
+
+        recovered = bytearray()
+        end = scan_from
+        with open(active_path, "rb") as f:
+            f.seek(scan_from)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                magic, meta_len, blob_len, crc = RECORD_HEADER.unpack(header)
+                if magic != RECORD_MAGIC:
+                    break
+                meta_bytes = f.read(meta_len)
+                blob = f.read(blob_len)
+                if len(meta_bytes) < meta_len or len(blob) < blob_len or \
+                        zlib.crc32(blob, zlib.crc32(meta_bytes)) != crc:
+                    break
+                meta = json.loads(meta_bytes)
+                length = RECORD_HEADER.size + meta_len + blob_len
+                recovered += INDEX_ENTRY.pack(
+                    float(meta.get("_ts", time.time())), end, active, length,
+                    _key(meta.get("cameraId", "")), _key(meta.get("type", "")),
+                    FLAG_PENDING if meta.get("_pending") else 0,
+                )
+                end += length
+
+        if end != active_size:
+            with open(active_path, "r+b") as f:
+                f.truncate(end)
+            print(f"⚠️ Alert store truncated torn record in segment {active}")
+        if recovered:
+            with open(self.index_path, "ab") as f:
+                f.write(recovered)
+            print(f"♻️ Alert store re-indexed {len(recovered) // INDEX_ENTRY.size} record(s)")
+
+        return active, end
+
+    # -------------------------------------------------
+    # READ PATH
+    # -------------------------------------------------
+    def _load_index(self):
+        """Memory-map the index as a structured array (empty if no entries)"""
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        count = size // INDEX_ENTRY.size
+        if count == 0:
+            return np.zeros(0, dtype=INDEX_DTYPE)
+        return np.memmap(self.index_path, dtype=INDEX_DTYPE, mode="r", shape=(count,))
+
+    def _segment_view(self, segment, end):
+        """Return an mmap covering at least ``end`` bytes of a segment"""
+        with self._io_lock:
+            cached = self._maps.get(segment)
+            if cached is not None and cached[1] >= end:
+                return cached[0]
+            # A smaller map may still be in use by another reader after the
+            # lock was released; dropping the reference lets GC close it
+            with open(self._segment_path(segment), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = (mapped, len(mapped))
+            return mapped
+
+    def _read(self, position, entry) -> AlertRecord:
+        offset, length = int(entry["offset"]), int(entry["length"])
+        view = self._segment_view(int(entry["segment"]), offset + length)
+        _, meta_len, blob_len, _ = RECORD_HEADER.unpack_from(view, offset)
+        start = offset + RECORD_HEADER.size
+        meta = json.loads(view[start:start + meta_len])
+        blob = view[start + meta_len:start + meta_len + blob_len]
+        for private in ("_ts", "_pending"):
+            meta.pop(private, None)
+        return AlertRecord(position, float(entry["ts"]), meta, blob,
+                           bool(int(entry["flags"]) & FLAG_PENDING))
+
+    def query(self, since: float = None, until: float = None, camera_id: str = None,
+              crime_type: str = None, pending_only: bool = False,
+              start_position: int = 0, limit: int = None) -> Iterator[AlertRecord]:
+        """
+        Iterate archived incidents matching the given filters.
+
+        The time range is resolved with a binary search on the index while
+        its timestamps are in order (appends with an explicit, older
+        ``timestamp`` break that, and then the range is a mask). Camera/type
+        filters are applied on the index keys before any segment bytes are
+        touched.
+        """
+        index = self._load_index()
+        if len(index) == 0:
+            return
+
+        ts = index["ts"]
+        if self._index_sorted(ts):
+            lo = max(start_position, int(np.searchsorted(ts, since, "left")) if since is not None else 0)
+            hi = int(np.searchsorted(ts, until, "right")) if until is not None else len(index)
+            if lo >= hi:
+                return
+            window = index[lo:hi]
+            mask = np.ones(len(window), dtype=bool)
+        else:
+            lo = start_position
+            window = index[lo:]
+            mask = np.ones(len(window), dtype=bool)
+            if since is not None:
+                mask &= window["ts"] >= since
+            if until is not None:
+                mask &= window["ts"] <= until
+        if camera_id is not None:
+            mask &= window["camera_key"] == _key(camera_id)
+        if crime_type is not None:
+            mask &= window["type_key"] == _key(crime_type)
+        if pending_only:
+            mask &= (window["flags"] & FLAG_PENDING) != 0
+
+        emitted = 0
+        for rel in np.flatnonzero(mask):
+            record = self._read(lo + int(rel), window[rel])
+            # Keys are hashes; confirm against the stored metadata
+            if camera_id is not None and record.meta.get("cameraId") != camera_id:
+                continue
+            if crime_type is not None and record.meta.get("type") != crime_type:
+                continue
+            yield record
+            emitted += 1
+            if limit is not None and emitted >= limit:
+                return
+
+    def _index_sorted(self, ts) -> bool:
+        """Whether index timestamps are non-decreasing; only new entries are checked"""
+        checked, ordered = self._ts_order
+        if ordered and len(ts) > checked:
+            ordered = bool(np.all(np.diff(ts[max(checked - 1, 0):]) >= 0))
+        self._ts_order = (len(ts), ordered)
+        return ordered
+
+    def count(self) -> int:
+        return len(self._load_index())
+
+    # -------------------------------------------------
+    # DRAIN MODE
+    # -------------------------------------------------
+    def _read_cursor(self) -> int:
+        try:
+            with open(self.cursor_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _write_cursor(self, position: int) -> None:
+        tmp = self.cursor_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(str(position))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.cursor_path)
+
+    def _record_rejected(self, batch: List[AlertRecord], indexes) -> int:
+        """Log batch entries the backend refused and keep their positions"""
+        rejected = [batch[i] for i in indexes if isinstance(i, int) and 0 <= i < len(batch)]
+        if not rejected:
+            return 0
+        with open(self.rejected_path, "a") as f:
+            for record in rejected:
+                print(f"⚠️ Backend rejected archived incident #{record.position} "
+                      f"({record.meta.get('type')} @ {record.meta.get('cameraId')})")
+                f.write(json.dumps({"position": record.position, "timestamp": record.timestamp,
+                                    "cameraId": record.meta.get("cameraId"),
+                                    "type": record.meta.get("type"),
+                                    "rejected_at": time.time()}) + "\n")
+        return len(rejected)
+
+    def _lock_drain(self):
+        """Exclusive, non-blocking drain lock file, or None while another drain runs"""
+        lock = open(self.drain_lock_path, "a")
+        if fcntl is None:
+            return lock
+        try:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return None
+        return lock
+
+    def pending_count(self) -> int:
+        index = self._load_index()
+        cursor = self._read_cursor()
+        if cursor >= len(index):
+            return 0
+        return int(np.count_nonzero(index["flags"][cursor:] & FLAG_PENDING))
+
+    def drain(self, url: str = None, batch_size: int = None, timeout: float = 10.0) -> int:
+        """
+        Forward pending incidents to the backend bulk endpoint.
+
+        Progress is tracked by an index cursor that only advances after the
+        backend accepted a batch, so a failed drain resumes where it stopped.
+        Incidents the backend rejects as invalid are logged and listed in
+        ``drain.rejected`` (archive positions) rather than silently skipped.
+        Only one drain runs at a time across processes; a drain that finds
+        another one running returns at once.
+
+        Returns:
+            Number of incidents forwarded
+        """
+        lock = self._lock_drain()
+        if lock is None:
+            print("⏳ Another drain is already running")
+            return 0
+        try:
+            return self._drain_locked(url, batch_size, timeout)
+        finally:
+            lock.close()  # releases the flock
+
+    def _drain_locked(self, url, batch_size, timeout) -> int:
+        url = url or Config.BACKEND_BULK_URL
+        batch_size = batch_size or Config.ALERT_DRAIN_BATCH
+        cursor = self._read_cursor()
+        total = self.count()
+        sent = 0
+
+        while cursor < total:
+            batch = list(self.query(pending_only=True, start_position=cursor, limit=batch_size))
+            if not batch:
+                self._write_cursor(total)
+                break
+
+            response = requests.post(
+                url, json={"incidents": [r.to_payload() for r in batch]}, timeout=timeout
+            )
+            try:
+                body = response.json()
+            except ValueError:
+                body = {}
+            if not response.ok:
+                # The backend works in order and reports how far it got
+                processed = int(body.get("processed", body.get("saved", 0)) or 0)
+                refused = self._record_rejected(batch[:processed], body.get("rejected") or [])
+                if processed:
+                    self._write_cursor(batch[processed - 1].position + 1)
+                    sent += processed - refused
+                response.raise_for_status()
+            refused = self._record_rejected(batch, body.get("rejected") or [])
+
+            cursor = batch[-1].position + 1
+            self._write_cursor(cursor)
+            sent += len(batch) - refused
+
+        if sent:
+            print(f"📤 Drained {sent} archived incident(s) to backend")
+        return sent
+
+    def start_drain(self, url: str = None, interval: float = None) -> None:
+        """Periodically drain pending incidents in a background thread"""
+        if self._drain_thread is not None:
+            return
+        interval = Config.ALERT_DRAIN_INTERVAL if interval is None else interval
+        self._stop_drain.clear()
+
+        def loop():
+            while not self._stop_drain.wait(interval):
+                if self.pending_count() == 0:
+                    continue
+                try:
+                    self.drain(url)
+                except requests.RequestException:
+                    pass  # Backend still unreachable - retry next interval
+
+        self._drain_thread = threading.Thread(target=loop, name="alert-store-drain", daemon=True)
+        self._drain_thread.start()
+
+    def stop_drain(self) -> None:
+        if self._drain_thread is None:
+            return
+        self._stop_drain.set()
+        self._drain_thread.join(timeout=5.0)
+        self._drain_thread = None
+
+
+# --------------------------------------------------
+# CLI
+# --------------------------------------------------
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Inspect or drain the local alert archive")
+    parser.add_argument("--dir", default=Config.ALERT_DIR, help="Alert directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    q = sub.add_parser("query", help="List archived incidents")
+    q.add_argument("--since", type=float)
+    q.add_argument("--until", type=float)
+    q.add_argument("--camera")
+    q.add_argument("--type")
+    q.add_argument("--pending", action="store_true")
+    q.add_argument("--limit", type=int)
+
+    d = sub.add_parser("drain", help="Forward pending incidents to the backend")
+    d.add_argument("--url", default=Config.BACKEND_BULK_URL)
+
+    args = parser.parse_args(argv)
+    # Read-only: the detector may be writing this archive right now
+    store = AlertStore(args.dir, read_only=True)
+    try:
+        if args.command == "query":
+            for record in store.query(args.since, args.until, args.camera, args.type,
+                                      pending_only=args.pending, limit=args.limit):
+                print(json.dumps({
+                    "position": record.position,
+                    "timestamp": record.timestamp,
+                    "pending": record.pending,
+                    "evidence_bytes": len(record.blob),
+                    **record.meta,
+                }))
+        else:
+            try:
+                store.drain(args.url)
+            except requests.RequestException as e:
+                print(f"❌ Backend not reachable: {e}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
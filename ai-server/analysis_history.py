@@ -0,0 +1,333 @@
+"""
+Analysis History Module - Per-camera record ring with incremental rollups
+
+Every analysis is stored as one fixed-size numpy record in a per-camera ring
+of MAX_ANALYSIS_HISTORY entries:
+
+    ts        epoch seconds
+    score     threat score (0-100)
+    level     threat level code (LOW=0 .. CRITICAL=3)
+    crime     crime_detected flag
+    persons   persons detected
+    signals   64-bit mask, one bit per signal name
+
+The same call folds the record into per-minute and per-hour rollup rings
+(HISTORY_MINUTE_BUCKETS / HISTORY_HOUR_BUCKETS). A bucket is addressed by
+``(ts // resolution) % buckets`` and reset when a newer period reuses its
+slot, so updates are O(1). A stats query reads only the buckets its window
+covers, not the raw records.
+
+Cameras are created for whatever camera id a client sends, so a camera
+idle for longer than the hour rollups reach back is dropped, and at most
+HISTORY_MAX_CAMERAS are kept (least recently seen go first).
+
+Usage:
+    history = AnalysisHistory()
+    history.record("cam01", detection)
+    history.records("cam01", since=time.time() - 300)
+    history.stats(camera_id=None, window=3600)
+"""
+
+import math
+import time
+import threading
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+
+from config import Config
+
+
+THREAT_LEVELS = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+LEVEL_CODES = {name: code for code, name in enumerate(THREAT_LEVELS)}
+
+SIGNAL_BITS = 64
+OTHER_SIGNAL = "OTHER"  # last bit, shared by names seen after the mask is full
+
+RECORD_DTYPE = np.dtype([
+    ("ts", np.float64),
+    ("score", np.float32),
+    ("level", np.uint8),
+    ("crime", np.bool_),
+    ("persons", np.uint16),
+    ("signals", np.uint64),
+])
+
+BUCKET_DTYPE = np.dtype([
+    ("period", np.int64),          # ts // resolution, -1 = empty
+    ("count", np.uint32),
+    ("crimes", np.uint32),
+    ("score_sum", np.float64),
+    ("score_max", np.float32),
+    ("persons_sum", np.uint32),
+    ("persons_max", np.uint16),
+    ("levels", np.uint32, (len(THREAT_LEVELS),)),
+    ("signals", np.uint32, (SIGNAL_BITS,)),
+])
+
+RESOLUTIONS = {"minute": 60, "hour": 3600}
+
+
+class SignalRegistry:
+    """Stable signal-name <-> bit assignment for this process"""
+
+    def __init__(self):
+        self._bits: Dict[str, int] = {}
+        self._names: List[str] = []
+        self._lock = threading.Lock()
+
+    def mask(self, signals) -> int:
+        mask = 0
+        for name in signals:
+            bit = self._bits.get(name)
+            if bit is None:
+                bit = self._assign(name)
+            mask |= 1 << bit
+        return mask
+
+    def _assign(self, name) -> int:
+        with self._lock:
+            if name in self._bits:
+                return self._bits[name]
+            if len(self._names) >= SIGNAL_BITS - 1:
+                return SIGNAL_BITS - 1
+            self._bits[name] = len(self._names)
+            self._names.append(name)
+            return self._bits[name]
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def name(self, bit) -> str:
+        return self._names[bit] if bit < len(self._names) else OTHER_SIGNAL
+
+    def names(self, mask) -> List[str]:
+        mask = int(mask)
+        return [self.name(bit) for bit in range(SIGNAL_BITS) if mask >> bit & 1]
+
+
+class _RollupRing:
+    """Fixed ring of aggregate buckets at one resolution"""
+
+    def __init__(self, resolution, buckets):
+        self.resolution = resolution
+        self.buckets = np.zeros(buckets, dtype=BUCKET_DTYPE)
+        self.buckets["period"] = -1
+
+    def add(self, ts, score, level, crime, persons, mask) -> None:
+        period = int(ts // self.resolution)
+        slot = period % len(self.buckets)
+        b = self.buckets
+        if b["period"][slot] != period:
+            if b["period"][slot] > period:
+                return  # Older than the ring covers
+            b[slot] = np.zeros((), dtype=BUCKET_DTYPE)
+            b["period"][slot] = period
+        b["count"][slot] += 1
+        b["crimes"][slot] += crime
+        b["score_sum"][slot] += score
+        b["score_max"][slot] = max(b["score_max"][slot], score)
+        b["persons_sum"][slot] += persons
+        b["persons_max"][slot] = max(b["persons_max"][slot], persons)
+        b["levels"][slot, level] += 1
+        while mask:
+            low = mask & -mask
+            b["signals"][slot, low.bit_length() - 1] += 1
+            mask ^= low
+
+    def window(self, start, end) -> np.ndarray:
+        """Buckets for periods covering [start, end], oldest first (O(periods))"""
+        first = max(int(start // self.resolution), int(end // self.resolution) - len(self.buckets) + 1)
+        periods = np.arange(first, int(end // self.resolution) + 1)
+        selected = self.buckets[periods % len(self.buckets)]
+        return selected[selected["period"] == periods]
+
+
+class _CameraHistory:
+    __slots__ = ("records", "written", "minutes", "hours", "last_seen")
+
+    def __init__(self, size, minute_buckets, hour_buckets):
+        self.records = np.zeros(size, dtype=RECORD_DTYPE)
+        self.written = 0
+        self.last_seen = 0.0
+        self.minutes = _RollupRing(RESOLUTIONS["minute"], minute_buckets)
+        self.hours = _RollupRing(RESOLUTIONS["hour"], hour_buckets)
+
+    def ordered(self) -> np.ndarray:
+        """Stored records, oldest first"""
+        size = len(self.records)
+        if self.written <= size:
+            return self.records[:self.written]
+        split = self.written % size
+        return np.concatenate([self.records[split:], self.records[:split]])
+
+
+class AnalysisHistory:
+    """Per-camera analysis records plus minute/hour rollups"""
+
+    def __init__(self, size=None, minute_buckets=None, hour_buckets=None, max_cameras=None):
+        self.size = size or Config.MAX_ANALYSIS_HISTORY
+        self.minute_buckets = minute_buckets or Config.HISTORY_MINUTE_BUCKETS
+        self.hour_buckets = hour_buckets or Config.HISTORY_HOUR_BUCKETS
+        self.max_cameras = max_cameras or Config.HISTORY_MAX_CAMERAS
+        # Past this nothing of an idle camera is left in any rollup window
+        self.idle_horizon = self.hour_buckets * RESOLUTIONS["hour"]
+        self.registry = SignalRegistry()
+        self._lock = threading.Lock()
+        self._cameras: Dict[str, _CameraHistory] = {}
+        self._next_prune = 0.0
+        self.evicted = 0
+
+    # -------------------------------------------------
+    # WRITE
+    # -------------------------------------------------
+    def record(self, camera_id, detection: Dict, now: float = None) -> None:
+        """Store one API detection payload (see image_detector.format_detection)"""
+        now = time.time() if now is None else now
+        score = float(detection.get("threat_score", 0) or 0)
+        level = LEVEL_CODES.get(str(detection.get("threat_level", "LOW")).upper(), 0)
+        crime = bool(detection.get("crime_detected"))
+        persons = min(int(detection.get("persons_detected", 0) or 0), 65535)
+        mask = self.registry.mask(detection.get("signals") or ())
+
+        with self._lock:
+            if now >= self._next_prune:
+                self._prune(now - self.idle_horizon)
+                self._next_prune = now + RESOLUTIONS["minute"]
+            camera = self._cameras.get(camera_id)
+            if camera is None:
+                if len(self._cameras) >= self.max_cameras:
+                    oldest = min(self._cameras, key=lambda c: self._cameras[c].last_seen)
+                    del self._cameras[oldest]
+                    self.evicted += 1
+                camera = self._cameras[camera_id] = _CameraHistory(
+                    self.size, self.minute_buckets, self.hour_buckets)
+            camera.last_seen = max(camera.last_seen, now)
+            camera.records[camera.written % self.size] = (now, score, level, crime, persons, mask)
+            camera.written += 1
+            camera.minutes.add(now, score, level, crime, persons, mask)
+            camera.hours.add(now, score, level, crime, persons, mask)
+
+    def _prune(self, cutoff) -> None:
+        """Drop cameras last seen before ``cutoff`` (caller holds the lock)"""
+        for camera_id in [c for c, h in self._cameras.items() if h.last_seen < cutoff]:
+            del self._cameras[camera_id]
+            self.evicted += 1
+
+    # -------------------------------------------------
+    # QUERIES
+    # -------------------------------------------------
+    def cameras(self) -> List[str]:
+        with self._lock:
+            return sorted(self._cameras, key=str)
+
+    def records(self, camera_id, since: float = None, until: float = None,
+                limit: int = None) -> List[Dict]:
+        """Raw records in [since, until], newest last; ``limit`` keeps the newest"""
+        with self._lock:
+            camera = self._cameras.get(camera_id)
+            if camera is None:
+                return []
+            rows = camera.ordered().copy()
+
+        keep = np.ones(len(rows), dtype=bool)
+        if since is not None:
+            keep &= rows["ts"] >= since
+        if until is not None:
+            keep &= rows["ts"] <= until
+        rows = rows[keep]
+        if limit:
+            rows = rows[-limit:]
+
+        return [{
+            "timestamp": datetime.fromtimestamp(float(r["ts"])).isoformat(),
+            "threat_score": round(float(r["score"]), 2),
+            "threat_level": THREAT_LEVELS[int(r["level"])],
+            "crime_detected": bool(r["crime"]),
+            "persons_detected": int(r["persons"]),
+            "signals": self.registry.names(r["signals"]),
+        } for r in rows]
+
+    def stats(self, camera_id=None, window: float = 3600.0, resolution: str = None,
+              now: float = None) -> Dict:
+        """
+        Aggregates over the last ``window`` seconds from the rollups.
+
+        Args:
+            camera_id: One camera, or None for all of them
+            resolution: "minute" or "hour"; default picks minute while the
+                        window fits in the minute ring
+        """
+        now = time.time() if now is None else now
+        if resolution is None:
+            resolution = "minute" if window <= self.minute_buckets * 60 else "hour"
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {sorted(RESOLUTIONS)}")
+        start = now - window
+
+        with self._lock:
+            if camera_id is None:
+                cameras = list(self._cameras.values())
+            else:
+                cameras = [self._cameras[camera_id]] if camera_id in self._cameras else []
+            parts = [(c.minutes if resolution == "minute" else c.hours).window(start, now)
+                     for c in cameras]
+
+        buckets = np.concatenate(parts) if parts else np.zeros(0, dtype=BUCKET_DTYPE)
+        series = self._series(buckets, RESOLUTIONS[resolution])
+        count = int(buckets["count"].sum())
+        signal_counts = buckets["signals"].sum(axis=0) if count else np.zeros(SIGNAL_BITS)
+        top = np.argsort(-signal_counts, kind="stable")
+
+        return {
+            "camera_id": camera_id,
+            "window_seconds": window,
+            "resolution": resolution,
+            "analyses": count,
+            "crimes": int(buckets["crimes"].sum()),
+            "avg_threat_score": round(float(buckets["score_sum"].sum()) / count, 2) if count else 0.0,
+            "max_threat_score": round(float(buckets["score_max"].max()), 2) if count else 0.0,
+            "avg_persons": round(int(buckets["persons_sum"].sum()) / count, 2) if count else 0.0,
+            "max_persons": int(buckets["persons_max"].max()) if count else 0,
+            "levels": dict(zip(THREAT_LEVELS, buckets["levels"].sum(axis=0).astype(int).tolist())),
+            "signals": {self.registry.name(int(bit)): int(signal_counts[bit])
+                        for bit in top if signal_counts[bit] > 0},
+            "series": series,
+        }
+
+    @staticmethod
+    def _series(buckets, resolution) -> List[Dict]:
+        """One point per period with data (cameras merged), oldest first"""
+        if len(buckets) == 0:
+            return []
+        periods, inverse = np.unique(buckets["period"], return_inverse=True)
+        n = len(periods)
+        count = np.bincount(inverse, weights=buckets["count"], minlength=n)
+        crimes = np.bincount(inverse, weights=buckets["crimes"], minlength=n)
+        score_sum = np.bincount(inverse, weights=buckets["score_sum"], minlength=n)
+        score_max = np.full(n, -math.inf)
+        np.maximum.at(score_max, inverse, buckets["score_max"])
+        levels = np.zeros((n, len(THREAT_LEVELS)), dtype=np.int64)
+        np.add.at(levels, inverse, buckets["levels"])
+
+        return [{
+            "start": datetime.fromtimestamp(int(p) * resolution).isoformat(),
+            "analyses": int(count[i]),
+            "crimes": int(crimes[i]),
+            "avg_threat_score": round(score_sum[i] / count[i], 2) if count[i] else 0.0,
+            "max_threat_score": round(float(score_max[i]), 2),
+            "levels": dict(zip(THREAT_LEVELS, levels[i].tolist())),
+        } for i, p in enumerate(periods)]
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            cameras = list(self._cameras.values())
+            return {
+                "cameras": len(cameras),
+                "cameras_evicted": self.evicted,
+                "records": sum(min(c.written, self.size) for c in cameras),
+                "signal_names": len(self.registry),
+                "memory_kb": round(sum(c.records.nbytes + c.minutes.buckets.nbytes
+                                       + c.hours.buckets.nbytes for c in cameras) / 1024, 1),
+            }
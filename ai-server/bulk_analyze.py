@@ -0,0 +1,552 @@
+"""
+Bulk Analyze Module - Offline batch analysis of archived footage
+
+Runs PoseCrimeDetector over image dumps and video archives without the HTTP
+server:
+
+    python bulk_analyze.py /archive/site1 "/dumps/**/*.jpg" lobby.mp4 -o results.csv
+    python bulk_analyze.py /archive -o results.parquet --fps 2 --workers 12
+
+Inputs are directories (walked recursively), glob patterns or files. Images
+in one directory count as one camera, in name order. Each video is one
+camera, sampled at --fps.
+
+Pipeline:
+    decode    process pool (--workers); each task decodes one chunk of
+              BULK_CHUNK_FRAMES frames (a slice of a video, or a run of
+              images) and returns them resized to BULK_MAX_DIM
+    infer     main process; infer_batch() over BULK_BATCH_SIZE frames, then
+              the rule layer frame by frame, in input order so temporal
+              rules see each camera's frames in sequence
+    write     one row per frame to CSV, or to Parquet part files when the
+              output ends in .parquet (needs pyarrow)
+
+Chunks are decoded ahead of inference but consumed in order. So progress is
+a single position (source group, chunk). Every BULK_CHECKPOINT_INTERVAL
+seconds the output is flushed and the position saved to
+<output>.checkpoint.json. An interrupted run resumes from there when started
+again with the same arguments. Rows written after the last checkpoint are
+discarded first. Temporal history restarts at the resumed chunk.
+
+A summary (throughput, threat levels, crime types, cameras with the most
+crime frames) is printed and written to <output>.summary.json.
+"""
+
+import os
+import csv
+import glob
+import json
+import math
+import time
+import signal
+import hashlib
+import argparse
+import multiprocessing
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import cv2
+
+from config import Config
+
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".tiff"}  # as image_detector.py
+VIDEO_EXTENSIONS = {".mp4", ".avi", ".mkv", ".mov", ".m4v", ".webm", ".mpg", ".mpeg", ".ts"}
+
+COLUMNS = ("source", "camera_id", "frame", "position_s", "crime_detected", "crime_type",
+           "threat_level", "threat_score", "confidence", "persons_detected", "activities",
+           "signals")
+
+THREAT_LEVELS = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+
+
+# -------------------------------------------------
+# INPUT PLAN
+# -------------------------------------------------
+class Group(NamedTuple):
+    """A video, or the images of one directory; one camera either way"""
+    kind: str          # "video" | "images"
+    camera_id: str
+    paths: Tuple[str, ...]
+
+
+class Chunk(NamedTuple):
+    group: int
+    index: int
+    kind: str
+    camera_id: str
+    paths: Tuple[str, ...]  # images: the files; video: (path,)
+    start: int              # video: first source frame
+    step: int               # video: source frames per sample
+    count: int              # frames in this chunk
+    fps: float              # video: source frame rate
+
+
+def collect_files(inputs: List[str]) -> List[str]:
+    """Expand directories and globs into image/video files, without duplicates"""
+    files, seen = [], set()
+
+    def add(path):
+        path = os.path.abspath(path)
+        ext = os.path.splitext(path)[1].lower()
+        if path not in seen and (ext in IMAGE_EXTENSIONS or ext in VIDEO_EXTENSIONS):
+            seen.add(path)
+            files.append(path)
+
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, dirs, names in os.walk(item):
+                dirs.sort()
+                for name in sorted(names):
+                    add(os.path.join(root, name))
+        elif glob.has_magic(item):
+            for path in sorted(glob.glob(item, recursive=True)):
+                if os.path.isfile(path):
+                    add(path)
+        elif os.path.isfile(item):
+            add(item)
+        else:
+            print(f"⚠️ Skipping missing input: {item}")
+    return files
+
+
+def build_groups(files: List[str]) -> List[Group]:
+    """Videos stay single; consecutive images of one directory are grouped"""
+    groups: List[Group] = []
+    run_dir, run = None, []
+    for path in files + [None]:
+        is_image = path is not None and os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS
+        directory = os.path.dirname(path) if is_image else None
+        if run and (not is_image or directory != run_dir):
+            groups.append(Group("images", run_dir, tuple(run)))
+            run = []
+        if path is None:
+            break
+        if is_image:
+            run_dir = directory
+            run.append(path)
+        else:
+            groups.append(Group("video", path, (path,)))
+    return groups
+
+
+def video_info(path: str, sample_fps: float) -> Tuple[int, int, float]:
+    """(source frames, step between samples, source fps) of a video"""
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total <= 0:
+            # Some containers do not store it; count by grabbing (no decoding)
+            total = 0
+            while cap.grab():
+                total += 1
+    finally:
+        cap.release()
+    step = max(1, round(fps / sample_fps)) if sample_fps > 0 else 1
+    return total, step, fps
+
+
+def iter_chunks(groups: List[Group], chunk_frames: int, sample_fps: float,
+                start: Tuple[int, int] = (0, 0)) -> Iterator[Chunk]:
+    """Chunks in processing order, beginning at checkpoint position ``start``"""
+    for g in range(start[0], len(groups)):
+        group = groups[g]
+        first = start[1] if g == start[0] else 0
+        if group.kind == "images":
+            chunks = math.ceil(len(group.paths) / chunk_frames)
+            for c in range(first, chunks):
+                paths = group.paths[c * chunk_frames:(c + 1) * chunk_frames]
+                yield Chunk(g, c, "images", group.camera_id, paths, c * chunk_frames, 1,
+                            len(paths), 0.0)
+        else:
+            total, step, fps = video_info(group.paths[0], sample_fps)
+            samples = math.ceil(total / step)
+            for c in range(first, math.ceil(samples / chunk_frames)):
+                count = min(chunk_frames, samples - c * chunk_frames)
+                yield Chunk(g, c, "video", group.camera_id, group.paths,
+                            c * chunk_frames * step, step, count, fps)
+
+
+def plan_fingerprint(groups: List[Group], args) -> str:
+    """Identifies a run; a checkpoint only resumes the same inputs and sampling"""
+    h = hashlib.sha1()
+    h.update(json.dumps([args.fps, args.chunk, args.max_dim]).encode())
+    for group in groups:
+        h.update(group.kind.encode())
+        for path in group.paths:
+            h.update(path.encode("utf-8", "surrogateescape"))
+            h.update(b"\0")
+    return h.hexdigest()
+
+
+# -------------------------------------------------
+# DECODE WORKERS (separate processes)
+# -------------------------------------------------
+def _init_worker():
+    # One decode thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    # Ctrl-C is handled by the main process, which cancels queued chunks
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def prepare_frame(image, max_dim):
+    """Same preprocessing as image_detector.preprocess_image"""
+    if len(image.shape) == 3 and image.shape[2] == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    h, w = image.shape[:2]
+    if max_dim and max(h, w) > max_dim:
+        scale = max_dim / max(h, w)
+        image = cv2.resize(image, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    return image
+
+
+def decode_chunk(chunk: Chunk, max_dim: int):
+    """
+    Returns (frames, errors): frames is [(source, frame index, position
+    seconds or None, image)], errors is [(source, message)]
+    """
+    frames, errors = [], []
+    if chunk.kind == "images":
+        for i, path in enumerate(chunk.paths):
+            image = cv2.imread(path, cv2.IMREAD_COLOR)
+            if image is None:
+                errors.append((path, "unreadable image"))
+                continue
+            frames.append((path, chunk.start + i, None, prepare_frame(image, max_dim)))
+        return frames, errors
+
+    path = chunk.paths[0]
+    cap = cv2.VideoCapture(path)
+    try:
+        if chunk.start:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, chunk.start)
+        for n in range(chunk.count):
+            ok, image = cap.read()
+            if not ok:
+                errors.append((path, f"ended before frame {chunk.start + n * chunk.step}"))
+                break
+            index = chunk.start + n * chunk.step
+            frames.append((path, index, round(index / chunk.fps, 3), prepare_frame(image, max_dim)))
+            # Skipped frames are only grabbed, not decoded into images
+            for _ in range(chunk.step - 1):
+                if not cap.grab():
+                    break
+    finally:
+        cap.release()
+    return frames, errors
+
+
+# -------------------------------------------------
+# OUTPUT SINKS
+# -------------------------------------------------
+class CsvSink:
+    """Appends rows; ``commit()`` makes them durable and returns the resume state"""
+
+    def __init__(self, path, state: Optional[Dict] = None):
+        self.path = path
+        if state is None:
+            self._file = open(path, "w", newline="")
+            self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+            self._writer.writeheader()
+        else:
+            # Drop rows written after the last checkpoint
+            os.truncate(path, state["offset"])
+            self._file = open(path, "a", newline="")
+            self._writer = csv.DictWriter(self._file, fieldnames=COLUMNS)
+
+    def write(self, rows: List[Dict]) -> None:
+        self._writer.writerows(rows)
+
+    def commit(self) -> Dict:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"offset": self._file.tell()}
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetSink:
+    """Directory of Parquet part files, one per checkpoint that added rows"""
+
+    def __init__(self, path, state: Optional[Dict] = None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow); "
+                               "use a .csv output instead")
+        self._pa, self._pq = pyarrow, pyarrow.parquet
+        self.path = path
+        self.parts = state["parts"] if state else 0
+        os.makedirs(path, exist_ok=True)
+        # Parts (and temp files) past the checkpoint belong to the lost tail
+        for name in os.listdir(path):
+            if name.endswith(".tmp") or (name.startswith("part-") and name.endswith(".parquet")
+                                         and int(name[5:10]) >= self.parts):
+                os.remove(os.path.join(path, name))
+        self._rows: List[Dict] = []
+
+    def write(self, rows: List[Dict]) -> None:
+        self._rows.extend(rows)
+
+    def commit(self) -> Dict:
+        if self._rows:
+            table = self._pa.Table.from_pylist(self._rows)
+            final = os.path.join(self.path, f"part-{self.parts:05d}.parquet")
+            self._pq.write_table(table, final + ".tmp")
+            os.replace(final + ".tmp", final)
+            self.parts += 1
+            self._rows = []
+        return {"parts": self.parts}
+
+    def close(self) -> None:
+        pass
+
+
+def open_sink(path, state=None):
+    if path.lower().endswith(".parquet"):
+        return ParquetSink(path, state)
+    return CsvSink(path, state)
+
+
+# -------------------------------------------------
+# CHECKPOINT + SUMMARY
+# -------------------------------------------------
+class Checkpoint:
+    """Resume position, sink state and running totals in one JSON file"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = None
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    def save(self, data: Dict) -> None:
+        data["updated"] = datetime.now().isoformat()
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+        self.data = data
+
+
+def new_totals() -> Dict:
+    return {"frames": 0, "chunks": 0, "decode_errors": 0, "crimes": 0, "elapsed_s": 0.0,
+            "levels": {}, "crime_types": {}, "crime_frames_by_camera": {}}
+
+
+def summarize(totals: Dict, run: Dict) -> Dict:
+    """Summary over all runs of this job, plus this run's throughput"""
+    elapsed = run["elapsed_s"]
+    return {
+        "frames": totals["frames"],
+        "chunks": totals["chunks"],
+        "decode_errors": totals["decode_errors"],
+        "crime_frames": totals["crimes"],
+        "threat_levels": {level: totals["levels"].get(level, 0) for level in THREAT_LEVELS},
+        "crime_types": dict(Counter(totals["crime_types"]).most_common()),
+        "top_cameras": dict(Counter(totals["crime_frames_by_camera"]).most_common(20)),
+        "total_elapsed_s": round(totals["elapsed_s"], 2),
+        "this_run": {
+            "frames": run["frames"],
+            "elapsed_s": round(elapsed, 2),
+            "frames_per_sec": round(run["frames"] / elapsed, 2) if elapsed else 0.0,
+            # Mostly waiting on decode means more --workers would help
+            "decode_wait_s": round(run["decode_wait_s"], 2),
+            "inference_s": round(run["inference_s"], 2),
+        },
+    }
+
+
+# -------------------------------------------------
+# RUN
+# -------------------------------------------------
+def to_row(source, camera_id, index, position, result) -> Dict:
+    return {
+        "source": source,
+        "camera_id": camera_id,
+        "frame": index,
+        "position_s": position,
+        "crime_detected": int(bool(result.get("crime_detected"))),
+        "crime_type": result.get("crime_type", "NO_CRIME"),
+        "threat_level": result.get("threat_level", "LOW"),
+        "threat_score": round(float(result.get("threat_score", 0) or 0), 2),
+        "confidence": round(float(result.get("confidence", 0) or 0), 4),
+        "persons_detected": int(result.get("persons_detected", 0)),
+        "activities": ";".join(result.get("activities", [])),
+        "signals": ";".join(result.get("signals", [])),
+    }
+
+
+def analyze_chunk(detector, chunk: Chunk, frames, batch_size: int) -> List[Dict]:
+    rows = []
+    for i in range(0, len(frames), batch_size):
+        batch = frames[i:i + batch_size]
+        outputs = detector.infer_batch([image for _, _, _, image in batch])
+        for (source, index, position, _), (kps, conf, boxes, _) in zip(batch, outputs):
+            result = detector.analyze_keypoints(kps, conf, boxes, camera_id=chunk.camera_id)
+            rows.append(to_row(source, chunk.camera_id, index, position, result))
+    return rows
+
+
+def run(args) -> Dict:
+    files = collect_files(args.inputs)
+    groups = build_groups(files)
+    if not groups:
+        raise SystemExit("❌ No images or videos found in the given inputs")
+    fingerprint = plan_fingerprint(groups, args)
+
+    checkpoint = Checkpoint(args.output + ".checkpoint.json")
+    state = checkpoint.data
+    if state is not None and args.restart:
+        state = None
+    if state is not None:
+        if state["fingerprint"] != fingerprint:
+            raise SystemExit("❌ Inputs or sampling differ from the checkpointed run; "
+                             "use --restart to start over")
+        if state.get("complete"):
+            print(f"✅ Already complete ({state['totals']['frames']} frames); --restart to redo")
+            return state["summary"]
+        print(f"↩️ Resuming at group {state['position'][0] + 1}/{len(groups)}, "
+              f"chunk {state['position'][1]} ({state['totals']['frames']} frames done)")
+
+    position = tuple(state["position"]) if state else (0, 0)
+    totals = state["totals"] if state else new_totals()
+    sink = open_sink(args.output, state["sink"] if state else None)
+    sink_state = sink.commit()
+    run_stats = {"frames": 0, "elapsed_s": 0.0, "decode_wait_s": 0.0, "inference_s": 0.0}
+
+    def save(complete=False):
+        checkpoint.save({"fingerprint": fingerprint, "position": list(position),
+                         "sink": sink_state, "totals": totals, "complete": complete,
+                         "summary": summarize(totals, run_stats) if complete else None})
+
+    workers = args.workers or max(1, (os.cpu_count() or 2) - 1)
+    print(f"📂 {len(files)} files in {len(groups)} camera groups; "
+          f"{workers} decode workers, batch {args.batch}")
+
+    # Spawned (not forked) workers: the parent holds model threads
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                               mp_context=multiprocessing.get_context("spawn"))
+    chunks = iter_chunks(groups, args.chunk, args.fps, position)
+    pending = deque()
+    started = time.monotonic()
+    last_checkpoint = started
+    last_camera = None
+
+    def fill():
+        # Decode ahead, bounded so memory stays at a few chunks per worker
+        while len(pending) < workers * 2:
+            chunk = next(chunks, None)
+            if chunk is None:
+                return
+            pending.append((chunk, pool.submit(decode_chunk, chunk, args.max_dim)))
+
+    try:
+        from pose_detector import PoseCrimeDetector
+        fill()
+        detector = PoseCrimeDetector(args.model)
+
+        while pending:
+            chunk, future = pending.popleft()
+            fill()
+            wait_start = time.monotonic()
+            frames, errors = future.result()
+            infer_start = time.monotonic()
+            run_stats["decode_wait_s"] += infer_start - wait_start
+
+            if chunk.camera_id != last_camera:
+                if last_camera is not None:
+                    detector.reset_history(last_camera)
+                last_camera = chunk.camera_id
+            for source, message in errors:
+                print(f"⚠️ {source}: {message}")
+
+            rows = analyze_chunk(detector, chunk, frames, args.batch)
+            run_stats["inference_s"] += time.monotonic() - infer_start
+            sink.write(rows)
+
+            totals["chunks"] += 1
+            totals["frames"] += len(rows)
+            totals["decode_errors"] += len(errors)
+            run_stats["frames"] += len(rows)
+            for row in rows:
+                totals["levels"][row["threat_level"]] = totals["levels"].get(row["threat_level"], 0) + 1
+                if row["crime_detected"]:
+                    totals["crimes"] += 1
+                    totals["crime_types"][row["crime_type"]] = totals["crime_types"].get(row["crime_type"], 0) + 1
+                    totals["crime_frames_by_camera"][row["camera_id"]] = \
+                        totals["crime_frames_by_camera"].get(row["camera_id"], 0) + 1
+            position = (chunk.group, chunk.index + 1)
+
+            now = time.monotonic()
+            if now - last_checkpoint >= args.checkpoint_interval:
+                totals["elapsed_s"] += now - last_checkpoint
+                last_checkpoint = now
+                sink_state = sink.commit()
+                save()
+                elapsed = now - started
+                print(f"💾 {totals['frames']} frames ({run_stats['frames'] / elapsed:.1f}/s), "
+                      f"group {chunk.group + 1}/{len(groups)}")
+
+        position = (len(groups), 0)
+    except KeyboardInterrupt:
+        print("\n⏹️ Interrupted; run the same command again to resume")
+    finally:
+        for _, future in pending:
+            future.cancel()
+        pool.shutdown(wait=False, cancel_futures=True)
+        now = time.monotonic()
+        totals["elapsed_s"] += now - last_checkpoint
+        run_stats["elapsed_s"] = now - started
+        sink_state = sink.commit()
+        sink.close()
+        save(complete=position[0] >= len(groups))
+
+    summary = summarize(totals, run_stats)
+    with open(args.output + ".summary.json", "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Analyze archived images and videos in bulk")
+    parser.add_argument("inputs", nargs="+", help="Directories, glob patterns or files")
+    parser.add_argument("-o", "--output", default="bulk_results.csv",
+                        help="Results file (.csv, or .parquet with pyarrow)")
+    parser.add_argument("--workers", type=int, default=Config.BULK_WORKERS,
+                        help="Decode processes (0 = cores - 1)")
+    parser.add_argument("--batch", type=int, default=Config.BULK_BATCH_SIZE,
+                        help="Frames per model call")
+    parser.add_argument("--chunk", type=int, default=Config.BULK_CHUNK_FRAMES,
+                        help="Frames per decode task")
+    parser.add_argument("--fps", type=float, default=Config.BULK_SAMPLE_FPS,
+                        help="Video frames analyzed per second of footage (0 = every frame)")
+    parser.add_argument("--max-dim", type=int, default=Config.BULK_MAX_DIM,
+                        help="Resize frames so the longer side is at most this")
+    parser.add_argument("--checkpoint-interval", type=float, default=Config.BULK_CHECKPOINT_INTERVAL,
+                        help="Seconds between checkpoints")
+    parser.add_argument("--model", default="yolov8n-pose.pt", help="Pose model")
+    parser.add_argument("--restart", action="store_true",
+                        help="Ignore an existing checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    summary = run(args)
+    this_run = summary["this_run"]
+    print(f"\n✅ {summary['frames']} frames analyzed ({summary['decode_errors']} decode errors)")
+    print(f"   This run: {this_run['frames']} frames in {this_run['elapsed_s']}s "
+          f"({this_run['frames_per_sec']} frames/sec; decode wait {this_run['decode_wait_s']}s, "
+          f"inference {this_run['inference_s']}s)")
+    print(f"   Threat levels: {summary['threat_levels']}")
+    print(f"   Crime frames: {summary['crime_frames']} {summary['crime_types']}")
+    print(f"   Results: {args.output}  Summary: {args.output}.summary.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Cascade Module - Two-stage detection: cheap gate first, pose only when needed
+
+Stage 0  motion gate    tiny grayscale thumbnail diffed against the camera's
+                        previous frame; a still scene that was empty last
+                        time stays empty without running any model
+Stage 1  box gate       yolov8n at low resolution finds persons and weapons
+Stage 2  pose           yolov8n-pose on the frame, or on one padded crop
+                        around all persons when they cover a small part of it
+
+Weapon boxes from stage 1 are fused into the pose rules (WEAPON_VISIBLE,
+WEAPON_IN_HAND), so one pipeline replaces running detector.py's box model
+and PoseCrimeDetector side by side. Empty scenes cost stage 0/1 only.
+
+Usage:
+    cascade = CascadeDetector(pose_detector)
+    result = cascade.analyze(image, camera_id="cam01")
+"""
+
+import threading
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+
+from config import Config
+from pose_detector import rescale_outputs
+
+
+WEAPON_LABELS = {"knife", "gun", "pistol", "rifle", "baseball bat"}
+MOTION_THUMB_SIZE = (64, 48)
+
+
+class GateResult:
+    """Stage 0/1 output for one frame"""
+
+    __slots__ = ("persons", "weapons", "motion_skipped")
+
+    def __init__(self, persons, weapons, motion_skipped=False):
+        self.persons = persons    # (n, 4) xyxy
+        self.weapons = weapons    # (m, 4) xyxy
+        self.motion_skipped = motion_skipped
+
+    @property
+    def has_persons(self) -> bool:
+        return len(self.persons) > 0
+
+
+class _MotionState:
+    __slots__ = ("thumb", "empty", "skips")
+
+    def __init__(self):
+        self.thumb = None
+        self.empty = False
+        self.skips = 0
+
+
+class CascadeDetector:
+    """Runs the pose stage only on frames (or crops) that contain people"""
+
+    def __init__(self, pose_detector, gate_model=None, gate_imgsz=None, gate_conf=None,
+                 motion_threshold=None, motion_max_skip=None, crop_max_area=None):
+        self.pose_detector = pose_detector
+        if gate_model is None:
+            gate_model = Config.CASCADE_GATE_MODEL
+        # Accept a loaded model so detector.py can share its own instance
+        self.gate_model = YOLO(gate_model) if isinstance(gate_model, str) else gate_model
+        self.gate_imgsz = gate_imgsz or Config.CASCADE_GATE_IMGSZ
+        self.gate_conf = Config.CASCADE_GATE_CONF if gate_conf is None else gate_conf
+        self.motion_threshold = (Config.CASCADE_MOTION_THRESHOLD
+                                 if motion_threshold is None else motion_threshold)
+        self.motion_max_skip = (Config.CASCADE_MOTION_MAX_SKIP
+                                if motion_max_skip is None else motion_max_skip)
+        self.crop_max_area = Config.CASCADE_CROP_MAX_AREA if crop_max_area is None else crop_max_area
+
+        names = self.gate_model.names
+        names = dict(names) if isinstance(names, dict) else dict(enumerate(names))
+        self.person_classes = {int(cls) for cls, name in names.items() if name == "person"}
+        self.weapon_classes = {int(cls) for cls, name in names.items() if name in WEAPON_LABELS}
+
+        self._lock = threading.Lock()
+        self._motion: Dict[Optional[str], _MotionState] = {}
+        self.stats = {"frames": 0, "motion_skipped": 0, "gate_empty": 0,
+                      "pose_full": 0, "pose_crop": 0}
+
+    # -------------------------------------------------
+    # STAGE 0/1: GATE
+    # -------------------------------------------------
+    def _still_and_empty(self, image, camera_id) -> bool:
+        """True when the scene has not moved since a frame with nobody in it"""
+        if self.motion_threshold <= 0:
+            return False
+        gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, MOTION_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+        with self._lock:
+            state = self._motion.setdefault(camera_id, _MotionState())
+            previous, state.thumb = state.thumb, thumb
+            if previous is None or not state.empty or state.skips >= self.motion_max_skip:
+                state.skips = 0
+                return False
+            if float(cv2.absdiff(thumb, previous).mean()) >= self.motion_threshold:
+                state.skips = 0
+                return False
+            state.skips += 1
+            return True
+
+    def _remember(self, camera_id, empty):
+        if self.motion_threshold <= 0:
+            return
+        with self._lock:
+            state = self._motion.get(camera_id)
+            if state is not None:
+                state.empty = empty
+
+    def gate(self, image, camera_id=None) -> GateResult:
+        """Cheap pass: person and weapon boxes, or a motion-gated skip"""
+        self.stats["frames"] += 1
+        if self._still_and_empty(image, camera_id):
+            self.stats["motion_skipped"] += 1
+            empty = np.zeros((0, 4), dtype=np.float32)
+            return GateResult(empty, empty, motion_skipped=True)
+
+        classes = sorted(self.person_classes | self.weapon_classes) or None
+        results = self.gate_model(image, imgsz=self.gate_imgsz, conf=self.gate_conf,
+                                  classes=classes, verbose=False)[0]
+        if results.boxes is None or len(results.boxes) == 0:
+            persons = weapons = np.zeros((0, 4), dtype=np.float32)
+        else:
+            xyxy = results.boxes.xyxy.cpu().numpy().astype(np.float32)
+            cls = results.boxes.cls.cpu().numpy().astype(int)
+            persons = xyxy[np.isin(cls, list(self.person_classes))]
+            weapons = xyxy[np.isin(cls, list(self.weapon_classes))]
+
+        self._remember(camera_id, empty=len(persons) == 0)
+        if len(persons) == 0:
+            self.stats["gate_empty"] += 1
+        return GateResult(persons, weapons)
+
+    # -------------------------------------------------
+    # STAGE 2: POSE
+    # -------------------------------------------------
+    def _person_crop(self, image, persons):
+        """Padded region around all persons, or None when it is most of the frame"""
+        h, w = image.shape[:2]
+        x1, y1 = persons[:, :2].min(axis=0)
+        x2, y2 = persons[:, 2:].max(axis=0)
+        pad_x, pad_y = (x2 - x1) * 0.2, (y2 - y1) * 0.2
+        x1, y1 = int(max(x1 - pad_x, 0)), int(max(y1 - pad_y, 0))
+        x2, y2 = int(min(x2 + pad_x, w)), int(min(y2 + pad_y, h))
+        if (x2 - x1) * (y2 - y1) > self.crop_max_area * w * h:
+            return None
+        return x1, y1, x2, y2
+
+    def pose(self, image, gate: GateResult, camera_id=None, tier=None, scale=1.0) -> Dict:
+        """
+        Run pose on the frame or person crop and the rules with weapon fusion;
+        ``scale`` as in PoseCrimeDetector.analyze
+        """
+        region = self._person_crop(image, gate.persons)
+        if region is None:
+            self.stats["pose_full"] += 1
+            kps_all, conf_all, boxes = self.pose_detector.infer(image, camera_id=camera_id,
+                                                                tier=tier)
+        else:
+            self.stats["pose_crop"] += 1
+            x1, y1, x2, y2 = region
+            kps_all, conf_all, boxes = self.pose_detector.infer(image[y1:y2, x1:x2],
+                                                                camera_id=camera_id, tier=tier)
+            # Back to frame coordinates; (0, 0) marks a missing keypoint
+            found = np.any(kps_all != 0, axis=-1, keepdims=True)
+            kps_all = np.where(found, kps_all + np.array([x1, y1], dtype=np.float32), 0)
+            boxes = boxes + np.array([x1, y1, x1, y1], dtype=np.float32)
+        kps_all, boxes = rescale_outputs(kps_all, boxes, scale)
+        weapons = gate.weapons * np.float32(scale)
+
+        if self.pose_detector.recorder is not None:
+            self.pose_detector.recorder.record(kps_all, conf_all, boxes, camera_id=camera_id)
+
+        return self.pose_detector.analyze_keypoints(kps_all, conf_all, boxes, camera_id=camera_id,
+                                                    weapons=weapons, tier=tier)
+
+    def analyze(self, image, camera_id=None, tier=None, scale=1.0) -> Dict:
+        """Full cascade; same result shape as PoseCrimeDetector.analyze"""
+        gate = self.gate(image, camera_id)
+        if not gate.has_persons:
+            # Same payload the pose path gives for a frame with nobody in it
+            return self.pose_detector.analyze_keypoints(
+                np.zeros((0, 17, 2), dtype=np.float32), camera_id=camera_id)
+        return self.pose(image, gate, camera_id, tier=tier, scale=scale)
+
+    def snapshot(self) -> Dict:
+        frames = self.stats["frames"]
+        posed = self.stats["pose_full"] + self.stats["pose_crop"]
+        return {
+            **self.stats,
+            "pose_rate": round(posed / frames, 3) if frames else 0.0,
+        }
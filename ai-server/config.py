@@ -26,17 +26,45 @@ class Config:
     # Display settings
     DISPLAY_ENABLED = os.getenv('DISPLAY_ENABLED', 'True').lower() == 'true'
     DISPLAY_DETECTIONS = os.getenv('DISPLAY_DETECTIONS', 'True').lower() == 'true'
+    PREVIEW_ENABLED = os.getenv('PREVIEW_ENABLED', 'False').lower() == 'true'  # MJPEG preview server
+    PREVIEW_PORT = int(os.getenv('PREVIEW_PORT', '8002'))
+    PREVIEW_FPS = float(os.getenv('PREVIEW_FPS', '5.0'))  # preview rate, independent of analysis
+    PREVIEW_JPEG_QUALITY = int(os.getenv('PREVIEW_JPEG_QUALITY', '70'))
+    PREVIEW_MAX_WIDTH = int(os.getenv('PREVIEW_MAX_WIDTH', '960'))
     FPS_LIMIT = int(os.getenv('FPS_LIMIT', '30'))
     
+    # Frame transport (detector.py): capture in a separate process, frames shared zero-copy
+    SHARED_FRAME_TRANSPORT = os.getenv('SHARED_FRAME_TRANSPORT', 'False').lower() == 'true'
+    FRAME_RING_SLOTS = int(os.getenv('FRAME_RING_SLOTS', '8'))
+    
     # Alert settings
     ALERT_DIR = os.getenv('ALERT_DIR', './alerts')
     WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Optional webhook URL
     ENABLE_EMAIL_ALERTS = os.getenv('ENABLE_EMAIL_ALERTS', 'False').lower() == 'true'
-    
+    ALERT_SEGMENT_MAX_BYTES = int(os.getenv('ALERT_SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+    ALERT_FSYNC_INTERVAL = float(os.getenv('ALERT_FSYNC_INTERVAL', '1.0'))  # seconds between fsyncs
+    ALERT_DRAIN_INTERVAL = float(os.getenv('ALERT_DRAIN_INTERVAL', '30.0'))  # seconds between drain attempts
+    ALERT_DRAIN_BATCH = int(os.getenv('ALERT_DRAIN_BATCH', '50'))
+    BACKEND_BULK_URL = os.getenv('BACKEND_BULK_URL', 'http://localhost:5000/api/incidents/bulk')
+    INCIDENT_WINDOW = float(os.getenv('INCIDENT_WINDOW', '5.0'))  # seconds to coalesce per camera/type
+    INCIDENT_COOLDOWN = float(os.getenv('INCIDENT_COOLDOWN', '15.0'))  # min seconds between deliveries per camera/type
+    INCIDENT_BATCH_SIZE = int(os.getenv('INCIDENT_BATCH_SIZE', '20'))
+    INCIDENT_BYPASS_LEVEL = os.getenv('INCIDENT_BYPASS_LEVEL', 'CRITICAL')  # delivered without waiting for the window
+
     # AI settings
     OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')  # Optional OpenAI API key
     AI_MODEL = os.getenv('AI_MODEL', 'gpt-4-vision-preview')
     ENABLE_AI_ANALYSIS = os.getenv('ENABLE_AI_ANALYSIS', 'False').lower() == 'true'
+    # Second opinion for gray-band frames (see second_opinion.py; needs ENABLE_AI_ANALYSIS)
+    SECOND_OPINION_ANALYZER = os.getenv('SECOND_OPINION_ANALYZER', 'openai')  # openai | stub
+    SECOND_OPINION_BAND_LOW = float(os.getenv('SECOND_OPINION_BAND_LOW', '30'))  # threat score range
+    SECOND_OPINION_BAND_HIGH = float(os.getenv('SECOND_OPINION_BAND_HIGH', '60'))
+    SECOND_OPINION_CONCURRENCY = int(os.getenv('SECOND_OPINION_CONCURRENCY', '2'))  # calls in flight
+    SECOND_OPINION_RATE_PER_MIN = float(os.getenv('SECOND_OPINION_RATE_PER_MIN', '10'))
+    SECOND_OPINION_BURST = int(os.getenv('SECOND_OPINION_BURST', '3'))
+    SECOND_OPINION_DAILY_BUDGET = float(os.getenv('SECOND_OPINION_DAILY_BUDGET', '1.0'))  # USD per day
+    SECOND_OPINION_COST_PER_CALL = float(os.getenv('SECOND_OPINION_COST_PER_CALL', '0.01'))  # USD estimate
+    SECOND_OPINION_TIMEOUT = float(os.getenv('SECOND_OPINION_TIMEOUT', '15.0'))  # then keep the local verdict
     
     # Logging
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
@@ -44,7 +72,101 @@ class Config:
     
     # Performance
     SKIP_SIMILAR_FRAMES = os.getenv('SKIP_SIMILAR_FRAMES', 'True').lower() == 'true'
-    MAX_ANALYSIS_HISTORY = int(os.getenv('MAX_ANALYSIS_HISTORY', '100'))
+    MAX_ANALYSIS_HISTORY = int(os.getenv('MAX_ANALYSIS_HISTORY', '100'))  # raw records kept per camera
+    HISTORY_MINUTE_BUCKETS = int(os.getenv('HISTORY_MINUTE_BUCKETS', '1440'))  # per-minute rollups (24h)
+    HISTORY_HOUR_BUCKETS = int(os.getenv('HISTORY_HOUR_BUCKETS', '168'))  # per-hour rollups (7 days)
+    HISTORY_MAX_CAMERAS = int(os.getenv('HISTORY_MAX_CAMERAS', '256'))  # least recently seen dropped beyond this
+    
+    # Admission control (inference server)
+    INFERENCE_CONCURRENCY = int(os.getenv('INFERENCE_CONCURRENCY', '2'))  # requests running inference at once
+    INFERENCE_QUEUE_SIZE = int(os.getenv('INFERENCE_QUEUE_SIZE', '16'))  # requests allowed to wait
+    REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '10.0'))  # default max seconds to wait for a slot
+    PRIORITY_WINDOW = float(os.getenv('PRIORITY_WINDOW', '60.0'))  # seconds a HIGH/CRITICAL camera keeps priority
+    
+    # Latency-aware quality tiers (see quality_controller.py)
+    QUALITY_CONTROL_ENABLED = os.getenv('QUALITY_CONTROL_ENABLED', 'False').lower() == 'true'
+    QUALITY_LATENCY_SLO = float(os.getenv('QUALITY_LATENCY_SLO', '0.75'))  # target p95 inference seconds
+    QUALITY_WINDOW = float(os.getenv('QUALITY_WINDOW', '30.0'))  # seconds of latency samples
+    QUALITY_QUEUE_HIGH = int(os.getenv('QUALITY_QUEUE_HIGH', '4'))  # queued requests that force a step down
+    QUALITY_STEP_UP_AFTER = float(os.getenv('QUALITY_STEP_UP_AFTER', '15.0'))  # calm seconds per step up
+    QUALITY_ADJUST_INTERVAL = float(os.getenv('QUALITY_ADJUST_INTERVAL', '2.0'))  # min seconds between changes
+    QUALITY_LIGHT_MODEL = os.getenv('QUALITY_LIGHT_MODEL', '')  # optional lighter pose model for the lowest tier
+    
+    # Adaptive per-camera analysis rate (seconds between analyses; 0 = every frame)
+    ADAPTIVE_SCHEDULING = os.getenv('ADAPTIVE_SCHEDULING', 'False').lower() == 'true'
+    ANALYSIS_INTERVAL_IDLE = float(os.getenv('ANALYSIS_INTERVAL_IDLE', '5.0'))  # empty scene, LOW threat
+    ANALYSIS_INTERVAL_ACTIVE = float(os.getenv('ANALYSIS_INTERVAL_ACTIVE', '1.0'))  # persons or signals present
+    ANALYSIS_INTERVAL_ALERT = float(os.getenv('ANALYSIS_INTERVAL_ALERT', '0.0'))  # HIGH / CRITICAL
+    SCHEDULER_STEP_DOWN_AFTER = float(os.getenv('SCHEDULER_STEP_DOWN_AFTER', '10.0'))  # quiet seconds per step down
+    
+    # Detection cascade: cheap box/motion gate before pose (see cascade.py)
+    CASCADE_ENABLED = os.getenv('CASCADE_ENABLED', 'False').lower() == 'true'
+    CASCADE_GATE_MODEL = os.getenv('CASCADE_GATE_MODEL', 'yolov8n.pt')
+    CASCADE_GATE_IMGSZ = int(os.getenv('CASCADE_GATE_IMGSZ', '320'))  # gate input size (pixels)
+    CASCADE_GATE_CONF = float(os.getenv('CASCADE_GATE_CONF', '0.35'))
+    CASCADE_MOTION_THRESHOLD = float(os.getenv('CASCADE_MOTION_THRESHOLD', '2.0'))  # mean abs diff (0-255), 0 = off
+    CASCADE_MOTION_MAX_SKIP = int(os.getenv('CASCADE_MOTION_MAX_SKIP', '10'))  # re-run the gate after N still frames
+    CASCADE_CROP_MAX_AREA = float(os.getenv('CASCADE_CROP_MAX_AREA', '0.5'))  # crop when persons cover less of the frame
+    
+    # Tiled pose inference for high-resolution crowd frames (see tiling.py)
+    TILING_ENABLED = os.getenv('TILING_ENABLED', 'False').lower() == 'true'
+    TILE_SIZE = int(os.getenv('TILE_SIZE', '1280'))  # tile edge in source pixels
+    TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', '0.25'))  # fraction shared by neighbouring tiles
+    TILE_MIN_IMAGE_DIM = int(os.getenv('TILE_MIN_IMAGE_DIM', '1920'))  # never tile smaller frames
+    TILE_MIN_PERSON_PX = int(os.getenv('TILE_MIN_PERSON_PX', '48'))  # tile while people are shorter at model size
+    TILE_MAX_TILES = int(os.getenv('TILE_MAX_TILES', '8'))  # tiles per batch (plus one overview)
+    TILE_PROBE_INTERVAL = int(os.getenv('TILE_PROBE_INTERVAL', '10'))  # tile every Nth frame while nobody is found
+    
+    # AI server (image_detector.py) HTTP port
+    AI_SERVER_PORT = int(os.getenv('AI_SERVER_PORT', '8000'))
+    
+    # Camera-affinity sharding across AI server instances (see shard_router.py)
+    SHARD_NODES = os.getenv('SHARD_NODES', '')  # comma-separated AI server base URLs
+    SHARD_ROUTER_PORT = int(os.getenv('SHARD_ROUTER_PORT', '8080'))
+    SHARD_VNODES = int(os.getenv('SHARD_VNODES', '160'))  # ring points per node
+    SHARD_HEALTH_INTERVAL = float(os.getenv('SHARD_HEALTH_INTERVAL', '2.0'))  # seconds between /health checks
+    SHARD_HEALTH_TIMEOUT = float(os.getenv('SHARD_HEALTH_TIMEOUT', '1.0'))
+    SHARD_FAIL_THRESHOLD = int(os.getenv('SHARD_FAIL_THRESHOLD', '2'))  # failed checks before a node is skipped
+    SHARD_REQUEST_TIMEOUT = float(os.getenv('SHARD_REQUEST_TIMEOUT', '30.0'))  # forwarded request timeout
+    
+    # Persistent WebSocket stream ingestion (see stream_server.py)
+    STREAM_ENABLED = os.getenv('STREAM_ENABLED', 'False').lower() == 'true'
+    STREAM_PORT = int(os.getenv('STREAM_PORT', '8001'))
+    STREAM_MAX_MESSAGE_BYTES = int(os.getenv('STREAM_MAX_MESSAGE_BYTES', str(16 * 1024 * 1024)))
+    STREAM_IDLE_TIMEOUT = float(os.getenv('STREAM_IDLE_TIMEOUT', '60.0'))  # close silent streams (0 = never)
+    
+    # Detection events as SSE on the stream port (see event_bus.py)
+    EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', '256'))  # per subscriber, oldest dropped when full
+    EVENT_REPLAY_SIZE = int(os.getenv('EVENT_REPLAY_SIZE', '512'))  # recent events kept for Last-Event-ID
+    EVENT_MAX_SUBSCRIBERS = int(os.getenv('EVENT_MAX_SUBSCRIBERS', '100'))
+    EVENT_KEEPALIVE = float(os.getenv('EVENT_KEEPALIVE', '15.0'))  # seconds between keepalive comments
+    
+    # Incident evidence clips: fixed-memory frame ring per camera (see evidence_buffer.py)
+    EVIDENCE_CLIPS_ENABLED = os.getenv('EVIDENCE_CLIPS_ENABLED', 'False').lower() == 'true'
+    EVIDENCE_PRE_ROLL = float(os.getenv('EVIDENCE_PRE_ROLL', '5.0'))  # seconds kept before the trigger
+    EVIDENCE_POST_ROLL = float(os.getenv('EVIDENCE_POST_ROLL', '5.0'))  # seconds recorded after it
+    EVIDENCE_FPS = float(os.getenv('EVIDENCE_FPS', '10.0'))  # frames buffered (and encoded) per second
+    EVIDENCE_MAX_WIDTH = int(os.getenv('EVIDENCE_MAX_WIDTH', '640'))  # buffered frames are downscaled to this
+    EVIDENCE_MAX_ACTIVE_CLIPS = int(os.getenv('EVIDENCE_MAX_ACTIVE_CLIPS', '4'))  # clips encoding at once
+    EVIDENCE_MAX_CLIP = float(os.getenv('EVIDENCE_MAX_CLIP', '60.0'))  # seconds; extensions stop here
+    EVIDENCE_MAX_CAMERAS = int(os.getenv('EVIDENCE_MAX_CAMERAS', '16'))  # frame rings held at once
+    EVIDENCE_IDLE_TIMEOUT = float(os.getenv('EVIDENCE_IDLE_TIMEOUT', '60.0'))  # seconds before an idle ring is evicted
+    
+    # Offline bulk analysis CLI (see bulk_analyze.py)
+    BULK_WORKERS = int(os.getenv('BULK_WORKERS', '0'))  # decode processes, 0 = cores - 1
+    BULK_BATCH_SIZE = int(os.getenv('BULK_BATCH_SIZE', '16'))  # frames per model call
+    BULK_CHUNK_FRAMES = int(os.getenv('BULK_CHUNK_FRAMES', '32'))  # frames per decode task
+    BULK_SAMPLE_FPS = float(os.getenv('BULK_SAMPLE_FPS', '1.0'))  # video frames analyzed per second, 0 = all
+    BULK_MAX_DIM = int(os.getenv('BULK_MAX_DIM', '1280'))  # as the server's preprocessing
+    BULK_CHECKPOINT_INTERVAL = float(os.getenv('BULK_CHECKPOINT_INTERVAL', '30.0'))  # seconds
+    
+    # Profiling (off by default; can also be toggled via /admin/profiling)
+    PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+    PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0.05'))  # fraction of requests profiled
+    PROFILING_MODE = os.getenv('PROFILING_MODE', 'cprofile')  # cprofile | sampling
+    PROFILE_DIR = os.getenv('PROFILE_DIR', './profiles')
+    RECORD_KEYPOINTS_DIR = os.getenv('RECORD_KEYPOINTS_DIR', '')  # Record pose outputs for offline replay when set
+    ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')  # Required in X-Admin-Token for admin routes; unset = loopback callers only
     
     # Advanced settings
     USE_OPTICAL_FLOW = os.getenv('USE_OPTICAL_FLOW', 'True').lower() == 'true'
@@ -69,6 +191,7 @@ def print_config():
     print(f"Detection Persistence:     {Config.DETECTION_PERSISTENCE}")
     print(f"Smoothing Alpha:           {Config.SMOOTHING_ALPHA}")
     print(f"Display Enabled:            {Config.DISPLAY_ENABLED}")
+    print(f"Preview Server:             {f'port {Config.PREVIEW_PORT}' if Config.PREVIEW_ENABLED else 'Disabled'}")
     print(f"Alert Directory:            {Config.ALERT_DIR}")
     print(f"Webhook URL:                {'Configured' if Config.WEBHOOK_URL else 'Not configured'}")
     print(f"OpenAI API:                 {'Configured' if Config.OPENAI_API_KEY else 'Not configured'}")
@@ -1,111 +1,262 @@
 import cv2
-import base64
-import requests
 import time
 import math
+import multiprocessing
 from ultralytics import YOLO
 
+from config import Config
+from alert_store import AlertStore
+from incident_aggregator import IncidentAggregator
+from adaptive_scheduler import AnalysisScheduler
+from cascade import CascadeDetector
+from evidence_buffer import EvidenceRecorder
+from pose_detector import PoseCrimeDetector
+from preview_server import PreviewServer, draw_overlay
+from frame_transport import SharedFrameRing, capture_worker
+
 # ---------------- CONFIG ----------------
-BACKEND_URL = "http://localhost:5000/api/incidents/create"
 CAMERA_ID = "cam01"
-COOLDOWN_SECONDS = 15
-
-model = YOLO("yolov8n.pt")
-cap = cv2.VideoCapture(0)
 
-last_sent_time = 0
-prev_positions = {}   # track person movement
-loitering_start = {}
+# Severity per rule; CRITICAL skips the coalescing window
+CRIME_LEVELS = {
+    "WEAPON_DETECTED": "CRITICAL",
+    "FIGHT_DETECTED": "HIGH",
+    "SUSPICIOUS_RUNNING": "MEDIUM",
+    "LOITERING": "LOW",
+}
 
-print("🚀 Crime Detection AI Started...")
+# Created in main() so spawned capture processes never load them
+alert_store = None
+aggregator = None
+evidence_clips = None
+preview = None
 
 # ---------------- HELPERS ----------------
 def distance(p1, p2):
     return math.sqrt((p1[0]-p2[0])**2 + (p1[1]-p2[1])**2)
 
-def encode_image(frame):
+def encode_jpeg(frame):
     _, buffer = cv2.imencode(".jpg", frame)
-    return base64.b64encode(buffer).decode("utf-8")
+    return buffer.tobytes()
+
+def archive_incidents(incidents, delivered):
+    for incident in incidents:
+        # Indexed by archive time so the index stays sorted; firstSeen is in the meta
+        alert_store.append(incident.meta(), incident.evidence_jpeg, pending=not delivered)
 
-def send_incident(crime_type, confidence, frame):
-    global last_sent_time
-    now = time.time()
-    if now - last_sent_time < COOLDOWN_SECONDS:
-        return
+def box_centers(boxes):
+    return [(int(x1+x2)//2, int(y1+y2)//2) for x1, y1, x2, y2 in boxes]
+
+def labelled(boxes, label):
+    return [(x1, y1, x2, y2, label) for x1, y1, x2, y2 in boxes]
+
+def render(frame, boxes, status):
+    """Feed the preview and local window; False when the user pressed q"""
+    overlay = boxes if Config.DISPLAY_DETECTIONS else ()
+    # Nothing is copied, drawn or encoded unless a preview viewer is connected
+    if preview is not None and preview.wants_frame(CAMERA_ID):
+        preview.publish(CAMERA_ID, frame, overlay, status)
+    if not Config.DISPLAY_ENABLED:
+        return True
+    if overlay or status:
+        # Frames may be read-only shared memory or held as incident evidence
+        frame = draw_overlay(frame.copy(), overlay, status)
+    cv2.imshow("Crime Detection AI", frame)
+    return cv2.waitKey(1) & 0xFF != ord("q")
 
-    payload = {
-        "type": crime_type,
-        "confidence": confidence,
-        "cameraId": CAMERA_ID,
-        "imageBase64": f"data:image/jpeg;base64,{encode_image(frame)}"
-    }
+def send_incident(crime_type, confidence, frame, threat_level=None):
+    # Shared-memory frames are read-only views into a reused slot; the
+    # aggregator may hold evidence past this frame, so keep a private copy
+    evidence = frame if frame.flags.writeable else frame.copy()
+    threat_level = threat_level or CRIME_LEVELS.get(crime_type, "LOW")
+    fields = {}
+    if evidence_clips is not None and threat_level in ("HIGH", "CRITICAL"):
+        # Pre-roll is already buffered; the clip finishes in the background
+        clip = evidence_clips.request_clip(CAMERA_ID, label=crime_type)
+        if clip:
+            fields["evidenceClips"] = [clip]
+    aggregator.submit(CAMERA_ID, crime_type, confidence, evidence=evidence,
+                      threat_level=threat_level, **fields)
+    return threat_level
 
+def highest_level(levels):
+    order = ["LOW", "MEDIUM", "HIGH", "CRITICAL"]
+    return max(levels, key=order.index, default="LOW")
+
+# ---------------- FRAME SOURCES ----------------
+def local_frames(source):
+    """Capture in this process"""
+    cap = cv2.VideoCapture(source)
     try:
-        res = requests.post(BACKEND_URL, json=payload, timeout=5)
-        print(f"🚨 {crime_type} → Sent ({res.status_code})")
-        last_sent_time = now
-    except:
-        print("❌ Backend not reachable")
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                return
+            yield frame
+    finally:
+        cap.release()
+
+def shared_frames(source):
+    """
+    Capture in a separate process; frames arrive as zero-copy views into a
+    shared-memory ring and are released when the next frame is requested
+    """
+    # Spawned, not forked: the parent already runs alert, aggregator and evidence threads
+    ctx = multiprocessing.get_context("spawn")
+    ring = SharedFrameRing.create(
+        Config.FRAME_RING_SLOTS, (Config.CAMERA_HEIGHT, Config.CAMERA_WIDTH, 3), lock=ctx.Lock()
+    )
+    stop = ctx.Event()
+    proc = ctx.Process(target=capture_worker, args=(ring.handle(), source, stop, Config.FPS_LIMIT),
+                       name="capture", daemon=True)
+    proc.start()
+
+    last_seq = -1
+    try:
+        while True:
+            view = ring.wait_latest(after=last_seq, timeout=1.0)
+            if view is None:
+                if stop.is_set() or not proc.is_alive():
+                    return
+                continue
+            last_seq = view.seq
+            try:
+                yield view.array
+            finally:
+                view.release()
+    finally:
+        stop.set()
+        proc.join(timeout=2.0)
+        ring.close()
 
 # ---------------- MAIN LOOP ----------------
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        break
+def main():
+    global alert_store, aggregator, evidence_clips, preview
+
+    model = YOLO("yolov8n.pt")
+    # Cascade: the box model gates pose, which only sees frames with people
+    cascade = CascadeDetector(PoseCrimeDetector(), gate_model=model) if Config.CASCADE_ENABLED else None
+    frames = shared_frames(Config.CAMERA_SOURCE) if Config.SHARED_FRAME_TRANSPORT \
+        else local_frames(Config.CAMERA_SOURCE)
 
-    results = model(frame, conf=0.5)
-    persons = []
-    weapons = []
+    prev_positions = {}   # track person movement
+    loitering_start = {}
+    scheduler = AnalysisScheduler()
+    follow_up = False     # analyze the frame after a scheduled one so motion has a pair
 
-    for r in results:
-        for box in r.boxes:
-            cls = int(box.cls[0])
-            label = model.names[cls]
+    # Incidents are archived locally; undelivered ones are drained later
+    alert_store = AlertStore(Config.ALERT_DIR)
+    alert_store.start_drain()
+    aggregator = IncidentAggregator(encoder=encode_jpeg, on_result=archive_incidents)
+    evidence_clips = EvidenceRecorder() if Config.EVIDENCE_CLIPS_ENABLED else None
+    preview = PreviewServer(default_camera=CAMERA_ID).start() if Config.PREVIEW_ENABLED else None
+    boxes = []            # last analysis' boxes, kept on screen between analyses
+    status = ""
 
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
-            cx, cy = (x1+x2)//2, (y1+y2)//2
+    print("🚀 Crime Detection AI Started...")
 
-            if label == "person":
-                persons.append((cx, cy))
-            if label in ["knife", "gun"]:
-                weapons.append((cx, cy))
+    try:
+        for frame in frames:
+            if evidence_clips is not None:
+                # Every frame, analyzed or not, so clips play back smoothly
+                evidence_clips.push(CAMERA_ID, frame)
 
-    current_time = time.time()
+            due = scheduler.should_analyze(CAMERA_ID)
+            if not (due or follow_up):
+                # Motion rules compare consecutive frames only
+                prev_positions = {}
+                if not render(frame, boxes, status):
+                    break
+                continue
 
-    # ---------------- CRIME RULES ----------------
+            persons = []
+            weapons = []
+            boxes = []
 
-    # 🔴 1. WEAPON DETECTION
-    if persons and weapons:
-        send_incident("WEAPON_DETECTED", 0.95, frame)
+            if cascade is not None:
+                gate = cascade.gate(frame, CAMERA_ID)
+                persons = box_centers(gate.persons)
+                weapons = box_centers(gate.weapons)
+                boxes = labelled(gate.persons, "person") + labelled(gate.weapons, "weapon")
+            else:
+                results = model(frame, conf=0.5)
+                for r in results:
+                    for box in r.boxes:
+                        cls = int(box.cls[0])
+                        label = model.names[cls]
 
-    # 🔴 2. FIGHT DETECTION (fast + close motion)
-    if len(persons) >= 2:
-        speeds = []
-        for i, p in enumerate(persons):
-            if i in prev_positions:
-                speeds.append(distance(prev_positions[i], p))
+                        x1, y1, x2, y2 = map(int, box.xyxy[0])
+                        cx, cy = (x1+x2)//2, (y1+y2)//2
 
-        if speeds and max(speeds) > 40:   # fast movement threshold
-            send_incident("FIGHT_DETECTED", 0.9, frame)
+                        if label == "person":
+                            persons.append((cx, cy))
+                        if label in ["knife", "gun"]:
+                            weapons.append((cx, cy))
+                        if label == "person" or label in ["knife", "gun"]:
+                            boxes.append((x1, y1, x2, y2, label))
 
-    # 🟠 3. LOITERING
-    for i, p in enumerate(persons):
-        if i not in loitering_start:
-            loitering_start[i] = current_time
-        elif current_time - loitering_start[i] > 20:
-            send_incident("LOITERING", 0.7, frame)
+            current_time = time.time()
+            fired = []
 
-    # 🟠 4. RUNNING / PANIC
-    for i, p in enumerate(persons):
-        if i in prev_positions:
-            if distance(prev_positions[i], p) > 60:
-                send_incident("SUSPICIOUS_RUNNING", 0.8, frame)
+            # ---------------- CRIME RULES ----------------
 
-    prev_positions = {i: p for i, p in enumerate(persons)}
+            # 🔴 1. WEAPON DETECTION
+            if persons and weapons:
+                fired.append(send_incident("WEAPON_DETECTED", 0.95, frame))
+
+            # 🔴 2. FIGHT DETECTION (fast + close motion)
+            if len(persons) >= 2:
+                speeds = []
+                for i, p in enumerate(persons):
+                    if i in prev_positions:
+                        speeds.append(distance(prev_positions[i], p))
+
+                if speeds and max(speeds) > 40:   # fast movement threshold
+                    fired.append(send_incident("FIGHT_DETECTED", 0.9, frame))
+
+            # 🟠 3. LOITERING
+            for i, p in enumerate(persons):
+                if i not in loitering_start:
+                    loitering_start[i] = current_time
+                elif current_time - loitering_start[i] > 20:
+                    fired.append(send_incident("LOITERING", 0.7, frame))
+
+            # 🟠 4. RUNNING / PANIC
+            for i, p in enumerate(persons):
+                if i in prev_positions:
+                    if distance(prev_positions[i], p) > 60:
+                        fired.append(send_incident("SUSPICIOUS_RUNNING", 0.8, frame))
+
+            # 🔴 5. POSE RULES (cascade only; weapon boxes are fused into the pose signals)
+            if cascade is not None and gate.has_persons:
+                pose = cascade.pose(frame, gate, CAMERA_ID)
+                if pose["crime_detected"]:
+                    fired.append(send_incident(pose["crime_type"], pose["confidence"] / 100.0, frame,
+                                               threat_level=pose["threat_level"]))
+
+            prev_positions = {i: p for i, p in enumerate(persons)}
+
+            # Idle scenes drop to a low analysis rate, active ones step back up
+            scheduler.update(CAMERA_ID, len(persons), highest_level(fired), len(fired))
+            follow_up = due and bool(persons)
+            status = f"{scheduler.level(CAMERA_ID)} | threat {highest_level(fired)}"
+
+            if not render(frame, boxes, status):
+                break
+    except KeyboardInterrupt:
+        # Headless runs have no window to press q in
+        print("🛑 Stopping...")
+
+    frames.close()
+    if Config.DISPLAY_ENABLED:
+        cv2.destroyAllWindows()
+    if preview is not None:
+        preview.stop()
+    aggregator.close()
+    alert_store.close()
+    if evidence_clips is not None:
+        evidence_clips.wait(timeout=Config.EVIDENCE_POST_ROLL + 2.0)
 
-    cv2.imshow("Crime Detection AI", frame)
-    if cv2.waitKey(1) & 0xFF == ord("q"):
-        break
 
-cap.release()
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Event Bus Module - In-process pub/sub for analysis results
+
+Every analysis result is published once. Subscribers (the /events SSE
+endpoint in stream_server.py) receive the events that pass their filters:
+
+    cameras     set of camera ids, or None for all cameras
+    min_level   lowest threat level delivered (LOW .. CRITICAL)
+
+Each subscriber has its own bounded queue. A slow subscriber loses its
+oldest events (counted in ``dropped``) instead of holding memory or
+blocking publishers, which run in request threads.
+
+Events carry increasing ids. The bus keeps the last EVENT_REPLAY_SIZE
+events, so a client reconnecting with its last seen id (SSE Last-Event-ID)
+gets what it missed, as far back as the replay ring reaches.
+
+Usage:
+    bus = EventBus()
+    sub = bus.subscribe(cameras={"cam01"}, min_level="HIGH", notify=wake_up)
+    bus.publish({"camera_id": "cam01", "threat_level": "HIGH", ...})
+    for event in sub.drain():
+        ...
+    sub.close()
+"""
+
+import itertools
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+from config import Config
+from incident_aggregator import severity_of
+
+
+class Subscription:
+    """One subscriber's filters and bounded drop-oldest queue"""
+
+    def __init__(self, bus, cameras: Optional[Iterable[str]], min_level: str, maxlen: int,
+                 notify: Optional[Callable[[], None]] = None):
+        self.bus = bus
+        self.cameras = set(cameras) if cameras else None
+        self.min_severity = severity_of(min_level)
+        self.queue = deque(maxlen=maxlen)
+        self.notify = notify
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    def matches(self, event: Dict) -> bool:
+        if self.cameras is not None and event.get("camera_id") not in self.cameras:
+            return False
+        return severity_of(event.get("threat_level")) >= self.min_severity
+
+    def _push(self, event: Dict) -> None:
+        with self._lock:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1  # deque drops the oldest on append
+            self.queue.append(event)
+        self._ready.set()
+        if self.notify is not None:
+            self.notify()
+
+    def drain(self) -> List[Dict]:
+        """Everything queued, oldest first"""
+        with self._lock:
+            events = list(self.queue)
+            self.queue.clear()
+            self._ready.clear()
+            self.delivered += len(events)
+        return events
+
+    def wait(self, timeout: float = None) -> bool:
+        """Block until an event is queued (for thread-based consumers)"""
+        return self._ready.wait(timeout)
+
+    def close(self) -> None:
+        self.bus.unsubscribe(self)
+
+
+class EventBus:
+    """Thread-safe fan-out of events to filtered subscribers"""
+
+    def __init__(self, queue_size=None, replay_size=None, max_subscribers=None):
+        self.queue_size = queue_size or Config.EVENT_QUEUE_SIZE
+        self.max_subscribers = max_subscribers or Config.EVENT_MAX_SUBSCRIBERS
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._replay = deque(maxlen=Config.EVENT_REPLAY_SIZE if replay_size is None else replay_size)
+        self._subscribers: List[Subscription] = []
+        self.stats = {"published": 0, "subscriptions_total": 0, "rejected_subscribers": 0}
+
+    def publish(self, event: Dict) -> int:
+        """Assign an id and fan the event out; returns the id"""
+        with self._lock:
+            event_id = next(self._ids)
+            event = {"id": event_id, **event}
+            self._replay.append(event)
+            self.stats["published"] += 1
+            # Pushed under the bus lock so every subscriber sees ids in order
+            for sub in self._subscribers:
+                if sub.matches(event):
+                    sub._push(event)
+        return event_id
+
+    def subscribe(self, cameras: Optional[Iterable[str]] = None, min_level: str = "LOW",
+                  notify: Optional[Callable[[], None]] = None,
+                  last_event_id: Optional[int] = None) -> Optional[Subscription]:
+        """
+        New subscription, or None when EVENT_MAX_SUBSCRIBERS is reached.
+        With ``last_event_id`` the replay ring's newer matching events are
+        queued first.
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                self.stats["rejected_subscribers"] += 1
+                return None
+            sub = Subscription(self, cameras, min_level, self.queue_size, notify)
+            if last_event_id is not None:
+                for event in self._replay:
+                    if event["id"] > last_event_id and sub.matches(event):
+                        sub._push(event)
+            self._subscribers.append(sub)
+            self.stats["subscriptions_total"] += 1
+            return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            sub.closed = True
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "subscribers": len(self._subscribers),
+                "queued": sum(len(s.queue) for s in self._subscribers),
+                "dropped": sum(s.dropped for s in self._subscribers),
+                "last_id": self._replay[-1]["id"] if self._replay else 0,
+            }
@@ -0,0 +1,299 @@
+"""
+Evidence Buffer Module - Pre/post-event video clips from a fixed-memory ring
+
+Every camera gets a ring of preallocated numpy frame slots holding the
+last EVIDENCE_PRE_ROLL seconds (plus a little headroom) at EVIDENCE_FPS.
+Memory per camera is fixed at creation, however long the camera runs. At
+most EVIDENCE_MAX_CAMERAS rings exist at once: rings idle for
+EVIDENCE_IDLE_TIMEOUT seconds are evicted to make room, ``release()`` drops
+one when its stream ends, and frames from further cameras are not buffered.
+
+The live loop only ``push()``es: one copy into the next slot, no
+allocation, no encoding. ``request_clip()`` returns a clip path at once and
+a background worker writes the window [trigger - pre_roll, trigger +
+post_roll] to ALERT_DIR/clips. It starts with the buffered pre-roll and then
+follows new frames as they arrive. Slots carry sequence numbers, so a
+frame overwritten while the worker copies it is skipped instead of being
+torn. A second incident on the same camera while a clip is still recording
+extends that clip instead of starting another, up to EVIDENCE_MAX_CLIP
+seconds in total.
+
+Usage:
+    evidence = EvidenceRecorder()
+    evidence.push("cam01", frame)                          # every frame
+    clip = evidence.request_clip("cam01", label="FIGHT")   # on an incident
+"""
+
+import os
+import math
+import time
+import threading
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+import cv2
+import numpy as np
+
+from config import Config
+
+
+class FrameRing:
+    """Preallocated ring of frames for one camera (one writer, many readers)"""
+
+    def __init__(self, slots: int, shape):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.frames = np.zeros((slots,) + self.shape, dtype=np.uint8)
+        self.timestamps = np.zeros(slots, dtype=np.float64)
+        self.seqs = np.full(slots, -1, dtype=np.int64)  # -1: empty or being written
+        self.written = 0
+        self.cond = threading.Condition()
+
+    def push(self, frame, timestamp: float) -> None:
+        seq = self.written
+        slot = seq % self.slots
+        self.seqs[slot] = -1
+        if frame.shape == self.shape:
+            np.copyto(self.frames[slot], frame)
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=self.frames[slot],
+                       interpolation=cv2.INTER_AREA)
+        self.timestamps[slot] = timestamp
+        self.seqs[slot] = seq
+        with self.cond:
+            self.written = seq + 1
+            self.cond.notify_all()
+
+    def oldest(self) -> int:
+        return max(0, self.written - self.slots + 1)
+
+    def read(self, seq: int, out: np.ndarray) -> Optional[float]:
+        """Copy frame ``seq`` into ``out``; None if it is gone or was overwritten meanwhile"""
+        slot = seq % self.slots
+        if self.seqs[slot] != seq:
+            return None
+        timestamp = float(self.timestamps[slot])
+        np.copyto(out, self.frames[slot])
+        if self.seqs[slot] != seq:
+            return None
+        return timestamp
+
+    def wait_for(self, seq: int, timeout: float) -> bool:
+        """Block until frame ``seq`` has been written"""
+        with self.cond:
+            return self.cond.wait_for(lambda: self.written > seq, timeout)
+
+    @property
+    def nbytes(self) -> int:
+        return self.frames.nbytes + self.timestamps.nbytes + self.seqs.nbytes
+
+
+class _ClipJob:
+    __slots__ = ("camera_id", "path", "start", "end", "label", "frames", "lost", "done")
+
+    def __init__(self, camera_id, path, start, end, label):
+        self.camera_id = camera_id
+        self.path = path
+        self.start = start
+        self.end = end
+        self.label = label
+        self.frames = 0
+        self.lost = 0
+        self.done = threading.Event()
+
+
+class EvidenceRecorder:
+    """Per-camera frame rings plus background clip writers"""
+
+    def __init__(self, clip_dir=None, pre_roll=None, post_roll=None, fps=None, max_width=None,
+                 max_active_clips=None, max_cameras=None, idle_timeout=None, max_clip=None,
+                 on_clip: Callable[[Dict], None] = None):
+        self.clip_dir = clip_dir or os.path.join(Config.ALERT_DIR, "clips")
+        self.pre_roll = Config.EVIDENCE_PRE_ROLL if pre_roll is None else pre_roll
+        self.post_roll = Config.EVIDENCE_POST_ROLL if post_roll is None else post_roll
+        self.fps = fps or Config.EVIDENCE_FPS
+        self.max_width = max_width or Config.EVIDENCE_MAX_WIDTH
+        self.max_active_clips = max_active_clips or Config.EVIDENCE_MAX_ACTIVE_CLIPS
+        self.max_cameras = max_cameras or Config.EVIDENCE_MAX_CAMERAS
+        self.idle_timeout = idle_timeout or Config.EVIDENCE_IDLE_TIMEOUT
+        self.max_clip = max_clip or Config.EVIDENCE_MAX_CLIP
+        self.on_clip = on_clip
+        # Pre-roll plus two seconds of headroom for the writer to stay ahead of the live loop
+        self.slots = int(math.ceil((self.pre_roll + 2.0) * self.fps))
+        os.makedirs(self.clip_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._rings: Dict[str, FrameRing] = {}
+        self._last_push: Dict[str, float] = {}
+        self._active: Dict[str, _ClipJob] = {}
+        self.stats = {"clips_requested": 0, "clips_written": 0, "clips_extended": 0,
+                      "clips_skipped": 0, "frames_lost": 0, "rings_evicted": 0,
+                      "cameras_refused": 0}
+
+    # -------------------------------------------------
+    # LIVE LOOP SIDE
+    # -------------------------------------------------
+    def _ring_for(self, camera_id, frame, now) -> Optional[FrameRing]:
+        """The camera's ring, created on first use; None while every ring is taken"""
+        ring = self._rings.get(camera_id)
+        if ring is not None:
+            return ring
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            h, w = int(round(h * self.max_width / w)), self.max_width
+        channels = frame.shape[2] if frame.ndim == 3 else 1
+        shape = (h, w, channels) if channels > 1 else (h, w)
+        with self._lock:
+            if camera_id not in self._rings:
+                if len(self._rings) >= self.max_cameras:
+                    self._evict_idle(now)
+                if len(self._rings) >= self.max_cameras:
+                    self.stats["cameras_refused"] += 1
+                    return None
+                self._rings[camera_id] = FrameRing(self.slots, shape)
+            return self._rings[camera_id]
+
+    def _evict_idle(self, now) -> None:
+        """Drop rings of cameras that stopped pushing frames (caller holds the lock)"""
+        for camera_id in list(self._rings):
+            if now - self._last_push.get(camera_id, 0.0) > self.idle_timeout:
+                self._drop(camera_id)
+                self.stats["rings_evicted"] += 1
+
+    def _drop(self, camera_id) -> None:
+        # A clip still being written keeps its own reference to the ring
+        self._rings.pop(camera_id, None)
+        self._last_push.pop(camera_id, None)
+        job = self._active.get(camera_id)
+        if job is not None and job.done.is_set():
+            del self._active[camera_id]
+
+    def release(self, camera_id) -> None:
+        """Free a camera's ring, e.g. when its stream disconnects"""
+        with self._lock:
+            self._drop(camera_id)
+
+    def push(self, camera_id, frame, timestamp: float = None) -> None:
+        """Store a frame if the camera's ring is due one (EVIDENCE_FPS)"""
+        timestamp = time.time() if timestamp is None else timestamp
+        if timestamp - self._last_push.get(camera_id, float("-inf")) < 0.9 / self.fps:
+            return
+        ring = self._ring_for(camera_id, frame, timestamp)
+        if ring is None:
+            return
+        self._last_push[camera_id] = timestamp
+        ring.push(frame, timestamp)
+
+    def request_clip(self, camera_id, label: str = "incident", timestamp: float = None) -> Optional[str]:
+        """
+        Start (or extend) a clip around ``timestamp``; returns its path
+        immediately, or None when the camera has no frames or too many clips
+        are being written.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self.stats["clips_requested"] += 1
+            job = self._active.get(camera_id)
+            if job is not None and not job.done.is_set() and timestamp <= job.end:
+                job.end = min(max(job.end, timestamp + self.post_roll), job.start + self.max_clip)
+                self.stats["clips_extended"] += 1
+                return job.path
+
+            ring = self._rings.get(camera_id)
+            active = sum(1 for j in self._active.values() if not j.done.is_set())
+            if ring is None or active >= self.max_active_clips:
+                self.stats["clips_skipped"] += 1
+                return None
+
+            stamp = datetime.fromtimestamp(timestamp).strftime("%Y%m%d_%H%M%S")
+            safe_label = "".join(c if c.isalnum() else "_" for c in str(label))[:40]
+            safe_camera = "".join(c if c.isalnum() else "_" for c in str(camera_id))[:40]
+            path = os.path.join(self.clip_dir, f"{safe_camera}_{stamp}_{safe_label}.mp4")
+            job = _ClipJob(camera_id, path, timestamp - self.pre_roll,
+                           timestamp + self.post_roll, label)
+            self._active[camera_id] = job
+
+        threading.Thread(target=self._write_clip, args=(ring, job), name="evidence-clip",
+                         daemon=True).start()
+        return path
+
+    # -------------------------------------------------
+    # CLIP WRITER
+    # -------------------------------------------------
+    def _write_clip(self, ring: FrameRing, job: _ClipJob) -> None:
+        scratch = np.empty(ring.shape, dtype=np.uint8)
+        height, width = ring.shape[:2]
+        # OpenCV picks the container from the extension, so keep ".mp4" last
+        tmp_path = job.path[:-len(".mp4")] + ".part.mp4"
+        writer = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*"mp4v"), self.fps,
+                                 (width, height), len(ring.shape) == 3)
+        try:
+            self._follow(ring, job, writer, scratch)
+        except Exception as e:
+            print(f"⚠️ Evidence clip failed ({job.path}): {e}")
+            job.frames = 0
+        finally:
+            writer.release()
+
+        with self._lock:
+            self.stats["frames_lost"] += job.lost
+            if job.frames:
+                os.replace(tmp_path, job.path)
+                self.stats["clips_written"] += 1
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            job.done.set()
+
+        if job.frames:
+            print(f"🎞️ Evidence clip: {job.path} ({job.frames} frames, {job.lost} lost)")
+            if self.on_clip is not None:
+                self.on_clip({"camera_id": job.camera_id, "path": job.path, "label": job.label,
+                              "frames": job.frames, "lost": job.lost})
+
+    @staticmethod
+    def _follow(ring: FrameRing, job: _ClipJob, writer, scratch) -> None:
+        """Write buffered frames from the window start, then live ones until its end"""
+        # First buffered frame inside the window
+        seq = ring.oldest()
+        while seq < ring.written:
+            timestamp = ring.read(seq, scratch)
+            if timestamp is not None and timestamp >= job.start:
+                break
+            seq += 1
+
+        while True:
+            if seq >= ring.written:
+                if time.time() > job.end + 1.0:
+                    break  # Camera stopped delivering frames
+                ring.wait_for(seq, timeout=0.5)
+                continue
+            if seq < ring.oldest():
+                # Fell behind the live loop; jump to the oldest frame still held
+                job.lost += ring.oldest() - seq
+                seq = ring.oldest()
+            timestamp = ring.read(seq, scratch)
+            seq += 1
+            if timestamp is None:
+                job.lost += 1
+                continue
+            if timestamp > job.end:
+                break
+            writer.write(scratch)
+            job.frames += 1
+
+    def wait(self, timeout: float = None) -> None:
+        """Block until every clip currently being written is finished"""
+        with self._lock:
+            jobs = list(self._active.values())
+        for job in jobs:
+            job.done.wait(timeout)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "cameras": len(self._rings),
+                "slots_per_camera": self.slots,
+                "buffer_mb": round(sum(r.nbytes for r in self._rings.values()) / 2**20, 1),
+                "active_clips": sum(1 for j in self._active.values() if not j.done.is_set()),
+            }
@@ -0,0 +1,285 @@
+"""
+Frame Transport Module - Zero-copy frame hand-off between processes
+
+A ``SharedFrameRing`` is one ``multiprocessing.shared_memory`` block holding
+a small header, per-slot bookkeeping and ``capacity`` fixed-size frames.
+A capture process decodes frames straight into a free slot; inference
+workers get numpy views onto the same memory, so frames are never pickled
+or copied between processes.
+
+Torn reads are prevented with per-slot sequence numbers (odd while a slot
+is being written) and reader pins: the writer only reuses slots nobody is
+reading, and drops the new frame if every slot is pinned, so capture
+never blocks on a slow consumer.
+
+Usage (producer side):
+    ring = SharedFrameRing.create(capacity=8, shape=(480, 640, 3))
+    proc = multiprocessing.Process(target=capture_worker,
+                                   args=(ring.handle(), 0, stop_event))
+
+Usage (consumer side):
+    frame = ring.wait_latest(after=last_seq)
+    try:
+        model(frame.array)
+    finally:
+        frame.release()
+"""
+
+import time
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+# Header (int64): capacity, height, width, channels, latest_seq, latest_slot,
+#                 written, dropped
+H_CAPACITY, H_HEIGHT, H_WIDTH, H_CHANNELS, H_LATEST_SEQ, H_LATEST_SLOT, H_WRITTEN, H_DROPPED = range(8)
+HEADER_FIELDS = 8
+# Per slot (int64): seq, pins; per slot (float64): timestamp
+SLOT_FIELDS = 3
+
+PINNED_BACKOFF = 0.005  # capture_worker wait (seconds) while every slot is pinned
+
+
+class FrameView:
+    """A pinned, read-only numpy view of one slot; call ``release()`` when done"""
+
+    __slots__ = ("ring", "slot", "seq", "timestamp", "array", "_released")
+
+    def __init__(self, ring, slot, seq, timestamp, array):
+        self.ring = ring
+        self.slot = slot
+        self.seq = seq
+        self.timestamp = timestamp
+        self.array = array
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self.ring._unpin(self.slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class SharedFrameRing:
+    """Fixed-capacity ring of frames in shared memory (one writer, many readers)"""
+
+    def __init__(self, shm, lock, owner):
+        self.shm = shm
+        self.lock = lock
+        self.owner = owner
+
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        self.capacity = int(header[H_CAPACITY])
+        self.shape = (int(header[H_HEIGHT]), int(header[H_WIDTH]), int(header[H_CHANNELS]))
+        self.header = header
+
+        offset = header.nbytes
+        self.seqs = np.ndarray((self.capacity,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.seqs.nbytes
+        self.pins = np.ndarray((self.capacity,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += self.pins.nbytes
+        self.timestamps = np.ndarray((self.capacity,), dtype=np.float64, buffer=shm.buf,
+                                     offset=offset)
+        offset += self.timestamps.nbytes
+        self.frames = np.ndarray((self.capacity,) + self.shape, dtype=np.uint8,
+                                 buffer=shm.buf, offset=offset)
+        self._next_slot = 0
+        self._writing = None
+
+    # -------------------------------------------------
+    # LIFECYCLE
+    # -------------------------------------------------
+    @classmethod
+    def create(cls, capacity: int, shape: Tuple[int, int, int], name: str = None,
+               lock=None) -> "SharedFrameRing":
+        if capacity < 2:
+            raise ValueError("capacity must be at least 2")
+        height, width, channels = shape
+        size = 8 * (HEADER_FIELDS + SLOT_FIELDS * capacity) + capacity * height * width * channels
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        header = np.ndarray((HEADER_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        header[:] = 0
+        header[H_CAPACITY] = capacity
+        header[H_HEIGHT], header[H_WIDTH], header[H_CHANNELS] = height, width, channels
+        header[H_LATEST_SEQ] = -1
+        header[H_LATEST_SLOT] = -1
+        ring = cls(shm, lock or multiprocessing.Lock(), owner=True)
+        ring.seqs[:] = 0
+        ring.pins[:] = 0
+        del header
+        return ring
+
+    def handle(self):
+        """Picklable handle for ``attach`` in another process"""
+        return self.shm.name, self.lock
+
+    @classmethod
+    def attach(cls, handle) -> "SharedFrameRing":
+        name, lock = handle
+        return cls(shared_memory.SharedMemory(name=name), lock, owner=False)
+
+    def close(self) -> None:
+        # Views must be dropped before the mapping can be closed
+        self.header = self.seqs = self.pins = self.timestamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A caller still holds a frame view; the mapping goes with the process
+        if self.owner:
+            self.shm.unlink()
+
+    # -------------------------------------------------
+    # WRITER
+    # -------------------------------------------------
+    def begin_write(self) -> Optional[Tuple[int, np.ndarray]]:
+        """
+        Claim a free slot and mark it as being written.
+
+        Returns:
+            (slot, writable view) or None when every slot is pinned by readers
+        """
+        with self.lock:
+            for step in range(self.capacity):
+                slot = (self._next_slot + step) % self.capacity
+                if self.pins[slot] == 0 and slot != self.header[H_LATEST_SLOT]:
+                    break
+            else:
+                self.header[H_DROPPED] += 1
+                return None
+            seq = int(self.header[H_WRITTEN])
+            self.seqs[slot] = 2 * seq + 1  # odd: write in progress
+        self._next_slot = (slot + 1) % self.capacity
+        self._writing = (slot, seq)
+        return slot, self.frames[slot]
+
+    def commit_write(self, timestamp: float = None) -> int:
+        """Publish the slot claimed by ``begin_write`` as the latest frame"""
+        slot, seq = self._writing
+        self._writing = None
+        with self.lock:
+            self.timestamps[slot] = time.time() if timestamp is None else timestamp
+            self.seqs[slot] = 2 * seq + 2  # even: complete
+            self.header[H_LATEST_SEQ] = seq
+            self.header[H_LATEST_SLOT] = slot
+            self.header[H_WRITTEN] = seq + 1
+        return seq
+
+    def abort_write(self) -> None:
+        slot, _ = self._writing
+        self._writing = None
+        with self.lock:
+            self.seqs[slot] = 0
+
+    def write(self, frame: np.ndarray, timestamp: float = None) -> Optional[int]:
+        """Copy an already decoded frame into the ring (one copy, no pickling)"""
+        claimed = self.begin_write()
+        if claimed is None:
+            return None
+        _, view = claimed
+        if frame.shape == view.shape:
+            np.copyto(view, frame)
+        else:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=view)
+        return self.commit_write(timestamp)
+
+    # -------------------------------------------------
+    # READERS
+    # -------------------------------------------------
+    def acquire_latest(self, after: int = -1) -> Optional[FrameView]:
+        """Pin and return the newest complete frame with seq > ``after``"""
+        with self.lock:
+            seq = int(self.header[H_LATEST_SEQ])
+            if seq <= after:
+                return None
+            slot = int(self.header[H_LATEST_SLOT])
+            if self.seqs[slot] != 2 * seq + 2:
+                return None
+            self.pins[slot] += 1
+            timestamp = float(self.timestamps[slot])
+        view = self.frames[slot]
+        view.flags.writeable = False
+        return FrameView(self, slot, seq, timestamp, view)
+
+    def wait_latest(self, after: int = -1, timeout: float = 1.0,
+                    poll_interval: float = 0.001) -> Optional[FrameView]:
+        deadline = time.monotonic() + timeout
+        while True:
+            frame = self.acquire_latest(after)
+            if frame is not None or time.monotonic() >= deadline:
+                return frame
+            time.sleep(poll_interval)
+
+    def _unpin(self, slot):
+        with self.lock:
+            self.pins[slot] -= 1
+
+    def stats(self):
+        return {
+            "capacity": self.capacity,
+            "shape": self.shape,
+            "written": int(self.header[H_WRITTEN]),
+            "dropped": int(self.header[H_DROPPED]),
+            "pinned": int(np.count_nonzero(self.pins)),
+        }
+
+
+# --------------------------------------------------
+# CAPTURE PROCESS
+# --------------------------------------------------
+
+def capture_worker(handle, source, stop_event, fps_limit: float = 0) -> None:
+    """
+    Process target: decode frames from ``source`` directly into the ring.
+
+    ``cap.read(view)`` reuses the slot buffer when the camera delivers the
+    ring's frame size; otherwise the frame is resized into the slot.
+    """
+    ring = SharedFrameRing.attach(handle)
+    height, width, _ = ring.shape
+    cap = cv2.VideoCapture(source)
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    min_interval = 1.0 / fps_limit if fps_limit else 0.0
+    last = 0.0
+
+    try:
+        while not stop_event.is_set():
+            claimed = ring.begin_write()
+            if claimed is None:
+                # Every slot pinned: grab and drop so the camera buffer stays
+                # fresh, then back off instead of spinning (files grab instantly)
+                if not cap.grab():
+                    break
+                stop_event.wait(PINNED_BACKOFF)
+                continue
+            _, view = claimed
+            ok, image = cap.read(view)
+            if not ok:
+                ring.abort_write()
+                break
+            if image.ctypes.data != view.ctypes.data:
+                if image.shape != view.shape:
+                    cv2.resize(image, (width, height), dst=view)
+                else:
+                    np.copyto(view, image)
+            ring.commit_write()
+
+            if min_interval:
+                now = time.monotonic()
+                sleep = min_interval - (now - last)
+                if sleep > 0:
+                    time.sleep(sleep)
+                last = time.monotonic()
+    finally:
+        cap.release()
+        stop_event.set()
+        ring.close()
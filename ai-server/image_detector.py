@@ -5,8 +5,11 @@ Image Upload API for Crime Detection
 
 import os
 import cv2
+import atexit
 import json
+import time
 from datetime import datetime
+from functools import wraps
 from pathlib import Path
 
 import numpy as np
@@ -14,7 +17,21 @@ from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 
+from adaptive_scheduler import AnalysisScheduler
+from admission import AdmissionController, Overloaded
+from analysis_history import AnalysisHistory
+from cascade import CascadeDetector
+from config import Config
+from event_bus import EventBus
+from evidence_buffer import EvidenceRecorder
 from pose_detector import PoseCrimeDetector
+from profiling import profiler
+from quality_controller import QualityController
+from second_opinion import SecondOpinion
+from keypoint_recording import KeypointRecorder
+from keypoint_codec import decode_frames, frames_from_json
+from stream_server import StreamServer
+from tiling import TiledPoseInference
 
 # --------------------------------------------------
 # INITIALIZE APP
@@ -26,6 +43,7 @@ CORS(app)  # Enable CORS for cross-origin requests
 UPLOAD_FOLDER = "./ai_uploads"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "bmp", "gif", "tiff"}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
+LOOPBACK_ADDRS = ("127.0.0.1", "::1")  # admin callers allowed when ADMIN_TOKEN is unset
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
@@ -35,11 +53,49 @@ Path(UPLOAD_FOLDER).mkdir(parents=True, exist_ok=True)
 # Initialize detector with optional model selection
 try:
     pose_detector = PoseCrimeDetector()
+    profiler.attach(pose_detector)
+    if Config.RECORD_KEYPOINTS_DIR:
+        pose_detector.recorder = KeypointRecorder(Config.RECORD_KEYPOINTS_DIR)
+        atexit.register(pose_detector.recorder.close)
+        print(f"⏺️ Recording keypoints to {Config.RECORD_KEYPOINTS_DIR}")
+    if Config.TILING_ENABLED:
+        pose_detector.tiler = TiledPoseInference(pose_detector)
     print("✅ PoseCrimeDetector initialized successfully")
 except Exception as e:
     print(f"❌ Error initializing detector: {e}")
     pose_detector = None
 
+# Optional cheap gate in front of pose (see cascade.py)
+cascade = None
+if pose_detector is not None and Config.CASCADE_ENABLED:
+    try:
+        cascade = CascadeDetector(pose_detector)
+        print(f"✅ Detection cascade enabled (gate: {Config.CASCADE_GATE_MODEL} @ {Config.CASCADE_GATE_IMGSZ}px)")
+    except Exception as e:
+        print(f"⚠️ Detection cascade disabled: {e}")
+
+admission = AdmissionController()
+scheduler = AnalysisScheduler()
+history = AnalysisHistory()
+# Every analysis is published here; stream_server serves it as SSE at /events
+event_bus = EventBus()
+# Steps quality down when inference latency or the admission queue grows
+quality = QualityController(queue_depth=admission.queue_depth)
+
+# Optional external review of gray-band frames (ENABLE_AI_ANALYSIS)
+second_opinion = None
+if Config.ENABLE_AI_ANALYSIS:
+    try:
+        second_opinion = SecondOpinion()
+        print(f"✅ Second opinion enabled for threat scores "
+              f"{Config.SECOND_OPINION_BAND_LOW:g}-{Config.SECOND_OPINION_BAND_HIGH:g}")
+    except Exception as e:
+        print(f"⚠️ Second opinion disabled: {e}")
+# WebSocket stream server, started alongside Flask in __main__
+stream_server = None
+# Streams are continuous video, so HIGH/CRITICAL results get a pre/post-event clip
+evidence_clips = EvidenceRecorder() if Config.EVIDENCE_CLIPS_ENABLED else None
+
 # --------------------------------------------------
 # HELPERS
 # --------------------------------------------------
@@ -71,9 +127,9 @@ def normalize_confidence(raw_confidence):
         return 0.0
 
 
-def preprocess_image(image):
+def preprocess_image(image, max_dim=1280):
     """
-    Preprocess image for better detection
+    Preprocess image for better detection (max_dim=None keeps full resolution)
     """
     # Convert to RGB if needed
     if len(image.shape) == 3 and image.shape[2] == 3:
@@ -81,8 +137,7 @@ def preprocess_image(image):
     
     # Resize if too large (maintain aspect ratio)
     h, w = image.shape[:2]
-    max_dim = 1280
-    if max(h, w) > max_dim:
+    if max_dim and max(h, w) > max_dim:
         scale = max_dim / max(h, w)
         new_w, new_h = int(w * scale), int(h * scale)
         image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_AREA)
@@ -95,73 +150,240 @@ def calculate_response_time(start_time):
     return round((datetime.now() - start_time).total_seconds() * 1000, 2)
 
 
+def request_deadline():
+    """
+    Seconds this request may wait for an inference slot, from the
+    X-Request-Deadline-Ms header or a deadline_ms form field
+    """
+    raw = request.headers.get("X-Request-Deadline-Ms") or request.form.get("deadline_ms")
+    try:
+        return max(float(raw), 0.0) / 1000.0 if raw else None
+    except ValueError:
+        return None
+
+
+def overloaded_response(error, start_time):
+    """503 with Retry-After for a request shed by admission control"""
+    response = jsonify({
+        "success": False,
+        "type": "OVERLOADED",
+        "confidence": 0.0,
+        "message": error.reason,
+        "retry_after": error.retry_after,
+        "response_time_ms": calculate_response_time(start_time)
+    })
+    response.status_code = 503
+    response.headers["Retry-After"] = str(error.retry_after)
+    return response
+
+
+def require_admin(view):
+    """Reject admin requests without the X-Admin-Token, or from other hosts when none is set"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if Config.ADMIN_TOKEN:
+            allowed = request.headers.get("X-Admin-Token") == Config.ADMIN_TOKEN
+            message = "Invalid or missing admin token"
+        else:
+            # No token configured: admin endpoints answer local callers only
+            allowed = request.remote_addr in LOOPBACK_ADDRS
+            message = "Admin endpoints are local-only until ADMIN_TOKEN is set"
+        if not allowed:
+            return jsonify({
+                "success": False,
+                "type": "UNAUTHORIZED",
+                "message": message
+            }), 401
+        return view(*args, **kwargs)
+    return wrapper
+
+
 # --------------------------------------------------
 # CORE ANALYSIS
 # --------------------------------------------------
-def analyze_image(image):
+VIOLENT_CRIME_TYPES = [
+    "Fight / Physical Violence",
+    "Physical Assault",
+    "Assault on Fallen Victim",
+    "Choking / Attempted Murder",
+    "Assault with Weapon",
+    "Kidnapping / Abduction",
+    "Crowd Violence / Riot"
+]
+
+
+def error_detection(error_type):
+    """Detection payload for a failed or unavailable analysis"""
+    return {
+        "type": error_type,
+        "confidence": 0.0,
+        "crime_detected": 0,
+        "threat_level": "LOW",
+        "persons_detected": 0,
+        "activities": [],
+        "signals": [],
+    }
+
+
+def format_detection(result):
+    """
+    Normalise a PoseCrimeDetector result into the API detection payload
+    """
+    confidence = normalize_confidence(
+        result.get("confidence", 0.0)
+    )
+
+    crime_type = result.get("crime_type", "NO_CRIME")
+
+    # 🔥 FIX: violent crimes are crimes even with moderate confidence
+    crime_detected = (
+        result.get("crime_detected", False)
+        or crime_type in VIOLENT_CRIME_TYPES
+    )
+    
+    return {
+        "type": crime_type,
+        "confidence": confidence,
+        "crime_detected": int(crime_detected),
+        "threat_level": result.get("threat_level", "LOW"),
+        "persons_detected": int(result.get("persons_detected", 0)),
+        "activities": result.get("activities", []),
+        "signals": result.get("signals", []),
+        "threat_score": result.get("threat_score", 0),
+        "raw_confidence": result.get("confidence", 0.0),
+    }
+
+
+def record_result(camera_id, detection):
+    """Feed history rollups and live /events subscribers"""
+    camera_id = camera_id or "Unknown"
+    history.record(camera_id, detection)
+    event_bus.publish({"camera_id": camera_id, "timestamp": datetime.now().isoformat(),
+                       **detection})
+
+
+def analyze_image(image, camera_id=None):
     """
     Runs pose-based crime detection with preprocessing
     """
     if pose_detector is None:
-        return {
-            "type": "SYSTEM_ERROR",
-            "confidence": 0.0,
-            "crime_detected": 0,
-            "threat_level": "LOW",
-            "persons_detected": 0,
-            "activities": [],
-            "signals": [],
-        }
+        return error_detection("SYSTEM_ERROR")
     
     try:
-        # Preprocess image
-        processed_image = preprocess_image(image)
-        
-        # Run detection
-        result = pose_detector.analyze(processed_image)
+        tier = quality.current()
+        with profiler.profile_request():
+            started = time.perf_counter()
+            # Preprocess image; frames headed for tiled inference keep full resolution
+            tiler = pose_detector.tiler
+            tiled = tier.tiling and tiler is not None and tiler.should_tile(image, camera_id)
+            processed_image = preprocess_image(image, max_dim=None if tiled else tier.max_dim)
+            # Rules and temporal history see the full tier's scale whatever the
+            # tier or tiling, so their pixel thresholds mean the same everywhere
+            rule_dim = min(max(image.shape[:2]), quality.tiers[0].max_dim)
+            scale = rule_dim / max(processed_image.shape[:2])
+
+            # Run detection (gate first when the cascade is on)
+            detector = cascade or pose_detector
+            result = detector.analyze(processed_image, camera_id=camera_id, tier=tier, scale=scale)
+            quality.observe(time.perf_counter() - started)
         
-        confidence = normalize_confidence(
-            result.get("confidence", 0.0)
-        )
+        detection = format_detection(result)
+        detection["quality_tier"] = tier.name
+        record_result(camera_id, detection)
+        return detection
+    except Exception as e:
+        print(f"Error in analyze_image: {e}")
+        return error_detection("ANALYSIS_ERROR")
 
-        crime_type = result.get("crime_type", "NO_CRIME")
-
-        # 🔥 FIX: violent crimes are crimes even with moderate confidence
-        crime_detected = (
-            result.get("crime_detected", False)
-            or crime_type in [
-                "Fight / Physical Violence",
-                "Physical Assault",
-                "Assault on Fallen Victim",
-                "Choking / Attempted Murder",
-                "Assault with Weapon",
-                "Kidnapping / Abduction",
-                "Crowd Violence / Riot"
-            ]
-        )
+
+def request_second_opinion(camera_id, image, detection):
+    """
+    Queue an external review for an ambiguous frame; returns {"id", "status"}
+    to poll at /second-opinion/<id>, or None. Never waits for the result.
+    """
+    if second_opinion is None or detection["type"] in ("SYSTEM_ERROR", "ANALYSIS_ERROR"):
+        return None
+    try:
+        return second_opinion.escalate(camera_id, image, detection)
+    except Exception as e:
+        print(f"Error escalating second opinion: {e}")
+        return None
+
+
+def analyze_keypoints(kps, conf=None, boxes=None, camera_id=None):
+    """
+    Runs the crime rules on keypoints computed elsewhere (no inference)
+    """
+    if pose_detector is None:
+        return error_detection("SYSTEM_ERROR")
+    
+    try:
+        tier = quality.current()
+        with profiler.profile_request():
+            result = pose_detector.analyze_keypoints(kps, conf, boxes, camera_id=camera_id,
+                                                     tier=tier)
         
+        detection = format_detection(result)
+        detection["quality_tier"] = tier.name
+        record_result(camera_id, detection)
+        return detection
+    except Exception as e:
+        print(f"Error in analyze_keypoints: {e}")
+        return error_detection("ANALYSIS_ERROR")
+
+
+def process_stream_frame(data, camera_id, deadline=None):
+    """
+    Analyze one JPEG frame from a WebSocket stream (runs in a worker thread)
+    """
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
         return {
-            "type": crime_type,
-            "confidence": confidence,
-            "crime_detected": int(crime_detected),
-            "threat_level": result.get("threat_level", "LOW"),
-            "persons_detected": int(result.get("persons_detected", 0)),
-            "activities": result.get("activities", []),
-            "signals": result.get("signals", []),
-            "threat_score": result.get("threat_score", 0),
-            "raw_confidence": result.get("confidence", 0.0),
+            "success": False,
+            "type": "INVALID_IMAGE",
+            "confidence": 0.0,
+            "message": "Could not decode frame as an image"
         }
-    except Exception as e:
-        print(f"Error in analyze_image: {e}")
+    
+    if evidence_clips is not None:
+        evidence_clips.push(camera_id, image)
+    
+    try:
+        with admission.admit(camera_id, deadline):
+            detection = analyze_image(image, camera_id=camera_id)
+    except Overloaded as e:
         return {
-            "type": "ANALYSIS_ERROR",
+            "success": False,
+            "type": "OVERLOADED",
             "confidence": 0.0,
-            "crime_detected": 0,
-            "threat_level": "LOW",
-            "persons_detected": 0,
-            "activities": [],
-            "signals": [],
+            "message": e.reason,
+            "retry_after": e.retry_after
         }
+    
+    admission.observe(camera_id, detection["threat_level"])
+    next_interval = scheduler.update(camera_id, detection["persons_detected"],
+                                     detection["threat_level"], len(detection["signals"]))
+    clip = None
+    if evidence_clips is not None and detection["threat_level"] in ("HIGH", "CRITICAL"):
+        clip = evidence_clips.request_clip(camera_id, label=detection["type"])
+    return {
+        "success": True,
+        "analysis_timestamp": datetime.now().isoformat(),
+        **detection,
+        "crime_detected": bool(detection["crime_detected"]),
+        "next_analysis_interval": next_interval,
+        "analysis_level": scheduler.level(camera_id),
+        "evidence_clip": clip,
+        "second_opinion": request_second_opinion(camera_id, image, detection),
+    }
+
+
+def reset_stream_history(camera_id):
+    """Temporal state and the evidence ring live as long as the camera's stream connection"""
+    if pose_detector is not None:
+        pose_detector.reset_history(camera_id)
+    if evidence_clips is not None:
+        evidence_clips.release(camera_id)
 
 
 # --------------------------------------------------
@@ -227,24 +449,32 @@ def detect_image():
                 "response_time_ms": calculate_response_time(start_time)
             }), 400
         
-        # Save file temporarily
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
-        
-        # Read and process image
-        image = cv2.imread(filepath)
-        if image is None:
-            return jsonify({
-                "success": False,
-                "type": "INVALID_IMAGE",
-                "confidence": 0.0,
-                "message": "Could not read image file",
-                "response_time_ms": calculate_response_time(start_time)
-            }), 400
+        try:
+            with admission.admit(camera_id, request_deadline()):
+                # Save file temporarily
+                filename = secure_filename(file.filename)
+                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                file.save(filepath)
+                
+                # Read and process image
+                image = cv2.imread(filepath)
+                if image is None:
+                    return jsonify({
+                        "success": False,
+                        "type": "INVALID_IMAGE",
+                        "confidence": 0.0,
+                        "message": "Could not read image file",
+                        "response_time_ms": calculate_response_time(start_time)
+                    }), 400
+                
+                # Run detection
+                detection = analyze_image(image, camera_id=camera_id)
+        except Overloaded as e:
+            return overloaded_response(e, start_time)
         
-        # Run detection
-        detection = analyze_image(image)
+        admission.observe(camera_id, detection["threat_level"])
+        next_interval = scheduler.update(camera_id, detection["persons_detected"],
+                                         detection["threat_level"], len(detection["signals"]))
         
         # Clean up temp file
         try:
@@ -267,6 +497,10 @@ def detect_image():
             "signals": detection["signals"],
             "threat_score": detection.get("threat_score", 0),
             "crime_detected": bool(detection["crime_detected"]),
+            "next_analysis_interval": next_interval,
+            "analysis_level": scheduler.level(camera_id),
+            "quality_tier": detection.get("quality_tier"),
+            "second_opinion": request_second_opinion(camera_id, image, detection),
             "response_time_ms": calculate_response_time(start_time),
             "system_status": "operational"
         }
@@ -289,6 +523,77 @@ def detect_image():
         }), 500
 
 
+@app.route('/analyze-keypoints', methods=['POST'])
+def analyze_keypoints_endpoint():
+    """
+    Rule evaluation for clients that already run a pose model.
+
+    Accepts the binary KPF1 format (application/octet-stream) or JSON, one
+    frame or many; see keypoint_codec.py for both layouts.
+    """
+    start_time = datetime.now()
+    
+    try:
+        if pose_detector is None:
+            return jsonify({
+                "success": False,
+                "type": "SYSTEM_ERROR",
+                "message": "Detection system not initialized",
+                "response_time_ms": calculate_response_time(start_time)
+            }), 500
+        
+        try:
+            if request.mimetype == "application/octet-stream":
+                frames = decode_frames(request.get_data())
+            else:
+                body = request.get_json(silent=True)
+                if body is None:
+                    raise ValueError("Expected JSON or application/octet-stream body")
+                frames = frames_from_json(body)
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "type": "INVALID_KEYPOINTS",
+                "message": str(e),
+                "response_time_ms": calculate_response_time(start_time)
+            }), 400
+        
+        default_camera = request.args.get("camera_id", "Unknown")
+        results = []
+        for frame in frames:
+            camera_id = frame["camera_id"] or default_camera
+            detection = analyze_keypoints(
+                frame["keypoints"], frame["conf"], frame["boxes"], camera_id=camera_id
+            )
+            next_interval = scheduler.update(camera_id, detection["persons_detected"],
+                                             detection["threat_level"], len(detection["signals"]))
+            results.append({
+                "camera_id": camera_id,
+                "timestamp": frame["timestamp"],
+                "analysis_timestamp": datetime.now().isoformat(),
+                **detection,
+                "crime_detected": bool(detection["crime_detected"]),
+                "next_analysis_interval": next_interval,
+                "analysis_level": scheduler.level(camera_id),
+            })
+        
+        return jsonify({
+            "success": True,
+            "results": results,
+            "total_processed": len(results),
+            "response_time_ms": calculate_response_time(start_time)
+        })
+        
+    except Exception as e:
+        print(f"Error in analyze_keypoints endpoint: {e}")
+        return jsonify({
+            "success": False,
+            "type": "ERROR",
+            "message": str(e),
+            "response_time_ms": calculate_response_time(start_time)
+        }), 500
+
+
 @app.route('/batch-detect', methods=['POST'])
 def batch_detect():
     """Batch processing endpoint for multiple images"""
@@ -302,21 +607,26 @@ def batch_detect():
                 "response_time_ms": calculate_response_time(start_time)
             }), 400
         
-        files = request.files.getlist('images')
+        files = [f for f in request.files.getlist('images') if f and allowed_file(f.filename)]
+        camera_id = request.form.get("camera_id")
         results = []
         
-        for file in files:
-            if file and allowed_file(file.filename):
-                # Read image directly from memory
-                file_bytes = np.frombuffer(file.read(), np.uint8)
-                image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-                
-                if image is not None:
-                    detection = analyze_image(image)
-                    results.append({
-                        "filename": secure_filename(file.filename),
-                        "detection": detection
-                    })
+        try:
+            with admission.admit(camera_id, request_deadline(), cost=max(len(files), 1)):
+                for file in files:
+                    # Read image directly from memory
+                    file_bytes = np.frombuffer(file.read(), np.uint8)
+                    image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
+                    
+                    if image is not None:
+                        detection = analyze_image(image, camera_id=camera_id)
+                        admission.observe(camera_id, detection["threat_level"])
+                        results.append({
+                            "filename": secure_filename(file.filename),
+                            "detection": detection
+                        })
+        except Overloaded as e:
+            return overloaded_response(e, start_time)
         
         return jsonify({
             "success": True,
@@ -333,6 +643,141 @@ def batch_detect():
         }), 500
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Load and admission-control counters"""
+    return jsonify({
+        "timestamp": datetime.now().isoformat(),
+        "admission": admission.snapshot(),
+        "scheduler": scheduler.snapshot(),
+        "cascade": cascade.snapshot() if cascade else None,
+        "tiling": pose_detector.tiler.snapshot() if pose_detector and pose_detector.tiler else None,
+        "stream": stream_server.snapshot() if stream_server else None,
+        "evidence": evidence_clips.snapshot() if evidence_clips else None,
+        "history": history.snapshot(),
+        "quality": quality.snapshot(),
+        "second_opinion": second_opinion.snapshot() if second_opinion else None,
+        "events": event_bus.snapshot()
+    })
+
+
+@app.route('/second-opinion/<review_id>', methods=['GET'])
+def second_opinion_result(review_id):
+    """
+    State of an escalated review. "final" is the remote verdict once it is
+    done, otherwise (pending, error, timeout) the local one.
+    """
+    if second_opinion is None:
+        return jsonify({
+            "success": False,
+            "message": "Second opinion is disabled (ENABLE_AI_ANALYSIS)"
+        }), 404
+    
+    review = second_opinion.result(review_id)
+    if review is None:
+        return jsonify({
+            "success": False,
+            "message": "Unknown or expired review id"
+        }), 404
+    return jsonify({"success": True, **review})
+
+
+@app.route('/history', methods=['GET'])
+def analysis_history():
+    """
+    Recent analysis records for one camera.
+
+    Query: camera_id (required), since / until (epoch seconds), limit
+    """
+    camera_id = request.args.get("camera_id")
+    if not camera_id:
+        return jsonify({
+            "success": False,
+            "message": "camera_id is required",
+            "cameras": history.cameras()
+        }), 400
+    
+    records = history.records(
+        camera_id,
+        since=request.args.get("since", type=float),
+        until=request.args.get("until", type=float),
+        limit=request.args.get("limit", Config.MAX_ANALYSIS_HISTORY, type=int)
+    )
+    return jsonify({
+        "success": True,
+        "camera_id": camera_id,
+        "records": records,
+        "total": len(records)
+    })
+
+
+@app.route('/stats', methods=['GET'])
+def analysis_stats():
+    """
+    Aggregates from the minute/hour rollups.
+
+    Query: camera_id (omit for all cameras), window (seconds, default 3600),
+           resolution ("minute" | "hour", default by window)
+    """
+    try:
+        stats = history.stats(
+            camera_id=request.args.get("camera_id"),
+            window=request.args.get("window", 3600.0, type=float),
+            resolution=request.args.get("resolution")
+        )
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    
+    return jsonify({"success": True, **stats})
+
+
+# --------------------------------------------------
+# ADMIN: PROFILING
+# --------------------------------------------------
+
+@app.route('/admin/profiling', methods=['GET'])
+@require_admin
+def profiling_report():
+    """Aggregated hot functions and per-rule timings"""
+    limit = request.args.get("limit", 25, type=int)
+    sort = request.args.get("sort", "cumulative")
+    return jsonify({"success": True, **profiler.report(limit, sort)})
+
+
+@app.route('/admin/profiling', methods=['POST'])
+@require_admin
+def profiling_toggle():
+    """
+    Switch profiling on/off at runtime.
+
+    Body: {"enabled": true, "sample_rate": 0.1, "mode": "cprofile" | "sampling", "reset": false}
+    """
+    body = request.get_json(silent=True) or {}
+    try:
+        if body.get("reset"):
+            profiler.reset()
+        if body.get("enabled", True):
+            profiler.enable(body.get("sample_rate"), body.get("mode"))
+        else:
+            profiler.disable()
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    return jsonify({
+        "success": True,
+        "enabled": profiler.enabled,
+        "mode": profiler.mode,
+        "sample_rate": profiler.sample_rate
+    })
+
+
+@app.route('/admin/profiling/dump', methods=['POST'])
+@require_admin
+def profiling_dump():
+    """Write the aggregated profile to Config.PROFILE_DIR"""
+    return jsonify({"success": True, "files": profiler.dump()})
+
+
 # --------------------------------------------------
 # ERROR HANDLERS
 # --------------------------------------------------
@@ -378,10 +823,25 @@ if __name__ == "__main__":
     print("📡 API Endpoints:")
     print("  • POST /detect-image    - Single image detection")
     print("  • POST /batch-detect    - Batch image detection")
+    print("  • POST /analyze-keypoints - Rules on client-side keypoints")
     print("  • GET  /health          - Health check")
+    print("  • GET  /metrics         - Load / admission metrics")
+    print("  • GET  /history         - Recent analyses for a camera")
+    print("  • GET  /stats           - Minute/hour rollups of past analyses")
+    if second_opinion is not None:
+        print("  • GET  /second-opinion/<id> - Escalated review result")
+    print("  • GET/POST /admin/profiling - Profiling report / toggle")
+    if Config.STREAM_ENABLED:
+        print(f"  • WS   :{Config.STREAM_PORT}/stream?camera_id=<id> - Persistent JPEG frame stream")
+        print(f"  • SSE  :{Config.STREAM_PORT}/events?camera_id=<ids>&min_level=<level> - Detection events")
     print("\n📍 Server running at:")
-    print("  → http://127.0.0.1:8000")
-    print("  → http://0.0.0.0:8000 (network accessible)")
+    print(f"  → http://127.0.0.1:{Config.AI_SERVER_PORT}")
+    print(f"  → http://0.0.0.0:{Config.AI_SERVER_PORT} (network accessible)")
     print("="*60 + "\n")
     
-    app.run(host="0.0.0.0", port=8000, debug=False, threaded=True)
\ No newline at end of file
+    if Config.STREAM_ENABLED:
+        stream_server = StreamServer(process_stream_frame, reset_history=reset_stream_history,
+                                     event_bus=event_bus)
+        stream_server.start_in_thread()
+    
+    app.run(host="0.0.0.0", port=Config.AI_SERVER_PORT, debug=False, threaded=True)
\ No newline at end of file
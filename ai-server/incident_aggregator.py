@@ -0,0 +1,351 @@
+"""
+Incident Aggregator Module - Per camera/type coalescing and batched delivery
+
+Rule hits are submitted every frame; the aggregator merges them into one
+incident per (camera, type) window, keeps the best evidence frame and
+hands closed windows to a delivery thread in batches. Incidents at or
+above the bypass severity are delivered immediately, and so is an open
+window whose severity escalates to it.
+"""
+
+import json
+import time
+import base64
+import itertools
+import threading
+import queue
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from config import Config
+
+
+SEVERITY = {"LOW": 0, "MEDIUM": 1, "HIGH": 2, "CRITICAL": 3}
+
+
+def severity_of(level) -> int:
+    return SEVERITY.get(str(level).upper(), 0)
+
+
+class AggregatedIncident:
+    """One coalesced incident for a (camera, type) window"""
+
+    def __init__(self, camera_id, crime_type, confidence, threat_level, evidence,
+                 fields, now):
+        self.camera_id = camera_id
+        self.crime_type = crime_type
+        self.first_seen = now
+        self.last_seen = now
+        self.occurrences = 1
+        self.confidence = confidence
+        self.confidence_sum = confidence
+        self.threat_level = threat_level
+        self.evidence = evidence
+        self.evidence_jpeg = b""
+        self.fields = dict(fields)
+
+    def merge(self, confidence, threat_level, evidence, fields, now):
+        self.last_seen = now
+        self.occurrences += 1
+        self.confidence_sum += confidence
+        if severity_of(threat_level) > severity_of(self.threat_level):
+            self.threat_level = threat_level
+        # Keep the evidence of the most confident observation
+        if confidence >= self.confidence and evidence is not None:
+            self.evidence = evidence
+        self.confidence = max(self.confidence, confidence)
+        for key, value in fields.items():
+            if isinstance(value, list):
+                merged = self.fields.get(key, [])
+                self.fields[key] = merged + [v for v in value if v not in merged]
+            else:
+                self.fields[key] = value
+
+    def meta(self) -> Dict:
+        """Incident fields without the evidence image"""
+        meta = dict(self.fields)
+        meta.update({
+            "type": self.crime_type,
+            "confidence": round(self.confidence, 3),
+            "avg_confidence": round(self.confidence_sum / self.occurrences, 3),
+            "cameraId": self.camera_id,
+            "threat_level": self.threat_level,
+            "occurrences": self.occurrences,
+            "firstSeen": datetime.fromtimestamp(self.first_seen).isoformat(),
+            "lastSeen": datetime.fromtimestamp(self.last_seen).isoformat(),
+        })
+        return meta
+
+    def to_payload(self) -> Dict:
+        payload = self.meta()
+        if self.evidence_jpeg:
+            encoded = base64.b64encode(self.evidence_jpeg).decode("utf-8")
+            payload["imageBase64"] = f"data:image/jpeg;base64,{encoded}"
+        return payload
+
+
+class HttpBatchSink:
+    """POST ``{"incidents": [...]}`` batches to a URL (backend bulk route or webhook)"""
+
+    def __init__(self, url, timeout=10.0):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, payloads: List[Dict]) -> Optional[List[int]]:
+        """
+        Returns:
+            Indexes of payloads the receiver did not store (the backend
+            reports ``processed`` and ``rejected``; a plain webhook stores
+            everything). Raises when nothing was stored.
+        """
+        response = requests.post(self.url, json={"incidents": payloads}, timeout=self.timeout)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if not isinstance(body, dict):
+            body = {}
+        # The backend works in order and reports how far it got
+        processed = int(body.get("processed", len(payloads) if response.ok else 0) or 0)
+        if not processed:
+            response.raise_for_status()
+        rejected = [i for i in body.get("rejected") or []
+                    if isinstance(i, int) and 0 <= i < processed]
+        return sorted(set(rejected) | set(range(processed, len(payloads))))
+
+
+def default_sink() -> HttpBatchSink:
+    """Webhook when one is configured, otherwise the backend bulk endpoint"""
+    return HttpBatchSink(Config.WEBHOOK_URL or Config.BACKEND_BULK_URL)
+
+
+class IncidentAggregator:
+    """
+    Dedupe and coalesce incidents per (camera, type).
+
+    A window opens on the first event for a key and closes ``window``
+    seconds later, or once ``cooldown`` has passed since the key was last
+    delivered, whichever is later. Events with severity >= ``bypass_level``
+    skip the window when the key is not in cooldown; one arriving while a
+    lower-severity window is open closes that window at once.
+
+    ``sink`` may return the indexes of payloads it did not store; those
+    incidents are reported to ``on_result`` as not delivered.
+    """
+
+    def __init__(self, sink: Callable[[List[Dict]], None] = None,
+                 encoder: Callable = None,
+                 on_result: Callable[[List[AggregatedIncident], bool], None] = None,
+                 window: float = None, cooldown: float = None, batch_size: int = None,
+                 bypass_level: str = None, tick: float = 0.25):
+        self.sink = sink or default_sink()
+        self.encoder = encoder
+        self.on_result = on_result
+        self.window = Config.INCIDENT_WINDOW if window is None else window
+        self.cooldown = Config.INCIDENT_COOLDOWN if cooldown is None else cooldown
+        self.batch_size = batch_size or Config.INCIDENT_BATCH_SIZE
+        self.bypass_severity = severity_of(bypass_level or Config.INCIDENT_BYPASS_LEVEL)
+        self.tick = tick
+
+        self._lock = threading.Lock()
+        self._open = {}            # (camera, type) -> AggregatedIncident
+        self._last_delivered = {}  # (camera, type) -> timestamp
+        self._deliveries = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._stop = threading.Event()
+        self.stats = {"submitted": 0, "delivered": 0, "batches": 0, "failed": 0, "bypassed": 0}
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="incident-flush",
+                                         daemon=True)
+        self._sender = threading.Thread(target=self._send_loop, name="incident-send",
+                                        daemon=True)
+        self._flusher.start()
+        self._sender.start()
+
+    # -------------------------------------------------
+    # SUBMISSION
+    # -------------------------------------------------
+    def submit(self, camera_id, crime_type, confidence, evidence=None,
+               threat_level="LOW", now: float = None, **fields) -> None:
+        """Record one rule hit; never blocks on delivery"""
+        now = time.time() if now is None else now
+        key = (camera_id, crime_type)
+        confidence = float(confidence)
+
+        with self._lock:
+            self.stats["submitted"] += 1
+            incident = self._open.get(key)
+            if incident is not None:
+                escalated = severity_of(threat_level) >= self.bypass_severity > \
+                    severity_of(incident.threat_level)
+                incident.merge(confidence, threat_level, evidence, fields, now)
+                if escalated:
+                    # Severity jumped past the bypass level: do not wait for the window
+                    del self._open[key]
+                    self._last_delivered[key] = now
+                    self.stats["bypassed"] += 1
+                    self._enqueue([incident])
+                return
+
+            incident = AggregatedIncident(camera_id, crime_type, confidence, threat_level,
+                                          evidence, fields, now)
+            in_cooldown = now - self._last_delivered.get(key, float("-inf")) < self.cooldown
+            if severity_of(threat_level) >= self.bypass_severity and not in_cooldown:
+                self._last_delivered[key] = now
+                self.stats["bypassed"] += 1
+                self._enqueue([incident])
+                return
+            self._open[key] = incident
+
+    def _deadline(self, key, incident):
+        return max(incident.first_seen + self.window,
+                   self._last_delivered.get(key, float("-inf")) + self.cooldown)
+
+    def _collect(self, now, force=False) -> List[AggregatedIncident]:
+        with self._lock:
+            ready = [key for key, inc in self._open.items()
+                     if force or self._deadline(key, inc) <= now]
+            closed = []
+            for key in ready:
+                closed.append(self._open.pop(key))
+                self._last_delivered[key] = now
+            return closed
+
+    def _enqueue(self, incidents):
+        for start in range(0, len(incidents), self.batch_size):
+            batch = incidents[start:start + self.batch_size]
+            priority = -max(severity_of(inc.threat_level) for inc in batch)
+            self._deliveries.put((priority, next(self._seq), batch))
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.tick):
+            closed = self._collect(time.time())
+            if closed:
+                self._enqueue(closed)
+
+    # -------------------------------------------------
+    # DELIVERY
+    # -------------------------------------------------
+    def _send_loop(self):
+        while True:
+            _, _, batch = self._deliveries.get()
+            if batch is None:
+                return
+            failed = self._deliver(batch)
+            if self.on_result is None:
+                continue
+            delivered = [incident for i, incident in enumerate(batch) if i not in failed]
+            undelivered = [batch[i] for i in sorted(failed)]
+            for incidents, ok in ((delivered, True), (undelivered, False)):
+                if not incidents:
+                    continue
+                try:
+                    self.on_result(incidents, ok)
+                except Exception as e:
+                    # A failing callback must not stop later deliveries
+                    print(f"❌ Incident result callback failed: {e}")
+
+    def _deliver(self, batch) -> set:
+        """
+        Encode and send one batch; returns the batch indexes that were not
+        delivered (any encoder or sink error fails the whole batch)
+        """
+        try:
+            for incident in batch:
+                if incident.evidence is not None and not incident.evidence_jpeg:
+                    incident.evidence_jpeg = self.encoder(incident.evidence) \
+                        if self.encoder else bytes(incident.evidence)
+                    incident.evidence = None
+
+            refused = self.sink([incident.to_payload() for incident in batch])
+            failed = {i for i in refused or () if 0 <= i < len(batch)}
+            stored = [inc for i, inc in enumerate(batch) if i not in failed]
+            self.stats["delivered"] += len(stored)
+            self.stats["failed"] += len(failed)
+            self.stats["batches"] += 1
+            print(f"🚨 Delivered {len(stored)} incident(s): "
+                  f"{', '.join(f'{i.crime_type}@{i.camera_id} x{i.occurrences}' for i in stored)}")
+            if failed:
+                print(f"⚠️ Receiver did not store {len(failed)} incident(s)")
+            return failed
+        except requests.RequestException as e:
+            print(f"❌ Incident delivery failed: {e}")
+        except Exception as e:
+            # The sink is any callable; keep the sender thread alive whatever it raises
+            print(f"❌ Incident delivery error ({type(e).__name__}): {e}")
+        self.stats["failed"] += len(batch)
+        return set(range(len(batch)))
+
+    def flush(self) -> None:
+        """Close every open window and queue it for delivery"""
+        closed = self._collect(time.time(), force=True)
+        if closed:
+            self._enqueue(closed)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Flush open windows, deliver everything queued and stop the threads"""
+        self._stop.set()
+        self._flusher.join(timeout)
+        self.flush()
+        # Lowest priority sentinel: delivered after every pending batch
+        self._deliveries.put((len(SEVERITY), next(self._seq), None))
+        self._sender.join(timeout)
+
+
+# --------------------------------------------------
+# LOCAL RECEIVER (stand-in for backend / webhook)
+# --------------------------------------------------
+
+class LocalReceiver:
+    """
+    Minimal HTTP endpoint that records every JSON body it receives.
+
+    Usage:
+        with LocalReceiver() as receiver:
+            aggregator = IncidentAggregator(HttpBatchSink(receiver.url))
+            ...
+            receiver.incidents  # every delivered incident payload
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, status=201):
+        self.batches = []
+        self.status = status
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                receiver.batches.append(body)
+                self.send_response(receiver.status)
+                self.send_header("Content-Type", "application/json")
+                self.end_headers()
+                self.wfile.write(json.dumps({"success": receiver.status < 400}).encode("utf-8"))
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.url = f"http://{host}:{self.server.server_port}/"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def incidents(self) -> List[Dict]:
+        return [inc for batch in self.batches for inc in batch.get("incidents", [])]
+
+    def start(self) -> "LocalReceiver":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
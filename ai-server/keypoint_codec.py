@@ -0,0 +1,174 @@
+"""
+Keypoint Codec Module - Compact wire format for pose outputs
+
+Used by edge devices that already run a pose model and only send
+keypoints to ``/analyze-keypoints`` instead of full images.
+
+Binary layout (little-endian, Content-Type: application/octet-stream):
+
+    magic      4s   b"KPF1"
+    frames     u16
+    per frame:
+      id_len   u8
+      camera   id_len bytes (utf-8)
+      ts       f64  (unix seconds, 0 = server time)
+      persons  u16
+      flags    u8   bit0: keypoint confidences present
+                    bit1: boxes present
+                    bit2: values are float16 (default float32)
+      keypoints  persons x 17 x 2
+      conf       persons x 17   (if bit0)
+      boxes      persons x 4    (if bit1)
+
+With float16 a person costs ~110 bytes, so a frame is a few hundred bytes.
+
+JSON layout (Content-Type: application/json), one frame or many:
+
+    {"camera_id": "cam01", "keypoints": [[[x, y], ...17]], "conf": [[...]], "boxes": [[x1, y1, x2, y2]]}
+    {"frames": [{...same fields, optional per-frame "camera_id" / "timestamp"...}]}
+"""
+
+import struct
+from typing import Dict, List
+
+import numpy as np
+
+
+MAGIC = b"KPF1"
+NUM_KEYPOINTS = 17
+
+FLAG_CONF = 0x1
+FLAG_BOXES = 0x2
+FLAG_FLOAT16 = 0x4
+
+_HEADER = struct.Struct("<4sH")
+_FRAME_TAIL = struct.Struct("<dHB")
+
+
+def encode_frames(frames: List[Dict], float16: bool = True) -> bytes:
+    """
+    Encode frames (dicts with keypoints, optional conf / boxes / camera_id /
+    timestamp) into the binary wire format.
+    """
+    dtype = np.dtype("<f2") if float16 else np.dtype("<f4")
+    out = bytearray(_HEADER.pack(MAGIC, len(frames)))
+    for frame in frames:
+        kps = np.asarray(frame["keypoints"], dtype=dtype).reshape(-1, NUM_KEYPOINTS, 2)
+        persons = len(kps)
+        conf = frame.get("conf")
+        boxes = frame.get("boxes")
+        flags = FLAG_FLOAT16 if float16 else 0
+        if conf is not None:
+            flags |= FLAG_CONF
+        if boxes is not None:
+            flags |= FLAG_BOXES
+
+        camera = str(frame.get("camera_id") or "").encode("utf-8")[:255]
+        out += struct.pack("<B", len(camera)) + camera
+        out += _FRAME_TAIL.pack(float(frame.get("timestamp") or 0.0), persons, flags)
+        out += kps.tobytes()
+        if conf is not None:
+            out += np.asarray(conf, dtype=dtype).reshape(persons, NUM_KEYPOINTS).tobytes()
+        if boxes is not None:
+            out += np.asarray(boxes, dtype=dtype).reshape(persons, 4).tobytes()
+    return bytes(out)
+
+
+def decode_frames(data: bytes) -> List[Dict]:
+    """
+    Decode the binary wire format into frames of float32 numpy arrays.
+
+    Raises:
+        ValueError: On a bad magic number or truncated payload
+    """
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise ValueError("Payload too short")
+    magic, count = _HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError("Bad magic, expected KPF1")
+
+    offset = _HEADER.size
+    frames = []
+    try:
+        for _ in range(count):
+            (id_len,) = struct.unpack_from("<B", view, offset)
+            offset += 1
+            camera = bytes(view[offset:offset + id_len]).decode("utf-8")
+            offset += id_len
+            ts, persons, flags = _FRAME_TAIL.unpack_from(view, offset)
+            offset += _FRAME_TAIL.size
+            dtype = np.dtype("<f2") if flags & FLAG_FLOAT16 else np.dtype("<f4")
+
+            def take(shape):
+                nonlocal offset
+                size = int(np.prod(shape)) * dtype.itemsize
+                if offset + size > len(view):
+                    raise ValueError("Truncated payload")
+                arr = np.frombuffer(view, dtype=dtype, count=int(np.prod(shape)),
+                                    offset=offset).reshape(shape).astype(np.float32)
+                offset += size
+                return arr
+
+            kps = take((persons, NUM_KEYPOINTS, 2))
+            conf = take((persons, NUM_KEYPOINTS)) if flags & FLAG_CONF else None
+            boxes = take((persons, 4)) if flags & FLAG_BOXES else None
+            frames.append({
+                "camera_id": camera or None,
+                "timestamp": ts or None,
+                "keypoints": kps,
+                "conf": conf,
+                "boxes": boxes,
+            })
+    except struct.error:
+        raise ValueError("Truncated payload")
+
+    if offset != len(view):
+        raise ValueError("Trailing bytes after last frame")
+    return frames
+
+
+def frames_from_json(body: Dict) -> List[Dict]:
+    """
+    Normalise a JSON body (single frame or {"frames": [...]}) into frames of
+    float32 numpy arrays.
+
+    Raises:
+        ValueError: On missing or malformed arrays
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Body must be a JSON object")
+
+    default_camera = body.get("camera_id")
+    raw_frames = body["frames"] if "frames" in body else [body]
+    if not isinstance(raw_frames, list):
+        raise ValueError("frames must be a list")
+
+    frames = []
+    for raw in raw_frames:
+        if not isinstance(raw, dict) or "keypoints" not in raw:
+            raise ValueError("Each frame needs a keypoints array")
+        try:
+            kps = np.asarray(raw["keypoints"], dtype=np.float32)
+            if kps.size == 0:
+                kps = kps.reshape(0, NUM_KEYPOINTS, 2)
+            if kps.ndim != 3 or kps.shape[1:] != (NUM_KEYPOINTS, 2):
+                raise ValueError(f"keypoints must have shape (persons, {NUM_KEYPOINTS}, 2)")
+            persons = len(kps)
+            conf = raw.get("conf")
+            boxes = raw.get("boxes")
+            if conf is not None:
+                conf = np.asarray(conf, dtype=np.float32).reshape(persons, NUM_KEYPOINTS)
+            if boxes is not None:
+                boxes = np.asarray(boxes, dtype=np.float32).reshape(persons, 4)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Malformed frame: {e}")
+
+        frames.append({
+            "camera_id": raw.get("camera_id", default_camera),
+            "timestamp": raw.get("timestamp"),
+            "keypoints": kps,
+            "conf": conf,
+            "boxes": boxes,
+        })
+    return frames
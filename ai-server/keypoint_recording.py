@@ -0,0 +1,312 @@
+"""
+Keypoint Recording Module - Record pose model outputs and replay them
+through the rule layer without running inference
+
+A recording is a directory of flat little-endian column files that can be
+memory-mapped directly with numpy:
+
+    meta.json       version, camera id table, counts
+    frames.bin      one FRAME_DTYPE row per frame
+    keypoints.f32   (persons, 17, 2) float32, all frames back to back
+    kpconf.f32      (persons, 17)    float32 (NaN where the model gave none)
+    boxes.f32       (persons, 4)     float32 xyxy
+
+Usage:
+    python keypoint_recording.py replay ./recordings/site1 --save-baseline base.json
+    python keypoint_recording.py replay ./recordings/site1 --baseline base.json
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+FORMAT_VERSION = 1
+NUM_KEYPOINTS = 17
+
+FRAME_DTYPE = np.dtype([
+    ("ts", "<f8"),
+    ("start", "<u8"),    # first person row in the person columns
+    ("count", "<u4"),    # persons in this frame
+    ("camera", "<u2"),   # index into meta.json "cameras"
+    ("flags", "<u2"),
+])
+FLAG_HAS_CONF = 0x1
+
+COLUMNS = {
+    "keypoints": ("keypoints.f32", (NUM_KEYPOINTS, 2)),
+    "kpconf": ("kpconf.f32", (NUM_KEYPOINTS,)),
+    "boxes": ("boxes.f32", (4,)),
+}
+
+
+def _row_bytes(shape):
+    return int(np.prod(shape)) * 4
+
+
+class KeypointRecorder:
+    """
+    Append per-frame pose outputs to a recording directory.
+
+    Thread-safe; attach to a detector with ``pose_detector.recorder = recorder``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta_path = os.path.join(path, "meta.json")
+
+        meta = {}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path) as f:
+                meta = json.load(f)
+        self.cameras = list(meta.get("cameras", []))
+        self._camera_index = {cam: i for i, cam in enumerate(self.cameras)}
+        self.created = meta.get("created", datetime.now().isoformat())
+
+        self._frames = open(os.path.join(path, "frames.bin"), "ab")
+        self._columns = {
+            name: open(os.path.join(path, filename), "ab")
+            for name, (filename, _) in COLUMNS.items()
+        }
+        # Resume after the last complete person row / frame row
+        kp_file, kp_shape = COLUMNS["keypoints"]
+        self.persons = os.path.getsize(os.path.join(path, kp_file)) // _row_bytes(kp_shape)
+        self.frames = os.path.getsize(os.path.join(path, "frames.bin")) // FRAME_DTYPE.itemsize
+        self._write_meta()
+
+    def record(self, kps, conf, boxes, camera_id=None, timestamp: float = None) -> None:
+        kps = np.asarray(kps, dtype="<f4").reshape(-1, NUM_KEYPOINTS, 2)
+        count = len(kps)
+        boxes = np.asarray(boxes, dtype="<f4").reshape(count, 4)
+        flags = 0
+        if conf is not None:
+            conf = np.asarray(conf, dtype="<f4").reshape(count, NUM_KEYPOINTS)
+            flags |= FLAG_HAS_CONF
+        else:
+            conf = np.full((count, NUM_KEYPOINTS), np.nan, dtype="<f4")
+
+        camera = "" if camera_id is None else str(camera_id)
+        ts = time.time() if timestamp is None else float(timestamp)
+
+        with self._lock:
+            cam_idx = self._camera_index.get(camera)
+            if cam_idx is None:
+                cam_idx = len(self.cameras)
+                self.cameras.append(camera)
+                self._camera_index[camera] = cam_idx
+                self._write_meta()
+
+            row = np.zeros(1, dtype=FRAME_DTYPE)
+            row[0] = (ts, self.persons, count, cam_idx, flags)
+
+            # Person columns first so a frame row never references missing rows
+            self._columns["keypoints"].write(kps.tobytes())
+            self._columns["kpconf"].write(conf.tobytes())
+            self._columns["boxes"].write(boxes.tobytes())
+            self._frames.write(row.tobytes())
+            self.persons += count
+            self.frames += 1
+
+    def flush(self) -> None:
+        with self._lock:
+            for f in self._columns.values():
+                f.flush()
+            self._frames.flush()
+            self._write_meta()
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            for f in self._columns.values():
+                f.close()
+            self._frames.close()
+
+    def _write_meta(self):
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "version": FORMAT_VERSION,
+                "created": self.created,
+                "cameras": self.cameras,
+                "frames": self.frames,
+                "persons": self.persons,
+            }, f, indent=2)
+        os.replace(tmp, self._meta_path)
+
+
+class KeypointRecording:
+    """Read-only, memory-mapped view of a recording directory"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recording version: {self.meta.get('version')}")
+        self.cameras = self.meta["cameras"]
+
+        self.frames = self._map("frames.bin", FRAME_DTYPE, ())
+        self.columns = {
+            name: self._map(filename, np.dtype("<f4"), shape)
+            for name, (filename, shape) in COLUMNS.items()
+        }
+        # Drop frames whose person rows were not fully written
+        persons = min(len(col) for col in self.columns.values())
+        if len(self.frames):
+            ends = self.frames["start"] + self.frames["count"]
+            self.frames = self.frames[:int(np.searchsorted(ends > persons, True))]
+
+    def _map(self, filename, dtype, shape):
+        full = os.path.join(self.path, filename)
+        row = dtype.itemsize * int(np.prod(shape)) if shape else dtype.itemsize
+        rows = os.path.getsize(full) // row if os.path.exists(full) else 0
+        if rows == 0:
+            return np.zeros((0,) + shape, dtype=dtype)
+        return np.memmap(full, dtype=dtype, mode="r", shape=(rows,) + shape)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __iter__(self) -> Iterator[Dict]:
+        kps_col = self.columns["keypoints"]
+        conf_col = self.columns["kpconf"]
+        box_col = self.columns["boxes"]
+        for frame in self.frames:
+            start = int(frame["start"])
+            end = start + int(frame["count"])
+            yield {
+                "timestamp": float(frame["ts"]),
+                "camera_id": self.cameras[int(frame["camera"])],
+                "keypoints": kps_col[start:end],
+                "conf": conf_col[start:end] if int(frame["flags"]) & FLAG_HAS_CONF else None,
+                "boxes": box_col[start:end],
+            }
+
+
+# --------------------------------------------------
+# REPLAY
+# --------------------------------------------------
+
+def replay(recording: KeypointRecording, detector=None) -> Dict:
+    """
+    Feed every recorded frame through the rule layer (no inference).
+
+    Returns:
+        {"frames", "elapsed_s", "fps", "realtime_factor", "classifications"}
+    """
+    if detector is None:
+        from pose_detector import PoseCrimeDetector
+        detector = PoseCrimeDetector(model_path=None)
+
+    classifications = []
+    start = time.perf_counter()
+    for frame in recording:
+        result = detector.analyze_keypoints(frame["keypoints"], frame["conf"], frame["boxes"],
+                                            camera_id=frame["camera_id"])
+        classifications.append({
+            "timestamp": frame["timestamp"],
+            "camera_id": frame["camera_id"],
+            "crime_type": result["crime_type"],
+            "threat_level": result["threat_level"],
+            "threat_score": round(float(result["threat_score"]), 3),
+        })
+    elapsed = time.perf_counter() - start
+
+    frames = len(classifications)
+    span = (classifications[-1]["timestamp"] - classifications[0]["timestamp"]) if frames > 1 else 0.0
+    return {
+        "frames": frames,
+        "elapsed_s": round(elapsed, 4),
+        "fps": round(frames / elapsed, 1) if elapsed > 0 else None,
+        "realtime_factor": round(span / elapsed, 1) if elapsed > 0 and span > 0 else None,
+        "classifications": classifications,
+    }
+
+
+def diff_classifications(baseline: List[Dict], current: List[Dict], max_examples=20) -> Dict:
+    """Compare two replays frame by frame"""
+    if len(baseline) != len(current):
+        print(f"⚠️ Frame count differs: baseline {len(baseline)} vs current {len(current)}")
+
+    type_changes = Counter()
+    level_changes = Counter()
+    examples = []
+    changed = 0
+    for idx, (old, new) in enumerate(zip(baseline, current)):
+        type_changed = old["crime_type"] != new["crime_type"]
+        level_changed = old["threat_level"] != new["threat_level"]
+        if not (type_changed or level_changed):
+            continue
+        changed += 1
+        if type_changed:
+            type_changes[f"{old['crime_type']} -> {new['crime_type']}"] += 1
+        if level_changed:
+            level_changes[f"{old['threat_level']} -> {new['threat_level']}"] += 1
+        if len(examples) < max_examples:
+            examples.append({"frame": idx, "camera_id": new["camera_id"],
+                             "baseline": old, "current": new})
+
+    compared = min(len(baseline), len(current))
+    return {
+        "compared": compared,
+        "changed": changed,
+        "changed_pct": round(changed * 100.0 / compared, 2) if compared else 0.0,
+        "type_changes": dict(type_changes.most_common()),
+        "level_changes": dict(level_changes.most_common()),
+        "examples": examples,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Replay recorded keypoints through the rule layer")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("replay", help="Replay a recording")
+    r.add_argument("recording", help="Recording directory")
+    r.add_argument("--baseline", help="Baseline JSON to diff classifications against")
+    r.add_argument("--save-baseline", help="Write this run's classifications to a JSON file")
+
+    i = sub.add_parser("info", help="Show recording metadata")
+    i.add_argument("recording")
+
+    args = parser.parse_args(argv)
+    recording = KeypointRecording(args.recording)
+
+    if args.command == "info":
+        print(json.dumps({**recording.meta, "readable_frames": len(recording)}, indent=2))
+        return
+
+    result = replay(recording)
+    print(f"▶️ Replayed {result['frames']} frames in {result['elapsed_s']}s "
+          f"({result['fps']} frames/sec, {result['realtime_factor']}x real time)")
+
+    levels = Counter(c["threat_level"] for c in result["classifications"])
+    print(f"   Threat levels: {dict(levels)}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(result["classifications"], f)
+        print(f"💾 Baseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        diff = diff_classifications(baseline, result["classifications"])
+        print(json.dumps({k: v for k, v in diff.items() if k != "examples"}, indent=2))
+        for example in diff["examples"]:
+            print(f"   frame {example['frame']} [{example['camera_id']}]: "
+                  f"{example['baseline']['crime_type']}/{example['baseline']['threat_level']} -> "
+                  f"{example['current']['crime_type']}/{example['current']['threat_level']}")
+
+
+if __name__ == "__main__":
+    main()
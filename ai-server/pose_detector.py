@@ -1,26 +1,137 @@
 from ultralytics import YOLO
 import numpy as np
 import math
+import time
 from collections import defaultdict
 
+from spatial_index import PointGrid, disc_pairs
+
+
+def rescale_outputs(kps_all, boxes, scale):
+    """Keypoints and boxes multiplied into another image scale; (0, 0) stays missing"""
+    if scale == 1.0:
+        return kps_all, boxes
+    return (np.asarray(kps_all, dtype=np.float32) * np.float32(scale),
+            np.asarray(boxes, dtype=np.float32) * np.float32(scale))
+
+
 class PoseCrimeDetector:
-    def __init__(self):
-        # Use medium model for better accuracy or keep nano for speed
-        self.model = YOLO("yolov8n-pose.pt")
-        # Cache for temporal analysis (simple version)
-        self.frame_history = []
+    # Rules that get per-call timers when profiling is switched on
+    TIMED_RULES = (
+        "_analyze_person", "_analyze_interactions", "_analyze_crowd_interactions",
+        "_analyze_weapons",
+        "_is_arm_extended", "_is_leg_raised", "_is_running", "_is_crouching",
+        "_calculate_body_verticality",
+        "_normalized_distance", "_is_assault_head", "_is_grabbing",
+        "_is_following", "_is_circle_formation", "_is_power_imbalance",
+        "_temporal_analysis", "_calculate_threat_score", "_classify",
+    )
+    # Scenes with at least this many people prune pairs with a spatial index
+    SPATIAL_INDEX_MIN_PERSONS = 12
+    # COCO keypoints a wrist rule can target (head for ASSAULT_HEAD, shoulders/hips for GRABBING)
+    WRIST_TARGET_KEYPOINTS = (0, 1, 2, 3, 4, 5, 6, 11, 12)
+    # Temporal state of cameras silent this long (seconds) is dropped; camera ids come from clients
+    HISTORY_IDLE_SECONDS = 600
+
+    def __init__(self, model_path="yolov8n-pose.pt"):
+        # Use medium model for better accuracy or keep nano for speed.
+        # model_path=None builds a rules-only detector (keypoint replay).
+        self.model = YOLO(model_path) if model_path else None
+        # Cache for temporal analysis (simple version), one per camera
+        self.frame_histories = {}
         self.max_history = 5
-        
-    def analyze(self, image):
-        # Process with higher resolution for better keypoint accuracy
-        results = self.model(image, conf=0.5, iou=0.45, verbose=False)[0]
-        
+        self._history_seen = {}  # camera -> monotonic time of its last frame
+        self._next_history_prune = 0.0
+        # Optional KeypointRecorder receiving every frame's model outputs
+        self.recorder = None
+        # Optional TiledPoseInference for high-resolution frames
+        self.tiler = None
+        
+    def analyze(self, image, camera_id=None, weapons=None, tier=None, scale=1.0):
+        """
+        Inference plus rules. ``scale`` maps ``image`` pixels into the space
+        the rules' pixel thresholds and the temporal history are kept in
+        (see image_detector.analyze_image); ``weapons`` are already in it.
+        """
+        kps_all, conf_all, boxes = self.infer(image, camera_id=camera_id, tier=tier)
+        kps_all, boxes = rescale_outputs(kps_all, boxes, scale)
+        
+        if self.recorder is not None:
+            self.recorder.record(kps_all, conf_all, boxes, camera_id=camera_id)
+        
+        return self.analyze_keypoints(kps_all, conf_all, boxes, camera_id=camera_id,
+                                      weapons=weapons, tier=tier)
+    
+    def infer(self, image, camera_id=None, tier=None):
+        """
+        Pose model pass only: (keypoints, keypoint confidences, boxes) in image pixels
+
+        ``tier`` is an optional QualityTier (see quality_controller.py)
+        picking the model, its input size and whether tiling is allowed.
+        """
+        tiling = tier is None or tier.tiling
+        if tiling and self.tiler is not None and self.tiler.should_tile(image, camera_id):
+            kps_all, conf_all, boxes = self.tiler.infer(image, tier=tier)
+        else:
+            # Process with higher resolution for better keypoint accuracy
+            model, size = self._model_for(tier)
+            results = model(image, conf=0.5, iou=0.45, verbose=False, **size)[0]
+            kps_all, conf_all, boxes = self._extract(results)
+        
+        if self.tiler is not None:
+            self.tiler.observe(camera_id, boxes, max(image.shape[:2]))
+        return kps_all, conf_all, boxes
+    
+    def infer_batch(self, images, tier=None):
+        """One model call over several images: [(keypoints, conf, boxes, box scores)]"""
+        model, size = self._model_for(tier)
+        outputs = []
+        for results in model(images, conf=0.5, iou=0.45, verbose=False, **size):
+            kps_all, conf_all, boxes = self._extract(results)
+            scores = (results.boxes.conf.cpu().numpy().astype(np.float32) if len(kps_all)
+                      else np.zeros(0, dtype=np.float32))
+            outputs.append((kps_all, conf_all, boxes, scores))
+        return outputs
+    
+    def _model_for(self, tier):
+        """Pose model and extra call arguments for a QualityTier (or None)"""
+        model = self.model if tier is None or tier.model is None else tier.model
+        size = {"imgsz": tier.imgsz} if tier is not None and tier.imgsz else {}
+        return model, size
+    
+    def _extract(self, results):
+        """Pull keypoints, keypoint confidences and boxes out of a YOLO result"""
         if results.keypoints is None or len(results.keypoints) == 0:
-            return self._empty_result()
+            return (np.zeros((0, 17, 2), dtype=np.float32), None,
+                    np.zeros((0, 4), dtype=np.float32))
         
         kps_all = results.keypoints.xy.cpu().numpy()
         conf_all = results.keypoints.conf.cpu().numpy() if results.keypoints.conf is not None else None
         boxes = results.boxes.xyxy.cpu().numpy()
+        return kps_all, conf_all, boxes
+    
+    def analyze_keypoints(self, kps_all, conf_all=None, boxes=None, camera_id=None, weapons=None,
+                          tier=None):
+        """
+        Rule layer: everything after inference, driven only by pose outputs.
+
+        Args:
+            kps_all: (persons, 17, 2) keypoint xy in image pixels
+            conf_all: (persons, 17) keypoint confidences, or None
+            boxes: (persons, 4) xyxy person boxes, or None to derive them
+                   from the keypoint extents
+            camera_id: Key for the per-camera temporal history
+            weapons: (n, 4) xyxy weapon boxes from a box detector, or None
+            tier: Optional QualityTier; low tiers skip interaction rules on
+                  frames without any person or weapon signal
+        """
+        if len(kps_all) == 0:
+            return self._empty_result()
+        
+        if boxes is None:
+            kps_arr = np.asarray(kps_all, dtype=np.float32)
+            boxes = np.concatenate([kps_arr.min(axis=1), kps_arr.max(axis=1)], axis=1)
+        history = self._history(camera_id)
         
         persons = len(kps_all)
         threat_score = 0
@@ -36,18 +147,25 @@ class PoseCrimeDetector:
             signals.extend(person_sig)
             activities.extend(person_acts)
         
+        # ---- WEAPON FUSION ----
+        if weapons is not None and len(weapons) > 0:
+            weapon_signals, weapon_acts = self._analyze_weapons(kps_all, boxes, weapons)
+            signals.extend(weapon_signals)
+            activities.extend(weapon_acts)
+        
         # ---- MULTI-PERSON ANALYSIS ----
-        if persons >= 2:
+        quiet = not signals and tier is not None and tier.skip_quiet_interactions
+        if persons >= 2 and not quiet:
             inter_signals, inter_acts = self._analyze_interactions(kps_all, boxes, person_signals)
             signals.extend(inter_signals)
             activities.extend(inter_acts)
         
         # ---- TEMPORAL ANALYSIS (Simple) ----
-        self._update_history(signals)
-        signals.extend(self._temporal_analysis())
+        self._update_history(history, signals)
+        signals.extend(self._temporal_analysis(history))
         
         # ---- THREAT SCORING ----
-        threat_score = self._calculate_threat_score(signals, activities, persons)
+        threat_score = self._calculate_threat_score(signals, activities, persons, history)
         
         # ---- FINAL CLASSIFICATION ----
         crime_type, threat_level = self._classify(signals, activities, persons)
@@ -172,13 +290,41 @@ class PoseCrimeDetector:
         
         return s, acts
     
+    # -------------------------------------------------
+    # WEAPON FUSION
+    # -------------------------------------------------
+    def _analyze_weapons(self, kps_all, boxes, weapons):
+        """Relate detected weapon boxes to the persons' wrists"""
+        s = ["WEAPON_VISIBLE"]
+        acts = []
+        weapons = np.asarray(weapons, dtype=np.float32).reshape(-1, 4)
+        
+        for idx, k in enumerate(kps_all):
+            # Reach scales with the person's size in the frame
+            reach = 0.25 * max(float(boxes[idx][3] - boxes[idx][1]), 1.0)
+            for wrist in (k[9], k[10]):
+                if wrist[0] == 0 and wrist[1] == 0:  # Keypoint not found
+                    continue
+                # Distance from the wrist to the nearest point of each weapon box
+                dx = np.maximum(np.maximum(weapons[:, 0] - wrist[0], wrist[0] - weapons[:, 2]), 0)
+                dy = np.maximum(np.maximum(weapons[:, 1] - wrist[1], wrist[1] - weapons[:, 3]), 0)
+                if np.min(np.hypot(dx, dy)) < reach:
+                    s.append("WEAPON_IN_HAND")
+                    acts.append("ARMED_PERSON")
+                    return s, acts
+        
+        return s, acts
+    
     # -------------------------------------------------
     # IMPROVED INTERACTION ANALYSIS
     # -------------------------------------------------
     def _analyze_interactions(self, kps_all, boxes, person_signals):
+        n = len(kps_all)
+        if n >= self.SPATIAL_INDEX_MIN_PERSONS:
+            return self._analyze_crowd_interactions(kps_all, boxes, person_signals)
+        
         s = []
         acts = []
-        n = len(kps_all)
         
         for i in range(n):
             for j in range(i + 1, n):
@@ -186,10 +332,7 @@ class PoseCrimeDetector:
                 hip_i = self._get_hip_center(kps_all[i])
                 hip_j = self._get_hip_center(kps_all[j])
                 
-                distance = self._distance(hip_i, hip_j)
-                frame_diagonal = self._calculate_frame_diagonal(boxes[i], boxes[j])
-                
-                normalized_distance = distance / frame_diagonal
+                normalized_distance = self._normalized_distance(hip_i, hip_j, boxes[i], boxes[j])
                 
                 # Close contact (based on body proportions)
                 if normalized_distance < 0.3:
@@ -202,13 +345,9 @@ class PoseCrimeDetector:
                     acts.append("PHYSICAL_CONTACT")
                 
                 # Assault detection
-                for wrist_idx in [9, 10]:  # Left and right wrists
-                    for head_idx in [0, 1, 2, 3, 4]:  # Head keypoints
-                        dist = self._distance(kps_all[i][wrist_idx], kps_all[j][head_idx])
-                        if dist < 30:  # Wrist near head
-                            s.append("ASSAULT_HEAD")
-                            acts.append("PHYSICAL_ASSAULT")
-                            break
+                if self._is_assault_head(kps_all[i], kps_all[j]):
+                    s.append("ASSAULT_HEAD")
+                    acts.append("PHYSICAL_ASSAULT")
                 
                 # Grabbing detection
                 if self._is_grabbing(kps_all[i], kps_all[j]):
@@ -225,9 +364,7 @@ class PoseCrimeDetector:
                         acts.append("CROWD_FORMATION")
                 
                 # Overpower detection (aggressor standing over crouched victim)
-                vertical_diff = abs(hip_i[1] - hip_j[1])
-                
-                if vertical_diff > 30:
+                if self._is_power_imbalance(hip_i, hip_j):
                     s.append("POWER_IMBALANCE")
                     acts.append("DOMINANT_POSITION")
                 
@@ -243,6 +380,129 @@ class PoseCrimeDetector:
         
         return s, acts
     
+    def _analyze_crowd_interactions(self, kps_all, boxes, person_signals):
+        """
+        Same signal set as the pair loop above, without visiting every pair.
+
+        Distance rules only run on candidate pairs from spatial grids; rules
+        that do not depend on the pair (crowd formation) or only on extremes
+        (power imbalance) are evaluated once. Like the loop, wrist rules and
+        following are directed from the lower to the higher person index.
+        """
+        s = []
+        acts = []
+        n = len(kps_all)
+        hips = [self._get_hip_center(k) for k in kps_all]
+        
+        # Close contact / collision. The union-box diagonal is at most
+        # |c_i - c_j| + sqrt(2) * max(D_i, D_j), and the box centers are within
+        # r_i + r_j of the hip distance d (r = hip offset from box center), so
+        # d < 0.3 * diagonal needs d < 3/7 * (r_i + r_j + sqrt(2) * (D_i + D_j)).
+        hip_arr = np.asarray(hips, dtype=np.float64)
+        box_arr = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        diag = np.hypot(box_arr[:, 2] - box_arr[:, 0], box_arr[:, 3] - box_arr[:, 1])
+        offset = np.hypot(*((box_arr[:, :2] + box_arr[:, 2:]) / 2 - hip_arr).T)
+        reach = 3.0 / 7.0 * (offset + math.sqrt(2) * diag)
+        # Inverted boxes break the bound; NaN radii make disc_pairs pair them with everyone
+        reach[(box_arr[:, 2] < box_arr[:, 0]) | (box_arr[:, 3] < box_arr[:, 1])] = np.nan
+        for i, j in disc_pairs(hip_arr, reach * (1 + 1e-6) + 1e-3):
+            normalized_distance = self._normalized_distance(hips[i], hips[j], boxes[i], boxes[j])
+            if normalized_distance < 0.3:
+                s.append("CLOSE_CONTACT")
+                acts.append("PHYSICAL_PROXIMITY")
+            if normalized_distance < 0.15:
+                s.append("BODY_COLLISION")
+                acts.append("PHYSICAL_CONTACT")
+        
+        # Wrist rules fire within 30 px (ASSAULT_HEAD) / 25 px (GRABBING)
+        targets = [(person, k[idx]) for person, k in enumerate(kps_all)
+                   for idx in self.WRIST_TARGET_KEYPOINTS]
+        grid = PointGrid([p for _, p in targets], [o for o, _ in targets], cell=32)
+        for i in range(n):
+            for j in sorted(grid.owners_near((kps_all[i][9], kps_all[i][10]))):
+                if j <= i:
+                    continue
+                if self._is_assault_head(kps_all[i], kps_all[j]):
+                    s.append("ASSAULT_HEAD")
+                    acts.append("PHYSICAL_ASSAULT")
+                if self._is_grabbing(kps_all[i], kps_all[j]):
+                    s.append("GRABBING")
+                    acts.append("RESTRAINING_MOTION")
+        
+        if self._any_following(kps_all, boxes, hip_arr):
+            acts.append("FOLLOWING_CHASING")
+        
+        # The pair loop's crowd check ignores the pair, so one call decides it
+        if n >= 3 and self._is_circle_formation([kps_all[0], kps_all[1]], kps_all):
+            acts.append("CROWD_FORMATION")
+        
+        # Some pair differs by more than 30 px in hip height iff the extremes do
+        finite = [i for i in range(n) if hips[i][1] == hips[i][1]]
+        if len(finite) >= 2:
+            top = max(finite, key=lambda i: hips[i][1])
+            bottom = min(finite, key=lambda i: hips[i][1])
+            if self._is_power_imbalance(hips[top], hips[bottom]):
+                s.append("POWER_IMBALANCE")
+                acts.append("DOMINANT_POSITION")
+        
+        # The loop's strong assault rule reduces to "some pair collided"
+        # (collision implies close contact; the gesture acts are never in acts)
+        if "BODY_COLLISION" in s:
+            s.append("DIRECT_ASSAULT")
+            acts.append("PHYSICAL_ASSAULT")
+        
+        return s, acts
+    
+    def _any_following(self, kps_all, boxes, hips, block=256):
+        """
+        Whether _is_following holds for any pair i < j. Screened with
+        vectorised math plus a small tolerance, then confirmed pair by pair
+        with the exact rule, best candidates first.
+        """
+        kps = np.asarray(kps_all, dtype=np.float64)
+        n = len(kps)
+        facing = kps[:, 0] - (kps[:, 5] + kps[:, 6]) / 2
+        mag = np.hypot(facing[:, 0], facing[:, 1])
+        with np.errstate(divide="ignore", invalid="ignore"):
+            direction = np.where((mag >= 1e-6)[:, None], facing / mag[:, None], [0.0, 1.0])
+        # Near the 1e-6 cut-off the exact rule may pick either direction
+        ambiguous = (mag > 0.5e-6) & (mag < 2e-6)
+        tolerance = 0.7 - 1e-4
+        
+        for start in range(0, n, block):
+            rows = np.arange(start, min(start + block, n))
+            to_target = hips[None, :, :] - hips[rows, None, :]
+            dist = np.hypot(to_target[..., 0], to_target[..., 1])
+            with np.errstate(divide="ignore", invalid="ignore"):
+                unit = to_target / dist[..., None]
+                dot = np.einsum("rjc,rc->rj", unit, direction[rows])
+                dot_down = unit[..., 1]
+            usable = (np.arange(n)[None, :] > rows[:, None]) & (dist >= 0.5e-6)
+            score = np.where(ambiguous[rows, None], np.fmax(dot, dot_down), dot)
+            score = np.where(usable & (score > tolerance), score, -np.inf)
+            
+            hits = np.flatnonzero(score > -np.inf)
+            for flat in hits[np.argsort(-score.ravel()[hits], kind="stable")]:
+                r, j = divmod(int(flat), n)
+                i = int(rows[r])
+                if self._is_following(kps_all[i], kps_all[j], boxes[i], boxes[j]):
+                    return True
+        return False
+    
+    # -------------------------------------------------
+    # PROFILING
+    # -------------------------------------------------
+    def enable_rule_timing(self, timer):
+        """Shadow each rule in TIMED_RULES with a timed wrapper on this instance"""
+        for name in self.TIMED_RULES:
+            method = getattr(type(self), name).__get__(self)
+            setattr(self, name, timer.wrap(name, method))
+
+    def disable_rule_timing(self):
+        """Drop the timed wrappers so rules resolve to the plain methods again"""
+        for name in self.TIMED_RULES:
+            self.__dict__.pop(name, None)
+
     # -------------------------------------------------
     # HELPER METHODS
     # -------------------------------------------------
@@ -311,6 +571,22 @@ class PoseCrimeDetector:
         knee_height_ratio = (k[13][1] + k[14][1]) / (2 * (k[11][1] + k[12][1]) / 2)
         return knee_height_ratio > 1.2  # Knees below hips
     
+    def _normalized_distance(self, hip1, hip2, box1, box2):
+        """Hip-center distance relative to the diagonal of both boxes"""
+        return self._distance(hip1, hip2) / self._calculate_frame_diagonal(box1, box2)
+    
+    def _is_assault_head(self, kps1, kps2):
+        """Check if a wrist of person 1 is near the head of person 2"""
+        for wrist_idx in [9, 10]:  # Left and right wrists
+            for head_idx in [0, 1, 2, 3, 4]:  # Head keypoints
+                if self._distance(kps1[wrist_idx], kps2[head_idx]) < 30:
+                    return True
+        return False
+    
+    def _is_power_imbalance(self, hip1, hip2):
+        """Check if one person is much lower than the other (standing over a victim)"""
+        return abs(hip1[1] - hip2[1]) > 30
+    
     def _get_hip_center(self, k):
         return [(k[11][0] + k[12][0])/2, (k[11][1] + k[12][1])/2]
     
@@ -381,21 +657,41 @@ class PoseCrimeDetector:
         std_distance = np.std(distances)
         return std_distance / avg_distance < 0.3
     
-    def _update_history(self, signals):
+    def _history(self, camera_id):
+        """Signal history for one camera (created on first use, dropped when idle)"""
+        now = time.monotonic()
+        if now >= self._next_history_prune:
+            self._next_history_prune = now + 60.0
+            cutoff = now - self.HISTORY_IDLE_SECONDS
+            for idle in [c for c, seen in list(self._history_seen.items()) if seen < cutoff]:
+                self.reset_history(idle)
+        self._history_seen[camera_id] = now
+        return self.frame_histories.setdefault(camera_id, [])
+    
+    def reset_history(self, camera_id=None):
+        """Forget temporal state for one camera, or for all cameras"""
+        if camera_id is None:
+            self.frame_histories.clear()
+            self._history_seen.clear()
+        else:
+            self.frame_histories.pop(camera_id, None)
+            self._history_seen.pop(camera_id, None)
+    
+    def _update_history(self, history, signals):
         """Maintain a simple history of signals"""
-        self.frame_history.append(set(signals))
-        if len(self.frame_history) > self.max_history:
-            self.frame_history.pop(0)
+        history.append(set(signals))
+        if len(history) > self.max_history:
+            history.pop(0)
     
-    def _temporal_analysis(self):
+    def _temporal_analysis(self, history):
         """Simple temporal analysis for sustained signals"""
-        if len(self.frame_history) < 3:
+        if len(history) < 3:
             return []
         
-        sustained_signals = set.intersection(*self.frame_history)
+        sustained_signals = set.intersection(*history)
         return list(sustained_signals)
     
-    def _calculate_threat_score(self, signals, activities, persons):
+    def _calculate_threat_score(self, signals, activities, persons, history):
         """Improved threat scoring"""
         score = 0
         
@@ -410,7 +706,8 @@ class PoseCrimeDetector:
             "DIRECT_ASSAULT": 35,
             "POWER_IMBALANCE": 20,
             "VULNERABLE_POSITION": 25,
-            "BODY_COLLISION": 25
+            "BODY_COLLISION": 25,
+            "WEAPON_IN_HAND": 35, "WEAPON_VISIBLE": 10
         }
         
         # Activity weights
@@ -420,7 +717,8 @@ class PoseCrimeDetector:
             "AGGRESSIVE_GESTURE": 10, "KICKING_MOTION": 10,
             "FOLLOWING_CHASING": 15, "CROWD_FORMATION": 10,
             "DEFENSIVE_POSTURE": 20,
-            "DOMINANT_POSITION": 20
+            "DOMINANT_POSITION": 20,
+            "ARMED_PERSON": 20
         }
         
         # Add signal scores
@@ -438,7 +736,7 @@ class PoseCrimeDetector:
             score *= 1.1
         
         # Sustained signals multiplier
-        if len(self.frame_history) >= 3 and len(set.intersection(*self.frame_history)) > 0:
+        if len(history) >= 3 and len(set.intersection(*history)) > 0:
             score *= 1.2
         
         return min(100, score)
@@ -470,10 +768,13 @@ class PoseCrimeDetector:
         if "GRAB_NECK_LEFT" in s or "GRAB_NECK_RIGHT" in s:
             return "Choking / Attempted Murder", "CRITICAL"
 
-        if ("WEAPON_THREAT_LEFT" in s or "WEAPON_THREAT_RIGHT" in s) and \
+        if ("WEAPON_THREAT_LEFT" in s or "WEAPON_THREAT_RIGHT" in s or "WEAPON_IN_HAND" in s) and \
            ("CLOSE_CONTACT" in s or "PHYSICAL_ASSAULT" in a):
             return "Assault with Weapon", "CRITICAL"
 
+        if "WEAPON_IN_HAND" in s:
+            return "Armed Person", "HIGH"
+
         if "GRABBING" in s and "FOLLOWING_CHASING" in a:
             return "Kidnapping / Abduction", "CRITICAL"
 
@@ -0,0 +1,264 @@
+"""
+Preview Server Module - On-demand MJPEG preview over HTTP
+
+Lets headless deployments (DISPLAY_ENABLED=False) still be watched from a
+browser:
+
+    GET /                      page showing the preview
+    GET /stream.mjpg           multipart/x-mixed-replace JPEG stream
+    GET /snapshot.jpg          latest frame as one JPEG
+
+The detector loop asks ``wants_frame()`` before doing any preview work. It
+is False while nobody is connected, so an unwatched preview costs nothing.
+While someone is watching it is True at most PREVIEW_FPS times per
+second, independent of the capture and analysis rates. ``publish()`` only
+copies the frame and its overlay data. Drawing and JPEG encoding run in the
+HTTP threads, once per published frame however many viewers there are.
+
+Usage:
+    preview = PreviewServer().start()
+    if preview.wants_frame(camera_id):
+        preview.publish(camera_id, frame, boxes=[(x1, y1, x2, y2, "person")], status="ACTIVE")
+"""
+
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import cv2
+
+from config import Config
+
+
+BOUNDARY = "frame"
+BOX_COLORS = {"person": (0, 200, 0)}
+DEFAULT_BOX_COLOR = (0, 0, 255)  # weapons and anything else
+
+PAGE = """<!doctype html>
+<html><head><title>Crime Detection Preview</title></head>
+<body style="margin:0;background:#111">
+<img src="/stream.mjpg{query}" style="max-width:100%;display:block;margin:auto">
+</body></html>
+"""
+
+
+def draw_overlay(frame, boxes: Sequence[Tuple] = (), status: str = ""):
+    """Draw labelled xyxy boxes and a status line onto ``frame`` in place"""
+    for x1, y1, x2, y2, label in boxes:
+        color = BOX_COLORS.get(label, DEFAULT_BOX_COLOR)
+        p1, p2 = (int(x1), int(y1)), (int(x2), int(y2))
+        cv2.rectangle(frame, p1, p2, color, 2)
+        cv2.putText(frame, str(label), (p1[0], max(p1[1] - 6, 12)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    if status:
+        cv2.putText(frame, status, (10, 24), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                    (255, 255, 255), 2, cv2.LINE_AA)
+    return frame
+
+
+class _Feed:
+    """Latest published frame of one camera and its encoded form"""
+
+    __slots__ = ("frame", "boxes", "status", "seq", "jpeg", "jpeg_seq", "viewers", "last_publish")
+
+    def __init__(self):
+        self.frame = None
+        self.boxes = ()
+        self.status = ""
+        self.seq = 0
+        self.jpeg = None
+        self.jpeg_seq = -1
+        self.viewers = 0
+        self.last_publish = float("-inf")
+
+
+class PreviewServer:
+    """Threaded HTTP server streaming annotated frames to connected viewers"""
+
+    def __init__(self, host="0.0.0.0", port=None, fps=None, jpeg_quality=None, max_width=None,
+                 default_camera=None):
+        self.host = host
+        self.port = Config.PREVIEW_PORT if port is None else port
+        self.fps = fps or Config.PREVIEW_FPS
+        self.jpeg_quality = jpeg_quality or Config.PREVIEW_JPEG_QUALITY
+        self.max_width = max_width or Config.PREVIEW_MAX_WIDTH
+
+        self._cond = threading.Condition()
+        self._encode_lock = threading.Lock()
+        self._feeds: Dict[str, _Feed] = {}
+        # Camera shown when a request has no camera_id (first published one if None)
+        self._default_camera: Optional[str] = default_camera
+        self._running = False
+        self.server = None
+        self._thread = None
+        self.stats = {"published": 0, "encoded": 0, "frames_sent": 0, "viewers_total": 0}
+
+    # -------------------------------------------------
+    # PRODUCER SIDE (detector loop)
+    # -------------------------------------------------
+    def wants_frame(self, camera_id) -> bool:
+        """True when someone is watching and the preview is due a new frame"""
+        feed = self._feeds.get(camera_id)
+        if feed is None or feed.viewers == 0:
+            return False
+        return time.monotonic() - feed.last_publish >= 1.0 / self.fps
+
+    def publish(self, camera_id, frame, boxes: Sequence[Tuple] = (), status: str = "") -> None:
+        """Hand over a frame (copied) plus the overlay to draw on it"""
+        h, w = frame.shape[:2]
+        if w > self.max_width:
+            scale = self.max_width / w
+            frame = cv2.resize(frame, (self.max_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+            boxes = [(x1 * scale, y1 * scale, x2 * scale, y2 * scale, label)
+                     for x1, y1, x2, y2, label in boxes]
+        else:
+            frame = frame.copy()
+
+        with self._cond:
+            feed = self._feed(camera_id)
+            feed.frame, feed.boxes, feed.status = frame, list(boxes), status
+            feed.seq += 1
+            feed.last_publish = time.monotonic()
+            self.stats["published"] += 1
+            self._cond.notify_all()
+
+    def _feed(self, camera_id) -> _Feed:
+        feed = self._feeds.get(camera_id)
+        if feed is None:
+            feed = self._feeds[camera_id] = _Feed()
+            if self._default_camera is None:
+                self._default_camera = camera_id
+        return feed
+
+    # -------------------------------------------------
+    # VIEWER SIDE (HTTP threads)
+    # -------------------------------------------------
+    def _jpeg(self, feed: _Feed) -> Tuple[int, Optional[bytes]]:
+        """Encoded latest frame; each published frame is drawn and encoded once"""
+        # Encoding happens outside _cond so publish() never waits on it
+        with self._encode_lock:
+            with self._cond:
+                if feed.frame is None or feed.jpeg_seq == feed.seq:
+                    return feed.seq, feed.jpeg
+                seq, frame, boxes, status = feed.seq, feed.frame, feed.boxes, feed.status
+            # ``frame`` is the preview's own copy, so drawing in place is safe
+            image = draw_overlay(frame, boxes, status)
+            ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            with self._cond:
+                feed.jpeg = buffer.tobytes() if ok else None
+                feed.jpeg_seq = seq
+                self.stats["encoded"] += 1
+                return seq, feed.jpeg
+
+    def _camera(self, query) -> Optional[str]:
+        camera_id = parse_qs(query).get("camera_id", [None])[0]
+        return camera_id if camera_id is not None else self._default_camera
+
+    def _stream(self, handler, camera_id) -> None:
+        handler.send_response(200)
+        handler.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        handler.send_header("Cache-Control", "no-cache, private")
+        handler.send_header("Pragma", "no-cache")
+        handler.end_headers()
+
+        with self._cond:
+            feed = self._feed(camera_id)
+            feed.viewers += 1
+            self.stats["viewers_total"] += 1
+        last_sent = 0
+        try:
+            while self._running:
+                with self._cond:
+                    self._cond.wait_for(lambda: feed.seq != last_sent or not self._running,
+                                        timeout=5.0)
+                    if not self._running:
+                        return
+                seq, jpeg = self._jpeg(feed)
+                if jpeg is None or seq == last_sent:
+                    last_sent = seq
+                    continue
+                handler.wfile.write(
+                    f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                    f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                handler.wfile.write(jpeg)
+                handler.wfile.write(b"\r\n")
+                last_sent = seq
+                self.stats["frames_sent"] += 1
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with self._cond:
+                feed.viewers -= 1
+
+    def _snapshot(self, handler, camera_id) -> None:
+        feed = self._feeds.get(camera_id)
+        jpeg = self._jpeg(feed)[1] if feed is not None else None
+        if jpeg is None:
+            # Frames are only published while someone is streaming
+            handler.send_error(503, "No preview frame available; open /stream.mjpg first")
+            return
+        handler.send_response(200)
+        handler.send_header("Content-Type", "image/jpeg")
+        handler.send_header("Content-Length", str(len(jpeg)))
+        handler.end_headers()
+        handler.wfile.write(jpeg)
+
+    def _handler(self):
+        preview = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                camera_id = preview._camera(url.query)
+                if url.path == "/stream.mjpg":
+                    preview._stream(self, camera_id)
+                elif url.path == "/snapshot.jpg":
+                    preview._snapshot(self, camera_id)
+                elif url.path == "/":
+                    body = PAGE.format(query=f"?{url.query}" if url.query else "").encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/html; charset=utf-8")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    # -------------------------------------------------
+    # LIFECYCLE
+    # -------------------------------------------------
+    def start(self) -> "PreviewServer":
+        self.server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        self._running = True
+        self._thread = threading.Thread(target=self.server.serve_forever, name="preview",
+                                        daemon=True)
+        self._thread.start()
+        print(f"📺 Preview at http://{self.host}:{self.port}/ (MJPEG, {self.fps:g} fps)")
+        return self
+
+    def stop(self) -> None:
+        if self.server is None:
+            return
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                **self.stats,
+                "viewers": sum(feed.viewers for feed in self._feeds.values()),
+                "cameras": len(self._feeds),
+            }
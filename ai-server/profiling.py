@@ -0,0 +1,333 @@
+"""
+Profiling Module - Opt-in profiling hooks for the detection hot path
+
+Two independent surfaces, both off by default:
+  * Request profiles: a sampled fraction of ``analyze_image`` calls run
+    under cProfile (deterministic) or a stack sampler (statistical) and
+    are merged into one aggregate.
+  * Rule timers: per-rule call counts and wall time inside
+    ``PoseCrimeDetector`` (each ``_is_*`` predicate and interaction rule).
+
+When disabled, ``profile_request`` returns a shared no-op context and the
+rule timers are not installed at all, so the hot path pays one attribute
+check per request.
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import random
+import pstats
+import cProfile
+import threading
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, List
+
+from config import Config
+
+
+MODES = ("cprofile", "sampling")
+_NOOP = nullcontext()
+
+
+class RuleTimer:
+    """Thread-safe call counters and wall time per rule name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = defaultdict(lambda: [0, 0.0, 0.0])  # calls, total_s, max_s
+
+    def record(self, name, elapsed):
+        with self._lock:
+            entry = self._stats[name]
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+
+    def wrap(self, name, func):
+        perf_counter = time.perf_counter
+        record = self.record
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+
+        timed.__wrapped__ = func
+        return timed
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            items = [(name, list(entry)) for name, entry in self._stats.items()]
+        rows = [{
+            "rule": name,
+            "calls": calls,
+            "total_ms": round(total * 1000, 3),
+            "avg_us": round(total / calls * 1e6, 2) if calls else 0.0,
+            "max_us": round(peak * 1e6, 2),
+        } for name, (calls, total, peak) in items]
+        return sorted(rows, key=lambda r: r["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class StackSampler:
+    """
+    Statistical profiler: samples the stacks of threads that are inside a
+    profiled request every ``interval`` seconds.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._self_counts = defaultdict(int)
+        self._total_counts = defaultdict(int)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=1.0)
+        self._thread = None
+
+    @contextmanager
+    def track(self):
+        ident = threading.get_ident()
+        with self._lock:
+            self._threads[ident] = self._threads.get(ident, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[ident] -= 1
+                if self._threads[ident] == 0:
+                    del self._threads[ident]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                tracked = set(self._threads)
+            if not tracked:
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in tracked:
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    self.samples += 1
+                    self._self_counts[self._label(frame)] += 1
+                    seen = set()
+                    while frame is not None:
+                        label = self._label(frame)
+                        if label not in seen:
+                            self._total_counts[label] += 1
+                            seen.add(label)
+                        frame = frame.f_back
+
+    @staticmethod
+    def _label(frame):
+        code = frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno}({code.co_name})"
+
+    def hot_functions(self, limit=25, sort="cumulative") -> List[Dict]:
+        with self._lock:
+            total = max(self.samples, 1)
+            counts = self._total_counts if sort == "cumulative" else self._self_counts
+            ranked = sorted(counts.items(), key=lambda kv: kv[1], reverse=True)[:limit]
+            return [{
+                "function": label,
+                "self_pct": round(self._self_counts.get(label, 0) * 100.0 / total, 2),
+                "cumulative_pct": round(self._total_counts.get(label, 0) * 100.0 / total, 2),
+                "samples": count,
+            } for label, count in ranked]
+
+    def reset(self):
+        with self._lock:
+            self._self_counts.clear()
+            self._total_counts.clear()
+            self.samples = 0
+
+
+class Profiler:
+    """Process-wide profiling switchboard used by the AI server"""
+
+    def __init__(self, enabled=False, sample_rate=0.05, mode="cprofile"):
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.mode = mode if mode in MODES else "cprofile"
+        self.rule_timer = RuleTimer()
+        self.sampler = StackSampler()
+        self._lock = threading.Lock()
+        # cProfile only supports one active profiler at a time
+        self._cprofile_busy = threading.Lock()
+        self._stats = None
+        self.requests_profiled = 0
+        self.requests_seen = 0
+        self.started_at = None
+        self._detectors = []
+        if enabled:
+            self.enable()
+
+    # -------------------------------------------------
+    # SWITCHES
+    # -------------------------------------------------
+    def attach(self, detector) -> None:
+        """Register a PoseCrimeDetector whose rules should be timed"""
+        self._detectors.append(detector)
+        if self.enabled:
+            detector.enable_rule_timing(self.rule_timer)
+
+    def enable(self, sample_rate=None, mode=None) -> None:
+        if sample_rate is not None:
+            self.sample_rate = max(0.0, min(1.0, float(sample_rate)))
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"mode must be one of {MODES}")
+            self.mode = mode
+        if self.mode == "sampling":
+            self.sampler.start()
+        else:
+            self.sampler.stop()
+        for detector in self._detectors:
+            detector.enable_rule_timing(self.rule_timer)
+        if not self.enabled:
+            self.started_at = datetime.now().isoformat()
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+        self.sampler.stop()
+        for detector in self._detectors:
+            detector.disable_rule_timing()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats = None
+            self.requests_profiled = 0
+            self.requests_seen = 0
+        self.rule_timer.reset()
+        self.sampler.reset()
+
+    # -------------------------------------------------
+    # REQUEST PROFILING
+    # -------------------------------------------------
+    def profile_request(self):
+        """Context manager around one analysis; a no-op unless enabled and sampled"""
+        if not self.enabled:
+            return _NOOP
+        self.requests_seen += 1
+        if random.random() >= self.sample_rate:
+            return _NOOP
+        if self.mode == "sampling":
+            self.requests_profiled += 1
+            return self.sampler.track()
+        return self._cprofile()
+
+    @contextmanager
+    def _cprofile(self):
+        if not self._cprofile_busy.acquire(blocking=False):
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                yield
+            finally:
+                profile.disable()
+        finally:
+            self._cprofile_busy.release()
+
+        with self._lock:
+            if self._stats is None:
+                self._stats = pstats.Stats(profile, stream=io.StringIO())
+            else:
+                self._stats.add(profile)
+            self.requests_profiled += 1
+
+    # -------------------------------------------------
+    # REPORTS
+    # -------------------------------------------------
+    def hot_functions(self, limit=25, sort="cumulative") -> List[Dict]:
+        if self.mode == "sampling":
+            return self.sampler.hot_functions(limit, sort)
+
+        with self._lock:
+            if self._stats is None:
+                return []
+            stats = self._stats
+            key = "cumtime" if sort == "cumulative" else "tottime"
+            rows = []
+            for (filename, line, name), (cc, nc, tt, ct, _) in stats.stats.items():
+                rows.append({
+                    "function": f"{os.path.basename(filename)}:{line}({name})",
+                    "calls": nc,
+                    "primitive_calls": cc,
+                    "tottime_ms": round(tt * 1000, 3),
+                    "cumtime_ms": round(ct * 1000, 3),
+                })
+        field = "cumtime_ms" if key == "cumtime" else "tottime_ms"
+        return sorted(rows, key=lambda r: r[field], reverse=True)[:limit]
+
+    def report(self, limit=25, sort="cumulative") -> Dict:
+        return {
+            "enabled": self.enabled,
+            "mode": self.mode,
+            "sample_rate": self.sample_rate,
+            "started_at": self.started_at,
+            "requests_seen": self.requests_seen,
+            "requests_profiled": self.requests_profiled,
+            "sampler_samples": self.sampler.samples,
+            "hot_functions": self.hot_functions(limit, sort),
+            "rules": self.rule_timer.snapshot(),
+        }
+
+    def dump(self, directory=None) -> Dict:
+        """
+        Write the aggregate to disk: a ``.prof`` file (cProfile mode, loadable
+        with pstats/snakeviz) and a JSON report with hot functions and rules.
+        """
+        directory = directory or Config.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        paths = {}
+
+        with self._lock:
+            if self._stats is not None:
+                prof_path = os.path.join(directory, f"profile_{stamp}.prof")
+                self._stats.dump_stats(prof_path)
+                paths["prof"] = prof_path
+
+        json_path = os.path.join(directory, f"profile_{stamp}.json")
+        with open(json_path, "w") as f:
+            json.dump(self.report(limit=100), f, indent=2)
+        paths["json"] = json_path
+        return paths
+
+
+profiler = Profiler(
+    enabled=Config.PROFILING_ENABLED,
+    sample_rate=Config.PROFILING_SAMPLE_RATE,
+    mode=Config.PROFILING_MODE,
+)
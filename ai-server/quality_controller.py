@@ -0,0 +1,179 @@
+"""
+Quality Controller Module - Latency-aware quality tiers for pose inference
+
+Rolling inference latency (p95 over QUALITY_WINDOW seconds) and the
+admission queue depth are compared against a target SLO. Under pressure the
+server steps down one tier at a time; once latency is well under the SLO
+with an empty queue for QUALITY_STEP_UP_AFTER seconds it steps back up:
+
+    full      1280 px input, model default size, tiling, all rules
+    reduced    960 px input, 512 px model size, tiling
+    fast       800 px input, 416 px model size, no tiling, interaction
+              rules skipped on frames without person or weapon signals
+    minimal    640 px input, 320 px model size, as fast, plus the light
+              model (QUALITY_LIGHT_MODEL) when one is configured
+
+Latency stays bounded at the cost of some recall on small or distant
+people. Keypoints from every tier are scaled back to the full tier's pixel
+space before the rules run, so their pixel thresholds do not tighten or
+loosen with the tier. The tier applied to a request is reported as
+``quality_tier``.
+
+Usage:
+    tier = quality.current()
+    result = detector.analyze(image, camera_id=cid, tier=tier)
+    quality.observe(elapsed_seconds)
+"""
+
+import time
+import threading
+from collections import deque
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from config import Config
+
+
+class QualityTier:
+    """Inference settings for one quality level"""
+
+    __slots__ = ("name", "max_dim", "imgsz", "tiling", "skip_quiet_interactions", "model")
+
+    def __init__(self, name, max_dim, imgsz=None, tiling=True, skip_quiet_interactions=False,
+                 model=None):
+        self.name = name
+        self.max_dim = max_dim    # preprocess resize limit (source pixels)
+        self.imgsz = imgsz        # pose model input size, None = model default
+        self.tiling = tiling
+        self.skip_quiet_interactions = skip_quiet_interactions
+        self.model = model        # alternative pose model, None = detector's own
+
+
+def default_tiers(light_model=None):
+    """Tiers from best quality to cheapest"""
+    return [
+        QualityTier("full", 1280),
+        QualityTier("reduced", 960, imgsz=512),
+        QualityTier("fast", 800, imgsz=416, tiling=False, skip_quiet_interactions=True),
+        QualityTier("minimal", 640, imgsz=320, tiling=False, skip_quiet_interactions=True,
+                    model=light_model),
+    ]
+
+
+class QualityController:
+    """Picks the quality tier from recent latency and queue depth"""
+
+    def __init__(self, queue_depth: Callable[[], int] = None, latency_slo=None, window=None,
+                 queue_high=None, step_up_after=None, adjust_interval=None, light_model=None,
+                 enabled=None, min_samples=5, recover_ratio=0.6):
+        self.queue_depth = queue_depth or (lambda: 0)
+        self.latency_slo = latency_slo or Config.QUALITY_LATENCY_SLO
+        self.window = window or Config.QUALITY_WINDOW
+        self.queue_high = queue_high or Config.QUALITY_QUEUE_HIGH
+        self.step_up_after = Config.QUALITY_STEP_UP_AFTER if step_up_after is None else step_up_after
+        self.adjust_interval = (Config.QUALITY_ADJUST_INTERVAL
+                                if adjust_interval is None else adjust_interval)
+        self.enabled = Config.QUALITY_CONTROL_ENABLED if enabled is None else enabled
+        self.min_samples = min_samples
+        self.recover_ratio = recover_ratio
+
+        if light_model is None:
+            light_model = Config.QUALITY_LIGHT_MODEL
+        if isinstance(light_model, str):
+            light_model = self._load_model(light_model) if light_model else None
+        self.tiers = default_tiers(light_model)
+
+        self._lock = threading.Lock()
+        self._index = 0
+        self._samples = deque()  # (monotonic time, seconds)
+        self._calm_since = None
+        self._last_change = float("-inf")
+        self.stats = {"step_downs": 0, "step_ups": 0}
+
+    @staticmethod
+    def _load_model(path):
+        try:
+            from ultralytics import YOLO
+            model = YOLO(path)
+            print(f"✅ Light pose model loaded for the minimal quality tier: {path}")
+            return model
+        except Exception as e:
+            print(f"⚠️ Light pose model unavailable ({path}): {e}")
+            return None
+
+    # -------------------------------------------------
+    # FEEDBACK
+    # -------------------------------------------------
+    def observe(self, seconds: float, now: float = None) -> None:
+        """Record one inference latency"""
+        if not self.enabled:
+            return
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._samples.append((now, seconds))
+            self._adjust(now)
+
+    def current(self, now: float = None) -> QualityTier:
+        """Tier for the next request"""
+        if not self.enabled:
+            return self.tiers[0]
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            # Idle servers recover here, since nothing calls observe()
+            self._adjust(now)
+            return self.tiers[self._index]
+
+    def _p95(self, now) -> Optional[float]:
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+        if len(self._samples) < self.min_samples:
+            return None
+        return float(np.percentile([s for _, s in self._samples], 95))
+
+    def _adjust(self, now) -> None:
+        p95 = self._p95(now)
+        depth = self.queue_depth()
+        if now - self._last_change < self.adjust_interval:
+            return
+
+        overloaded = depth >= self.queue_high or (p95 is not None and p95 > self.latency_slo)
+        calm = depth == 0 and (p95 is None or p95 < self.latency_slo * self.recover_ratio)
+
+        if overloaded:
+            self._calm_since = None
+            if self._index < len(self.tiers) - 1:
+                self._change(self._index + 1, now)
+                self.stats["step_downs"] += 1
+        elif calm and self._index > 0:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.step_up_after:
+                self._change(self._index - 1, now)
+                self.stats["step_ups"] += 1
+        else:
+            self._calm_since = None
+
+    def _change(self, index, now) -> None:
+        previous = self.tiers[self._index].name
+        self._index = index
+        self._last_change = now
+        self._calm_since = None
+        # Latencies measured at the old tier say nothing about the new one
+        self._samples.clear()
+        print(f"🎚️ Quality tier: {previous} → {self.tiers[index].name}")
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            p95 = self._p95(time.monotonic())
+            return {
+                "enabled": self.enabled,
+                "tier": self.tiers[self._index].name,
+                "tier_index": self._index,
+                "p95_latency_ms": round(p95 * 1000, 2) if p95 is not None else None,
+                "latency_slo_ms": round(self.latency_slo * 1000, 2),
+                "samples": len(self._samples),
+                "queue_depth": self.queue_depth(),
+                "light_model": self.tiers[-1].model is not None,
+                **self.stats,
+            }
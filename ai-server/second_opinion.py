@@ -0,0 +1,383 @@
+"""
+Second Opinion Module - Budgeted external review of ambiguous frames
+
+Frames whose local threat score falls in the gray band
+(SECOND_OPINION_BAND_LOW..HIGH) can be escalated to a slower, paid vision
+analyzer. Escalation never delays the caller: ``escalate()`` returns a
+ticket id at once and the analyzer runs on a small thread pool.
+
+Spend is bounded several ways:
+    concurrency     at most SECOND_OPINION_CONCURRENCY calls in flight
+    rate            token bucket, SECOND_OPINION_RATE_PER_MIN with a burst
+    budget          SECOND_OPINION_DAILY_BUDGET (USD) per calendar day
+    cache           verdicts keyed by camera, the local verdict (type, level,
+                    person count, signals) and a perceptual frame hash, so
+                    a static scene sent again is answered without another
+                    call, but a frame where anything local changed is not
+
+A call that has not answered within SECOND_OPINION_TIMEOUT resolves to the
+local verdict. A late answer is still cached for the next similar frame.
+
+Analyzers are pluggable: anything with ``analyze(jpeg, context) -> dict``
+and a ``cost`` attribute. OpenAIVisionAnalyzer uses the chat completions
+API; StubAnalyzer is a local stand-in for tests and offline setups.
+"""
+
+import json
+import time
+import uuid
+import base64
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+import requests
+
+from config import Config
+
+
+THREAT_LEVELS = ("LOW", "MEDIUM", "HIGH", "CRITICAL")
+
+PROMPT = (
+    "You are reviewing a CCTV frame flagged as ambiguous by a pose-based crime detector. "
+    "Local signals: {signals}. Local verdict: {crime_type} ({threat_level}, score {threat_score}). "
+    "Reply with JSON only: {{\"crime_detected\": bool, \"crime_type\": str, "
+    "\"threat_level\": \"LOW\"|\"MEDIUM\"|\"HIGH\"|\"CRITICAL\", \"confidence\": 0-1, "
+    "\"reason\": str}}."
+)
+
+
+# -------------------------------------------------
+# ANALYZERS
+# -------------------------------------------------
+class OpenAIVisionAnalyzer:
+    """Vision model behind the OpenAI chat completions API"""
+
+    URL = "https://api.openai.com/v1/chat/completions"
+
+    def __init__(self, api_key=None, model=None, timeout=None, cost=None):
+        self.api_key = api_key or Config.OPENAI_API_KEY
+        self.model = model or Config.AI_MODEL
+        self.timeout = timeout or Config.SECOND_OPINION_TIMEOUT
+        self.cost = Config.SECOND_OPINION_COST_PER_CALL if cost is None else cost
+        self.session = requests.Session()
+
+    def analyze(self, jpeg: bytes, context: Dict) -> Dict:
+        image_url = "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii")
+        response = self.session.post(
+            self.URL,
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={
+                "model": self.model,
+                "max_tokens": 200,
+                "messages": [{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": PROMPT.format(**context)},
+                        {"type": "image_url", "image_url": {"url": image_url, "detail": "low"}},
+                    ],
+                }],
+            },
+            timeout=self.timeout,
+        )
+        response.raise_for_status()
+        text = response.json()["choices"][0]["message"]["content"].strip()
+        # Models sometimes wrap JSON in a code fence
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[len("json"):]
+        return json.loads(text.strip())
+
+
+class StubAnalyzer:
+    """Local stand-in: agrees with the local rules above a score cutoff"""
+
+    def __init__(self, cutoff=45, delay=0.0, cost=0.0):
+        self.cutoff = cutoff
+        self.delay = delay
+        self.cost = cost
+        self.calls = 0
+
+    def analyze(self, jpeg: bytes, context: Dict) -> Dict:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        crime = float(context.get("threat_score", 0)) >= self.cutoff
+        return {
+            "crime_detected": crime,
+            "crime_type": context.get("crime_type", "Unknown") if crime else "Normal",
+            "threat_level": "HIGH" if crime else "LOW",
+            "confidence": 0.5,
+            "reason": f"stub: threat score {'>=' if crime else '<'} {self.cutoff}",
+        }
+
+
+def create_analyzer(name=None):
+    """Analyzer named by SECOND_OPINION_ANALYZER ("openai" or "stub")"""
+    name = (name or Config.SECOND_OPINION_ANALYZER).lower()
+    if name == "openai":
+        if not Config.OPENAI_API_KEY:
+            print("⚠️ OPENAI_API_KEY not set; second opinions use the stub analyzer")
+            return StubAnalyzer()
+        return OpenAIVisionAnalyzer()
+    if name == "stub":
+        return StubAnalyzer()
+    raise ValueError(f"Unknown second-opinion analyzer: {name}")
+
+
+# -------------------------------------------------
+# HELPERS
+# -------------------------------------------------
+def frame_hash(image) -> int:
+    """64-bit difference hash; re-encoded or near-identical frames collide"""
+    gray = image if image.ndim == 2 else cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    thumb = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumb[:, 1:] > thumb[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+class TokenBucket:
+    """``rate`` tokens per second up to ``burst``"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self, now=None) -> bool:
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1.0:
+            return False
+        self.tokens -= 1.0
+        return True
+
+
+def normalize_verdict(verdict: Dict) -> Dict:
+    level = str(verdict.get("threat_level", "LOW")).upper()
+    return {
+        "crime_detected": bool(verdict.get("crime_detected", False)),
+        "crime_type": str(verdict.get("crime_type", "Unknown")),
+        "threat_level": level if level in THREAT_LEVELS else "LOW",
+        "confidence": round(min(max(float(verdict.get("confidence", 0.0)), 0.0), 1.0), 3),
+        "reason": str(verdict.get("reason", ""))[:500],
+    }
+
+
+class _Review:
+    __slots__ = ("id", "camera_id", "local", "remote", "status", "submitted", "finished",
+                 "cached", "error")
+
+    def __init__(self, camera_id, local, submitted):
+        self.id = uuid.uuid4().hex[:16]
+        self.camera_id = camera_id
+        self.local = local
+        self.remote = None
+        self.status = "pending"
+        self.submitted = submitted
+        self.finished = None
+        self.cached = False
+        self.error = None
+
+
+# -------------------------------------------------
+# ESCALATION TIER
+# -------------------------------------------------
+class SecondOpinion:
+    """Asynchronous, budgeted escalation of gray-band frames"""
+
+    def __init__(self, analyzer=None, band_low=None, band_high=None, max_concurrency=None,
+                 rate_per_min=None, burst=None, daily_budget=None, timeout=None,
+                 cache_size=256, max_reviews=1000, max_image_dim=1024):
+        self.analyzer = analyzer or create_analyzer()
+        self.band_low = Config.SECOND_OPINION_BAND_LOW if band_low is None else band_low
+        self.band_high = Config.SECOND_OPINION_BAND_HIGH if band_high is None else band_high
+        self.max_concurrency = max_concurrency or Config.SECOND_OPINION_CONCURRENCY
+        rate_per_min = rate_per_min or Config.SECOND_OPINION_RATE_PER_MIN
+        self.bucket = TokenBucket(rate_per_min / 60.0, burst or Config.SECOND_OPINION_BURST)
+        self.daily_budget = (Config.SECOND_OPINION_DAILY_BUDGET
+                             if daily_budget is None else daily_budget)
+        self.timeout = timeout or Config.SECOND_OPINION_TIMEOUT
+        self.cache_size = cache_size
+        self.max_reviews = max_reviews
+        self.max_image_dim = max_image_dim
+
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency,
+                                            thread_name_prefix="second-opinion")
+        self._in_flight = 0
+        self._cache: "OrderedDict[tuple, Dict]" = OrderedDict()
+        self._reviews: "OrderedDict[str, _Review]" = OrderedDict()
+        self._spent_day = date.today()
+        self._spent = 0.0
+        self.stats = {"escalated": 0, "cache_hits": 0, "completed": 0, "timeouts": 0,
+                      "errors": 0, "skipped_band": 0, "skipped_busy": 0, "skipped_rate": 0,
+                      "skipped_budget": 0, "agreed": 0, "overruled": 0}
+
+    def in_band(self, detection: Dict) -> bool:
+        return self.band_low <= float(detection.get("threat_score", 0) or 0) <= self.band_high
+
+    # -------------------------------------------------
+    # SUBMIT
+    # -------------------------------------------------
+    def escalate(self, camera_id, image, detection: Dict) -> Optional[Dict]:
+        """
+        Queue a review when the frame is ambiguous and the budget allows.
+        Returns ``{"id", "status"}`` or None; never waits on the analyzer.
+        ``image`` must not be modified by the caller afterwards.
+        """
+        if not self.in_band(detection):
+            with self._lock:
+                self.stats["skipped_band"] += 1
+            return None
+
+        local = {
+            "crime_detected": bool(detection.get("crime_detected")),
+            "crime_type": detection.get("type", detection.get("crime_type", "Unknown")),
+            "threat_level": detection.get("threat_level", "LOW"),
+            "threat_score": detection.get("threat_score", 0),
+            "signals": list(detection.get("signals", [])),
+        }
+        # The coarse frame hash alone would replay a verdict for a frame with
+        # a small new figure in it; what the local detector saw must match too
+        key = (camera_id, local["crime_type"], local["threat_level"],
+               int(detection.get("persons_detected", 0) or 0), tuple(sorted(local["signals"])),
+               frame_hash(image))
+        now = time.monotonic()
+
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                review = self._remember(_Review(camera_id, local, now))
+                review.remote, review.cached = cached, True
+                self._finish(review, "done", now)
+                return {"id": review.id, "status": review.status}
+
+            skip = self._skip_reason(now)
+            if skip:
+                self.stats[skip] += 1
+                return None
+
+            self._in_flight += 1
+            self._charge(self.analyzer.cost)
+            self.stats["escalated"] += 1
+            review = self._remember(_Review(camera_id, local, now))
+
+        self._executor.submit(self._run, review, image, key)
+        return {"id": review.id, "status": review.status}
+
+    def _skip_reason(self, now) -> Optional[str]:
+        if self._in_flight >= self.max_concurrency:
+            return "skipped_busy"
+        if self._remaining_budget() < self.analyzer.cost:
+            return "skipped_budget"
+        if not self.bucket.take(now):
+            return "skipped_rate"
+        return None
+
+    def _remaining_budget(self) -> float:
+        today = date.today()
+        if today != self._spent_day:
+            self._spent_day, self._spent = today, 0.0
+        return self.daily_budget - self._spent
+
+    def _charge(self, cost) -> None:
+        self._remaining_budget()
+        self._spent += cost
+
+    def _remember(self, review: _Review) -> _Review:
+        self._reviews[review.id] = review
+        while len(self._reviews) > self.max_reviews:
+            self._reviews.popitem(last=False)
+        return review
+
+    # -------------------------------------------------
+    # WORKER
+    # -------------------------------------------------
+    def _run(self, review: _Review, image, key) -> None:
+        try:
+            h, w = image.shape[:2]
+            if max(h, w) > self.max_image_dim:
+                scale = self.max_image_dim / max(h, w)
+                image = cv2.resize(image, (int(w * scale), int(h * scale)),
+                                   interpolation=cv2.INTER_AREA)
+            ok, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            if not ok:
+                raise ValueError("could not encode frame")
+            remote = normalize_verdict(self.analyzer.analyze(buffer.tobytes(), review.local))
+        except Exception as e:
+            with self._lock:
+                self._in_flight -= 1
+                self.stats["errors"] += 1
+                review.error = str(e)[:200]
+                self._finish(review, "error", time.monotonic())
+            return
+
+        with self._lock:
+            self._in_flight -= 1
+            self._cache[key] = remote
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            if review.status == "pending":
+                review.remote = remote
+                self._finish(review, "done", time.monotonic())
+
+    def _finish(self, review: _Review, status, now) -> None:
+        review.status = status
+        review.finished = now
+        if status == "done":
+            self.stats["completed"] += 1
+            agreed = review.remote["crime_detected"] == review.local["crime_detected"]
+            self.stats["agreed" if agreed else "overruled"] += 1
+
+    # -------------------------------------------------
+    # RESULTS
+    # -------------------------------------------------
+    def result(self, review_id) -> Optional[Dict]:
+        """Review state; past the timeout a pending review settles on the local verdict"""
+        now = time.monotonic()
+        with self._lock:
+            review = self._reviews.get(review_id)
+            if review is None:
+                return None
+            if review.status == "pending" and now - review.submitted > self.timeout:
+                self.stats["timeouts"] += 1
+                self._finish(review, "timeout", now)
+
+            # Errors and timeouts fall back to what the local rules said
+            final = review.remote if review.status == "done" else review.local
+            elapsed = (review.finished or now) - review.submitted
+            return {
+                "id": review.id,
+                "camera_id": review.camera_id,
+                "status": review.status,
+                "cached": review.cached,
+                "local": review.local,
+                "remote": review.remote,
+                "final": {k: final[k] for k in ("crime_detected", "crime_type", "threat_level")},
+                "error": review.error,
+                "elapsed_ms": round(elapsed * 1000, 1),
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                **self.stats,
+                "analyzer": type(self.analyzer).__name__,
+                "in_flight": self._in_flight,
+                "band": [self.band_low, self.band_high],
+                "spent_today": round(self._spent, 4),
+                "daily_budget": self.daily_budget,
+                "cached_verdicts": len(self._cache),
+            }
@@ -0,0 +1,601 @@
+"""
+Shard Router Module - Camera-affinity sharding across AI server instances
+
+Temporal state (pose history, detection persistence, scheduler levels,
+analysis history) lives per camera inside one image_detector.py process, so
+every request for a camera must reach the same instance. A round-robin
+balancer would split it. Cameras are instead placed on a consistent-hash
+ring:
+
+    ring      SHARD_VNODES points per node, hashed with blake2b
+    owner     first healthy node clockwise from hash(camera_id)
+
+A node joining or leaving only moves the cameras on the arcs it gains or
+loses (about 1/N of them). A node that fails SHARD_FAIL_THRESHOLD health
+checks, or refuses a forwarded connection, is skipped. Only its cameras move,
+each to the next node on the ring, where they start with fresh temporal
+state. They move back once the node passes a health check again.
+
+Two ways to use it:
+    HTTP front end with the image_detector.py API, forwarding each request to
+    the camera's owner (camera_id from the query string or form, "Unknown"
+    when absent, as in image_detector.py):
+        python shard_router.py --nodes http://10.0.0.5:8000,http://10.0.0.6:8000
+
+    Client library talking to the owner directly, without the extra hop:
+        client = ShardClient(["http://10.0.0.5:8000", "http://10.0.0.6:8000"])
+        client.detect_image(jpeg_bytes, camera_id="cam01")
+        client.stream_url("cam01")   # ws://<owner>:<stream port>/stream?camera_id=cam01
+
+Local cluster for testing (AI server processes on AI_SERVER_PORT+1.., their
+stream servers on STREAM_PORT+1..):
+    python shard_router.py --spawn 3
+"""
+
+import os
+import sys
+import time
+import atexit
+import bisect
+import hashlib
+import argparse
+import threading
+import subprocess
+from datetime import datetime
+from functools import wraps
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from urllib3.exceptions import NewConnectionError
+from flask import Flask, Response, jsonify, request
+from flask_cors import CORS
+
+from config import Config
+
+
+DEFAULT_CAMERA = "Unknown"  # image_detector.py's camera_id when none is sent
+
+# Response headers passed back from the owning node
+PASSTHROUGH_HEADERS = ("Content-Type", "Retry-After")
+LOOPBACK_ADDRS = ("127.0.0.1", "::1")  # admin callers allowed when ADMIN_TOKEN is unset
+
+
+class NoHealthyNode(Exception):
+    """Raised when no node on the ring can take a request"""
+
+
+def parse_nodes(value: str) -> List[str]:
+    """Comma-separated base URLs -> normalized list"""
+    return [node.strip().rstrip("/") for node in value.split(",") if node.strip()]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+# -------------------------------------------------
+# CONSISTENT-HASH RING
+# -------------------------------------------------
+class HashRing:
+    """Consistent-hash ring with virtual nodes"""
+
+    def __init__(self, nodes=(), vnodes=None):
+        self.vnodes = vnodes or Config.SHARD_VNODES
+        self.nodes: List[str] = []
+        self._ring: Tuple[List[int], List[str], int] = ([], [], 0)
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str) -> bool:
+        if node in self.nodes:
+            return False
+        self.nodes = self.nodes + [node]
+        self._rebuild()
+        return True
+
+    def remove(self, node: str) -> bool:
+        if node not in self.nodes:
+            return False
+        self.nodes = [n for n in self.nodes if n != node]
+        self._rebuild()
+        return True
+
+    def _rebuild(self) -> None:
+        points = sorted((_hash(f"{node}#{i}"), node)
+                        for node in self.nodes for i in range(self.vnodes))
+        # Swapped in one assignment so lookups never see a half-built ring
+        self._ring = ([p for p, _ in points], [n for _, n in points], len(self.nodes))
+
+    def candidates(self, key: str) -> Iterator[str]:
+        """Distinct nodes in ring order, starting with the key's owner"""
+        points, owners, count = self._ring
+        if not points:
+            return
+        start = bisect.bisect(points, _hash(key))
+        seen = set()
+        for i in range(len(points)):
+            node = owners[(start + i) % len(points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == count:
+                    return
+
+    def owner(self, key: str) -> Optional[str]:
+        return next(self.candidates(key), None)
+
+
+class _NodeHealth:
+    __slots__ = ("healthy", "failures", "last_check", "latency_ms", "error", "stream_port")
+
+    def __init__(self):
+        self.healthy = True  # optimistic until the first check
+        self.failures = 0
+        self.last_check = None
+        self.latency_ms = None
+        self.error = None
+        self.stream_port = None
+
+
+# -------------------------------------------------
+# ROUTER
+# -------------------------------------------------
+class ShardRouter:
+    """Ring plus node health; forwards requests to a camera's owner"""
+
+    def __init__(self, nodes: List[str] = None, vnodes=None, health_interval=None,
+                 health_timeout=None, fail_threshold=None, request_timeout=None):
+        if nodes is None:
+            nodes = parse_nodes(Config.SHARD_NODES)
+        self.ring = HashRing(nodes, vnodes)
+        self.health_interval = health_interval or Config.SHARD_HEALTH_INTERVAL
+        self.health_timeout = health_timeout or Config.SHARD_HEALTH_TIMEOUT
+        self.fail_threshold = fail_threshold or Config.SHARD_FAIL_THRESHOLD
+        self.request_timeout = request_timeout or Config.SHARD_REQUEST_TIMEOUT
+
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self._health: Dict[str, _NodeHealth] = {node: _NodeHealth() for node in self.ring.nodes}
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"forwarded": 0, "failovers": 0, "unavailable": 0, "nodes_down": 0,
+                      "nodes_up": 0}
+
+    # -------------------------------------------------
+    # MEMBERSHIP
+    # -------------------------------------------------
+    def add_node(self, node: str) -> bool:
+        node = node.rstrip("/")
+        with self._lock:
+            self._health.setdefault(node, _NodeHealth())
+        added = self.ring.add(node)
+        if added:
+            print(f"➕ Shard node joined: {node}")
+            self.check(node)
+        return added
+
+    def remove_node(self, node: str) -> bool:
+        node = node.rstrip("/")
+        removed = self.ring.remove(node)
+        with self._lock:
+            self._health.pop(node, None)
+        if removed:
+            print(f"➖ Shard node left: {node}")
+        return removed
+
+    # -------------------------------------------------
+    # HEALTH
+    # -------------------------------------------------
+    def is_healthy(self, node: str) -> bool:
+        health = self._health.get(node)
+        return health is not None and health.healthy
+
+    def check(self, node: str) -> bool:
+        """One /health probe; updates and returns the node's state"""
+        start = time.monotonic()
+        try:
+            response = self.session.get(f"{node}/health", timeout=self.health_timeout)
+            ok = response.status_code == 200 and response.json().get("model_loaded", False)
+            error = None if ok else f"HTTP {response.status_code}"
+        except (requests.RequestException, ValueError) as e:
+            ok, error = False, str(e)
+        latency_ms = round((time.monotonic() - start) * 1000, 2)
+
+        if ok:
+            self.mark_up(node, latency_ms)
+        else:
+            # A node failing its very first check is not assumed up any longer
+            health = self._health.get(node)
+            self.mark_failure(node, error, immediate=health is not None and health.last_check is None)
+        return ok
+
+    def check_all(self) -> None:
+        for node in self.ring.nodes:
+            self.check(node)
+
+    def mark_up(self, node: str, latency_ms=None) -> None:
+        with self._lock:
+            health = self._health.get(node)
+            if health is None:
+                return
+            if not health.healthy:
+                self.stats["nodes_up"] += 1
+                print(f"✅ Shard node back up: {node}")
+            health.healthy, health.failures, health.error = True, 0, None
+            health.last_check = time.time()
+            health.latency_ms = latency_ms
+
+    def mark_failure(self, node: str, error: str = None, immediate: bool = False) -> None:
+        """Count a failure; the node is skipped after fail_threshold of them"""
+        with self._lock:
+            health = self._health.get(node)
+            if health is None:
+                return
+            health.failures += 1
+            health.error = error
+            health.last_check = time.time()
+            if health.healthy and (immediate or health.failures >= self.fail_threshold):
+                health.healthy = False
+                self.stats["nodes_down"] += 1
+                print(f"⚠️ Shard node down: {node} ({error})")
+
+    def _health_loop(self) -> None:
+        while not self._stop.wait(self.health_interval):
+            self.check_all()
+
+    def start(self) -> "ShardRouter":
+        """First health check now, then every health_interval in a thread"""
+        self.check_all()
+        self._thread = threading.Thread(target=self._health_loop, name="shard-health", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # -------------------------------------------------
+    # ROUTING
+    # -------------------------------------------------
+    def node_for(self, camera_id) -> Optional[str]:
+        """Healthy node currently owning ``camera_id``"""
+        for node in self.ring.candidates(str(camera_id or DEFAULT_CAMERA)):
+            if self.is_healthy(node):
+                return node
+        return None
+
+    def forward(self, camera_id, method: str, path: str, **kwargs) -> Tuple[str, requests.Response]:
+        """
+        Send a request to the camera's owner and return (node, response).
+
+        A connection that was never established (refused, unreachable or
+        a connect timeout) marks the node down and retries on the next node
+        of the ring; nothing was processed, so that is safe. A connection
+        dropped mid-request, read timeouts and HTTP errors (503 from
+        admission control included) are returned or raised as they are:
+        the node may already have processed the request and still holds
+        the camera's temporal state.
+        """
+        kwargs.setdefault("timeout", self.request_timeout)
+        owner = None
+        for node in self.ring.candidates(str(camera_id or DEFAULT_CAMERA)):
+            if owner is None:
+                owner = node
+            if not self.is_healthy(node):
+                continue
+            try:
+                response = self.session.request(method, f"{node}{path}", **kwargs)
+            except requests.ConnectionError as e:
+                if not _never_connected(e):
+                    self.mark_failure(node, str(e))
+                    raise
+                self.mark_failure(node, str(e), immediate=True)
+                continue
+            with self._lock:
+                self.stats["forwarded"] += 1
+                if node != owner:
+                    self.stats["failovers"] += 1
+            return node, response
+
+        with self._lock:
+            self.stats["unavailable"] += 1
+        raise NoHealthyNode(f"No healthy AI server for camera {camera_id or DEFAULT_CAMERA}")
+
+    def stream_port(self, node: str) -> Optional[int]:
+        """A node's WebSocket/SSE port, read once from its /metrics"""
+        health = self._health.get(node)
+        if health is None:
+            return None
+        if health.stream_port is None:
+            try:
+                metrics = self.session.get(f"{node}/metrics", timeout=self.health_timeout).json()
+                health.stream_port = (metrics.get("stream") or {}).get("port")
+            except (requests.RequestException, ValueError):
+                return None
+        return health.stream_port
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            nodes = {node: {
+                "healthy": h.healthy,
+                "failures": h.failures,
+                "latency_ms": h.latency_ms,
+                "last_check": datetime.fromtimestamp(h.last_check).isoformat() if h.last_check else None,
+                "error": h.error,
+            } for node, h in self._health.items()}
+            return {
+                "nodes": nodes,
+                "healthy_nodes": sum(1 for h in self._health.values() if h.healthy),
+                "vnodes": self.ring.vnodes,
+                **self.stats,
+            }
+
+
+# -------------------------------------------------
+# CLIENT LIBRARY
+# -------------------------------------------------
+class ShardClient:
+    """Calls the owning AI server directly, with the router's failover"""
+
+    def __init__(self, nodes: List[str] = None, router: ShardRouter = None, health_checks=True):
+        self.router = router or ShardRouter(nodes)
+        if health_checks and router is None:
+            self.router.start()
+
+    def node_for(self, camera_id) -> Optional[str]:
+        return self.router.node_for(camera_id)
+
+    def detect_image(self, image: bytes, camera_id: str, filename="frame.jpg", **fields) -> Dict:
+        """POST /detect-image on the camera's owner; extra fields go into the form"""
+        _, response = self.router.forward(
+            camera_id, "POST", "/detect-image",
+            files={"image": (filename, image, "image/jpeg")},
+            data={"camera_id": camera_id, **fields})
+        return response.json()
+
+    def analyze_keypoints(self, body: bytes, camera_id: str,
+                          content_type="application/octet-stream") -> Dict:
+        """POST /analyze-keypoints for one camera's frames"""
+        _, response = self.router.forward(
+            camera_id, "POST", "/analyze-keypoints", params={"camera_id": camera_id},
+            data=body, headers={"Content-Type": content_type})
+        return response.json()
+
+    def history(self, camera_id: str, **params) -> Dict:
+        _, response = self.router.forward(camera_id, "GET", "/history",
+                                          params={"camera_id": camera_id, **params})
+        return response.json()
+
+    def stream_url(self, camera_id: str) -> Optional[str]:
+        """WebSocket URL on the camera's owner (see stream_server.py)"""
+        node = self.node_for(camera_id)
+        port = self.router.stream_port(node) if node else None
+        if port is None:
+            return None
+        return f"ws://{urlparse(node).hostname}:{port}/stream?camera_id={camera_id}"
+
+    def close(self) -> None:
+        self.router.stop()
+        self.router.session.close()
+
+
+def _never_connected(error: requests.ConnectionError) -> bool:
+    """True when the request cannot have reached the node (safe to send elsewhere)"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = error.args[0] if error.args else None
+    reason = getattr(reason, "reason", reason)  # urllib3's MaxRetryError wraps the cause
+    return isinstance(reason, (NewConnectionError, ConnectionRefusedError))
+
+
+# -------------------------------------------------
+# HTTP FRONT END
+# -------------------------------------------------
+def create_app(router: ShardRouter) -> Flask:
+    """Flask app exposing the image_detector.py API through the router"""
+    app = Flask(__name__)
+    CORS(app)
+
+    def require_admin(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if Config.ADMIN_TOKEN:
+                allowed = request.headers.get("X-Admin-Token") == Config.ADMIN_TOKEN
+                message = "Invalid or missing admin token"
+            else:
+                # No token configured: admin endpoints answer local callers only
+                allowed = request.remote_addr in LOOPBACK_ADDRS
+                message = "Admin endpoints are local-only until ADMIN_TOKEN is set"
+            if not allowed:
+                return jsonify({
+                    "success": False,
+                    "type": "UNAUTHORIZED",
+                    "message": message
+                }), 401
+            return view(*args, **kwargs)
+        return wrapper
+
+    def unavailable(error):
+        response = jsonify({"success": False, "type": "NO_HEALTHY_NODE", "message": str(error)})
+        response.status_code = 503
+        response.headers["Retry-After"] = str(max(int(router.health_interval), 1))
+        return response
+
+    def relay(node, upstream):
+        headers = {k: upstream.headers[k] for k in PASSTHROUGH_HEADERS if k in upstream.headers}
+        headers["X-Shard-Node"] = node
+        return Response(upstream.content, status=upstream.status_code, headers=headers)
+
+    def proxy(camera_id):
+        # Cache the body first; Flask parses the form from the cached copy
+        body = request.get_data()
+        headers = {"Content-Type": request.content_type} if request.content_type else {}
+        try:
+            node, upstream = router.forward(camera_id, request.method, request.path,
+                                            params=request.args, data=body, headers=headers)
+        except NoHealthyNode as e:
+            return unavailable(e)
+        except requests.RequestException as e:
+            return jsonify({"success": False, "type": "UPSTREAM_ERROR", "message": str(e)}), 502
+        return relay(node, upstream)
+
+    def fan_out(path):
+        """Camera-less queries go to every healthy node, results keyed by node"""
+        results = {}
+        for node in router.ring.nodes:
+            if not router.is_healthy(node):
+                continue
+            try:
+                upstream = router.session.get(f"{node}{path}", params=request.args,
+                                              timeout=router.request_timeout)
+                results[node] = upstream.json()
+            except (requests.RequestException, ValueError) as e:
+                results[node] = {"success": False, "message": str(e)}
+        return jsonify({"success": True, "nodes": results})
+
+    @app.route("/detect-image", methods=["POST"])
+    @app.route("/batch-detect", methods=["POST"])
+    def detect_image():
+        request.get_data()
+        return proxy(request.form.get("camera_id") or request.args.get("camera_id"))
+
+    @app.route("/analyze-keypoints", methods=["POST"])
+    def analyze_keypoints():
+        # Batches are routed by ?camera_id; send one camera's frames per request
+        return proxy(request.args.get("camera_id"))
+
+    @app.route("/history", methods=["GET"])
+    def history():
+        return proxy(request.args.get("camera_id"))
+
+    @app.route("/stats", methods=["GET"])
+    def stats():
+        camera_id = request.args.get("camera_id")
+        return proxy(camera_id) if camera_id else fan_out("/stats")
+
+    @app.route("/second-opinion/<review_id>", methods=["GET"])
+    def second_opinion(review_id):
+        camera_id = request.args.get("camera_id")
+        if camera_id:
+            return proxy(camera_id)
+        # Review ids are not camera-scoped; ask each node until one knows it
+        for node in router.ring.nodes:
+            if not router.is_healthy(node):
+                continue
+            try:
+                upstream = router.session.get(f"{node}{request.path}",
+                                              timeout=router.request_timeout)
+            except requests.RequestException:
+                continue
+            if upstream.status_code != 404:
+                return relay(node, upstream)
+        return jsonify({"success": False, "message": f"Unknown review id {review_id}"}), 404
+
+    @app.route("/health", methods=["GET"])
+    def health():
+        healthy = sum(1 for node in router.ring.nodes if router.is_healthy(node))
+        return jsonify({
+            "status": "healthy" if healthy else "unhealthy",
+            "service": "crime-detection-shard-router",
+            "timestamp": datetime.now().isoformat(),
+            "model_loaded": healthy > 0,
+            "healthy_nodes": healthy,
+            "nodes": len(router.ring.nodes),
+        }), 200 if healthy else 503
+
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return fan_out("/metrics") if request.args.get("nodes") else jsonify({
+            "timestamp": datetime.now().isoformat(),
+            "router": router.snapshot(),
+        })
+
+    @app.route("/ring", methods=["GET"])
+    def ring():
+        """Membership and health; ?camera_id= also shows that camera's owner"""
+        camera_id = request.args.get("camera_id")
+        body = router.snapshot()
+        if camera_id:
+            body["camera_id"] = camera_id
+            body["owner"] = router.node_for(camera_id)
+            body["ring_order"] = list(router.ring.candidates(camera_id))
+        return jsonify(body)
+
+    @app.route("/ring/nodes", methods=["POST", "DELETE"])
+    @require_admin
+    def ring_nodes():
+        """Body: {"url": "http://host:port"}; POST joins, DELETE leaves"""
+        url = (request.get_json(silent=True) or {}).get("url")
+        if not url:
+            return jsonify({"success": False, "message": "url is required"}), 400
+        changed = router.add_node(url) if request.method == "POST" else router.remove_node(url)
+        return jsonify({"success": True, "changed": changed, "nodes": router.ring.nodes})
+
+    @app.errorhandler(404)
+    def not_found(e):
+        return jsonify({"success": False, "type": "ENDPOINT_NOT_FOUND",
+                        "message": "The requested endpoint does not exist"}), 404
+
+    return app
+
+
+# -------------------------------------------------
+# LOCAL CLUSTER
+# -------------------------------------------------
+def spawn_local_nodes(count: int, base_port: int = None, stream_base_port: int = None) -> List[str]:
+    """Start ``count`` image_detector.py processes on consecutive ports"""
+    base_port = Config.AI_SERVER_PORT + 1 if base_port is None else base_port
+    stream_base_port = Config.STREAM_PORT + 1 if stream_base_port is None else stream_base_port
+    here = os.path.dirname(os.path.abspath(__file__))
+    processes, nodes = [], []
+    for i in range(count):
+        env = {**os.environ, "AI_SERVER_PORT": str(base_port + i),
+               "STREAM_PORT": str(stream_base_port + i)}
+        processes.append(subprocess.Popen([sys.executable, "image_detector.py"], cwd=here, env=env))
+        nodes.append(f"http://127.0.0.1:{base_port + i}")
+        print(f"🚀 Started AI server {i + 1}/{count} on :{base_port + i} "
+              f"(stream :{stream_base_port + i}, pid {processes[-1].pid})")
+
+    def terminate():
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    atexit.register(terminate)
+    return nodes
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Route requests to AI servers by camera_id")
+    parser.add_argument("--nodes", default=Config.SHARD_NODES,
+                        help="Comma-separated AI server base URLs")
+    parser.add_argument("--spawn", type=int, default=0,
+                        help="Start this many local AI servers and route across them")
+    parser.add_argument("--port", type=int, default=Config.SHARD_ROUTER_PORT)
+    parser.add_argument("--host", default="0.0.0.0")
+    args = parser.parse_args(argv)
+
+    nodes = parse_nodes(args.nodes)
+    if args.spawn:
+        nodes += spawn_local_nodes(args.spawn)
+    if not nodes:
+        parser.error("no nodes: pass --nodes, --spawn or set SHARD_NODES")
+
+    router = ShardRouter(nodes).start()
+    print("\n" + "="*60)
+    print("🔀 AI SERVER SHARD ROUTER")
+    print("="*60)
+    for node in nodes:
+        print(f"  • {node} {'✅' if router.is_healthy(node) else '⏳ waiting for /health'}")
+    print(f"\n📍 Routing by camera_id at http://{args.host}:{args.port}")
+    print("="*60 + "\n")
+
+    create_app(router).run(host=args.host, port=args.port, debug=False, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
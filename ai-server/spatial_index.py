@@ -0,0 +1,92 @@
+"""
+Spatial Index Module - Uniform grids for pruning person pairs in crowds
+
+Both helpers return a superset of the pairs a distance rule can fire for;
+callers still run the exact rule on each candidate, so results match an
+exhaustive pair loop while large crowds only pay for nearby pairs.
+
+    disc_pairs()   pairs whose discs (center, radius) may overlap
+    PointGrid      owners of points closer than ``cell`` to a query point
+
+Non-finite coordinates never satisfy a distance rule and are skipped
+(PointGrid) or paired with everyone (disc_pairs, whose radii come from
+the caller's own bound).
+"""
+
+import math
+from collections import defaultdict
+from typing import Iterable, List, Set, Tuple
+
+import numpy as np
+
+
+def disc_pairs(centers, radii, max_cells: int = 64) -> List[Tuple[int, int]]:
+    """
+    Candidate pairs (i < j) with ``|c_i - c_j| < r_i + r_j``.
+
+    Each disc is bucketed into every grid cell its bounding square touches;
+    two overlapping discs share a point, hence a cell. Discs that would
+    span more than ``max_cells`` cells (or are not finite) are paired with
+    every other item instead.
+    """
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    radii = np.asarray(radii, dtype=np.float64).reshape(-1)
+    n = len(centers)
+    if n < 2:
+        return []
+
+    usable = np.isfinite(centers).all(axis=1) & np.isfinite(radii) & (radii >= 0)
+    idx = np.flatnonzero(usable)
+    cell = max(2.0 * float(np.median(radii[idx])), 1e-3) if len(idx) else 1.0
+
+    lo = np.floor((centers[idx] - radii[idx, None]) / cell)
+    hi = np.floor((centers[idx] + radii[idx, None]) / cell)
+    span = (hi - lo + 1).prod(axis=1)  # float, so huge coordinates cannot overflow
+
+    wildcards = set(np.flatnonzero(~usable).tolist())
+    buckets = defaultdict(list)
+    for k, i in enumerate(idx.tolist()):
+        if span[k] > max_cells:
+            wildcards.add(i)
+            continue
+        for cx in range(int(lo[k, 0]), int(hi[k, 0]) + 1):
+            for cy in range(int(lo[k, 1]), int(hi[k, 1]) + 1):
+                buckets[(cx, cy)].append(i)
+
+    pairs: Set[Tuple[int, int]] = set()
+    for members in buckets.values():
+        for a in range(len(members)):
+            for b in range(a + 1, len(members)):
+                i, j = members[a], members[b]
+                pairs.add((i, j) if i < j else (j, i))
+    for w in wildcards:
+        for j in range(n):
+            if j != w:
+                pairs.add((w, j) if w < j else (j, w))
+    return sorted(pairs)
+
+
+class PointGrid:
+    """Uniform grid of owned points for fixed-radius neighbour queries"""
+
+    def __init__(self, points, owners, cell: float):
+        self.cell = float(cell)
+        self._buckets = defaultdict(set)
+        for (x, y), owner in zip(np.asarray(points, dtype=np.float64).reshape(-1, 2), owners):
+            if math.isfinite(x) and math.isfinite(y):
+                self._buckets[(math.floor(x / self.cell), math.floor(y / self.cell))].add(int(owner))
+
+    def owners_near(self, points: Iterable) -> Set[int]:
+        """Owners with a point closer than ``cell`` to any query point (superset)"""
+        found = set()
+        for x, y in points:
+            x, y = float(x), float(y)
+            if not (math.isfinite(x) and math.isfinite(y)):
+                continue
+            cx, cy = math.floor(x / self.cell), math.floor(y / self.cell)
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    bucket = self._buckets.get((cx + dx, cy + dy))
+                    if bucket:
+                        found |= bucket
+        return found
@@ -0,0 +1,702 @@
+"""
+Stream Server Module - Persistent WebSocket channel for continuous camera streams
+
+A camera opens one connection and keeps it for the whole stream instead of
+paying for an HTTP multipart request (and, via the backend, two) per frame:
+
+    ws://<host>:STREAM_PORT/stream?camera_id=cam01[&deadline_ms=500]
+
+    camera -> server   binary message = one JPEG frame (WebSocket framing
+                       carries the length)
+    server -> camera   text message = JSON detection result for that frame,
+                       same fields as /detect-image plus "seq" and "dropped"
+
+Frames are analyzed in order, one at a time per connection. If a camera
+sends faster than its frames can be analyzed, only the newest waiting
+frame is kept and the others are counted in "dropped", so results never
+lag behind the live picture. Temporal state (the pose detector's per-camera
+signal history) belongs to the connection: it starts fresh when a camera
+connects and is cleared when it disconnects. A second connection for the
+same camera replaces the first.
+
+The same port serves detection events as Server-Sent Events from an
+EventBus (see event_bus.py), without going through Flask's threads:
+
+    GET http://<host>:STREAM_PORT/events[?camera_id=cam01,cam02][&min_level=HIGH]
+
+Each event is one ``event: detection`` message whose data is the JSON
+analysis result. A client reconnecting with Last-Event-ID gets the events
+it missed, as far as the bus's replay ring reaches. ``event: dropped``
+reports how many events a slow client lost to its bounded queue.
+
+The WebSocket layer (RFC 6455 handshake, framing, ping/pong, close) is
+implemented on asyncio streams, so no extra dependency is needed.
+
+Usage:
+    python stream_server.py serve
+    python stream_server.py client "ws://127.0.0.1:8001/stream?camera_id=cam01" --source 0 --fps 5
+"""
+
+import os
+import json
+import time
+import base64
+import socket
+import struct
+import asyncio
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Optional
+from urllib.parse import parse_qs, urlsplit
+
+from config import Config
+
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_GOING_AWAY = 1001
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_UNSUPPORTED = 1003
+CLOSE_TOO_BIG = 1009
+CLOSE_REPLACED = 4000
+
+MAX_HEADER_BYTES = 16 * 1024
+
+
+class ProtocolError(Exception):
+    """Peer violated the WebSocket protocol; ``code`` goes into the close frame"""
+
+    def __init__(self, code, reason=""):
+        super().__init__(reason)
+        self.code = code
+        self.reason = reason
+
+
+# --------------------------------------------------
+# RFC 6455 FRAMING
+# --------------------------------------------------
+
+def accept_key(key: str) -> str:
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def apply_mask(payload: bytes, key: bytes) -> bytes:
+    if not payload:
+        return payload
+    # One big-int XOR instead of a Python-level loop over every byte
+    n = len(payload)
+    mask = (key * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(mask, "big")).to_bytes(n, "big")
+
+
+def encode_frame(opcode: int, payload: bytes = b"", mask: bool = False) -> bytes:
+    n = len(payload)
+    head = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    if n < 126:
+        head.append(mask_bit | n)
+    elif n < 1 << 16:
+        head.append(mask_bit | 126)
+        head += struct.pack("!H", n)
+    else:
+        head.append(mask_bit | 127)
+        head += struct.pack("!Q", n)
+    if mask:
+        key = os.urandom(4)
+        return bytes(head) + key + apply_mask(payload, key)
+    return bytes(head) + payload
+
+
+def close_payload(code: int, reason: str = "") -> bytes:
+    return struct.pack("!H", code) + reason.encode("utf-8")[:120]
+
+
+async def read_frame(reader: asyncio.StreamReader, max_size: int, require_mask: bool = True):
+    """Read one frame: (fin, opcode, payload)"""
+    b0, b1 = await reader.readexactly(2)
+    if b0 & 0x70:
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, "Reserved bits set")
+    fin, opcode = bool(b0 & 0x80), b0 & 0x0F
+    masked, length = bool(b1 & 0x80), b1 & 0x7F
+    if length == 126:
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+    elif length == 127:
+        (length,) = struct.unpack("!Q", await reader.readexactly(8))
+
+    if opcode >= OP_CLOSE and (length > 125 or not fin):
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, "Bad control frame")
+    if length > max_size:
+        raise ProtocolError(CLOSE_TOO_BIG, "Frame too large")
+    if require_mask and not masked:
+        raise ProtocolError(CLOSE_PROTOCOL_ERROR, "Client frames must be masked")
+
+    key = await reader.readexactly(4) if masked else None
+    payload = await reader.readexactly(length)
+    return fin, opcode, apply_mask(payload, key) if key else payload
+
+
+# --------------------------------------------------
+# SERVER
+# --------------------------------------------------
+
+class _Connection:
+    """One camera stream: socket, latest waiting frame and counters"""
+
+    def __init__(self, camera_id, deadline, reader, writer):
+        self.camera_id = camera_id
+        self.deadline = deadline
+        self.reader = reader
+        self.writer = writer
+        self.write_lock = asyncio.Lock()
+        self.pending = None           # (seq, jpeg bytes) waiting for analysis
+        self.frame_ready = asyncio.Event()
+        self.received = 0
+        self.analyzed = 0
+        self.dropped = 0
+        self.closed = False
+
+    async def send(self, opcode, payload=b""):
+        async with self.write_lock:
+            if self.writer.is_closing():
+                return
+            self.writer.write(encode_frame(opcode, payload))
+            await self.writer.drain()
+
+    async def close(self, code=CLOSE_NORMAL, reason=""):
+        if self.closed:
+            return
+        self.closed = True
+        self.frame_ready.set()  # wake the analysis loop so it can exit
+        try:
+            await self.send(OP_CLOSE, close_payload(code, reason))
+        except (ConnectionError, RuntimeError):
+            pass
+        self.writer.close()
+
+
+class StreamServer:
+    """
+    Asyncio WebSocket server feeding frames to a blocking analysis callable.
+
+    Args:
+        process_frame: ``(jpeg_bytes, camera_id, deadline_s) -> dict`` run in a
+                       worker thread (admission control applies inside it)
+        reset_history: ``(camera_id) -> None`` clearing temporal state
+        event_bus: Optional EventBus served as SSE at /events
+    """
+
+    def __init__(self, process_frame: Callable, reset_history: Optional[Callable] = None,
+                 host="0.0.0.0", port=None, max_message_bytes=None, idle_timeout=None,
+                 workers=None, event_bus=None):
+        self.process_frame = process_frame
+        self.reset_history = reset_history
+        self.event_bus = event_bus
+        self.host = host
+        self.port = Config.STREAM_PORT if port is None else port
+        self.max_message_bytes = max_message_bytes or Config.STREAM_MAX_MESSAGE_BYTES
+        self.idle_timeout = Config.STREAM_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+        # Enough threads for every admitted and queued request; admission does the limiting
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or Config.INFERENCE_CONCURRENCY + Config.INFERENCE_QUEUE_SIZE,
+            thread_name_prefix="stream")
+
+        self._connections: Dict[str, _Connection] = {}
+        self._event_streams = set()   # asyncio.Event per SSE client, set to wake it
+        self._closing = False
+        self._server = None
+        self._loop = None
+        self.started = threading.Event()
+        self.stats = {"connections_total": 0, "frames_received": 0, "frames_analyzed": 0,
+                      "frames_dropped": 0, "protocol_errors": 0, "event_clients_total": 0,
+                      "events_sent": 0}
+
+    # -------------------------------------------------
+    # LIFECYCLE
+    # -------------------------------------------------
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port,
+                                                  limit=MAX_HEADER_BYTES)
+        # Port 0 picks a free port (tests); report the real one
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.started.set()
+
+    async def serve(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def serve_forever(self):
+        """Blocking; run in a daemon thread next to the Flask app"""
+        try:
+            asyncio.run(self.serve())
+        except asyncio.CancelledError:
+            pass
+
+    def start_in_thread(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="stream-server", daemon=True)
+        thread.start()
+        self.started.wait(timeout=5.0)
+        return thread
+
+    def stop(self):
+        if self._loop is None or self._server is None:
+            return
+
+        async def shutdown():
+            self._closing = True
+            for wake in list(self._event_streams):
+                wake.set()
+            # Let SSE handlers see _closing and finish before the loop cancels them
+            for _ in range(50):
+                if not self._event_streams:
+                    break
+                await asyncio.sleep(0.01)
+            for conn in list(self._connections.values()):
+                await conn.close(CLOSE_GOING_AWAY, "Server shutting down")
+            self._server.close()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result(timeout=5.0)
+        self.executor.shutdown(wait=False)
+
+    # -------------------------------------------------
+    # HANDSHAKE
+    # -------------------------------------------------
+    async def _read_request(self, reader):
+        """Request line and headers; returns (method, url, headers) or None"""
+        try:
+            raw = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=10.0)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+            return None
+
+        lines = raw.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            return None
+        headers = {}
+        for line in lines[1:]:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                headers[name.strip().lower()] = value.strip()
+        return method, urlsplit(target), headers
+
+    async def _handshake(self, writer, method, url, headers):
+        """Validate the upgrade request; returns (camera_id, deadline) or None"""
+        if url.path != "/stream":
+            await self._reject(writer, "404 Not Found", "ENDPOINT_NOT_FOUND",
+                               "Use /stream or /events")
+            return None
+        key = headers.get("sec-websocket-key")
+        if (method != "GET" or "websocket" not in headers.get("upgrade", "").lower()
+                or not key or headers.get("sec-websocket-version") != "13"):
+            await self._reject(writer, "426 Upgrade Required", "UPGRADE_REQUIRED",
+                               "WebSocket (version 13) upgrade expected")
+            return None
+
+        query = parse_qs(url.query)
+        camera_id = query.get("camera_id", ["Unknown"])[0]
+        deadline = None
+        if "deadline_ms" in query:
+            try:
+                deadline = max(float(query["deadline_ms"][0]), 0.0) / 1000.0
+            except ValueError:
+                pass
+
+        writer.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n"
+        ).encode())
+        await writer.drain()
+        return camera_id, deadline
+
+    async def _reject(self, writer, status, error_type, message):
+        body = json.dumps({"success": False, "type": error_type, "message": message}).encode()
+        writer.write((f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode() + body)
+        await writer.drain()
+        writer.close()
+
+    # -------------------------------------------------
+    # CONNECTION
+    # -------------------------------------------------
+    async def _handle(self, reader, writer):
+        request = await self._read_request(reader)
+        if request is None:
+            writer.close()
+            return
+        if request[1].path == "/events":
+            await self._serve_events(reader, writer, *request)
+            return
+        accepted = await self._handshake(writer, *request)
+        if accepted is None:
+            writer.close()
+            return
+        camera_id, deadline = accepted
+        conn = _Connection(camera_id, deadline, reader, writer)
+
+        previous = self._connections.get(camera_id)
+        self._connections[camera_id] = conn
+        if previous is not None:
+            await previous.close(CLOSE_REPLACED, "Replaced by a newer connection")
+        if self.reset_history:
+            self.reset_history(camera_id)
+        self.stats["connections_total"] += 1
+        print(f"📹 Stream connected: {camera_id}")
+
+        analysis = asyncio.create_task(self._analysis_loop(conn))
+        try:
+            await self._receive_loop(conn)
+        except ProtocolError as e:
+            self.stats["protocol_errors"] += 1
+            await conn.close(e.code, e.reason)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            await conn.close()
+            analysis.cancel()
+            try:
+                await analysis
+            except (asyncio.CancelledError, ConnectionError):
+                pass
+            if self._connections.get(camera_id) is conn:
+                del self._connections[camera_id]
+                if self.reset_history:
+                    self.reset_history(camera_id)
+            print(f"📴 Stream closed: {camera_id} ({conn.analyzed} analyzed, {conn.dropped} dropped)")
+
+    async def _receive_loop(self, conn):
+        message, message_opcode = bytearray(), None
+        while not conn.closed:
+            fin, opcode, payload = await asyncio.wait_for(
+                read_frame(conn.reader, self.max_message_bytes), timeout=self.idle_timeout or None)
+
+            if opcode == OP_PING:
+                await conn.send(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                await conn.close(CLOSE_NORMAL)
+                return
+
+            if opcode == OP_CONTINUATION:
+                if message_opcode is None:
+                    raise ProtocolError(CLOSE_PROTOCOL_ERROR, "Unexpected continuation")
+            elif message_opcode is not None:
+                raise ProtocolError(CLOSE_PROTOCOL_ERROR, "Expected continuation")
+            else:
+                message_opcode = opcode
+            message += payload
+            if len(message) > self.max_message_bytes:
+                raise ProtocolError(CLOSE_TOO_BIG, "Message too large")
+            if not fin:
+                continue
+
+            data, kind = bytes(message), message_opcode
+            message, message_opcode = bytearray(), None
+            if kind != OP_BINARY:
+                raise ProtocolError(CLOSE_UNSUPPORTED, "Send frames as binary JPEG messages")
+
+            conn.received += 1
+            self.stats["frames_received"] += 1
+            if conn.pending is not None:
+                # Analysis is behind: keep only the newest frame
+                conn.dropped += 1
+                self.stats["frames_dropped"] += 1
+            conn.pending = (conn.received, data)
+            conn.frame_ready.set()
+
+    async def _analysis_loop(self, conn):
+        loop = asyncio.get_running_loop()
+        while True:
+            await conn.frame_ready.wait()
+            conn.frame_ready.clear()
+            if conn.closed:
+                return
+            if conn.pending is None:
+                continue
+            seq, data = conn.pending
+            conn.pending = None
+
+            start_time = datetime.now()
+            try:
+                result = await loop.run_in_executor(
+                    self.executor, self.process_frame, data, conn.camera_id, conn.deadline)
+            except Exception as e:
+                print(f"Error in stream analysis: {e}")
+                result = {"success": False, "type": "ANALYSIS_ERROR", "message": str(e)}
+            conn.analyzed += 1
+            self.stats["frames_analyzed"] += 1
+            result.update({
+                "seq": seq,
+                "camera_id": conn.camera_id,
+                "dropped": conn.dropped,
+                "response_time_ms": round((datetime.now() - start_time).total_seconds() * 1000, 2),
+            })
+            await conn.send(OP_TEXT, json.dumps(result).encode("utf-8"))
+
+    # -------------------------------------------------
+    # SERVER-SENT EVENTS
+    # -------------------------------------------------
+    async def _serve_events(self, reader, writer, method, url, headers):
+        if self.event_bus is None:
+            await self._reject(writer, "404 Not Found", "ENDPOINT_NOT_FOUND",
+                               "Event stream is not enabled")
+            return
+        if method != "GET":
+            await self._reject(writer, "405 Method Not Allowed", "METHOD_NOT_ALLOWED", "Use GET")
+            return
+
+        query = parse_qs(url.query)
+        cameras = {c for value in query.get("camera_id", []) for c in value.split(",") if c}
+        min_level = query.get("min_level", ["LOW"])[0].upper()
+        last_id = headers.get("last-event-id") or query.get("last_event_id", [None])[0]
+        try:
+            last_id = int(last_id) if last_id else None
+        except ValueError:
+            last_id = None
+
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+
+        def notify():
+            # Called from publisher threads
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                pass  # Loop already closed during shutdown
+
+        sub = self.event_bus.subscribe(cameras or None, min_level, last_event_id=last_id,
+                                       notify=notify)
+        if sub is None:
+            await self._reject(writer, "503 Service Unavailable", "OVERLOADED",
+                               "Too many event subscribers")
+            return
+
+        self._event_streams.add(wake)
+        self.stats["event_clients_total"] += 1
+        # EOF from the client is the only way to notice a silent disconnect
+        client_gone = asyncio.create_task(reader.read(1))
+        reported_drops = 0
+        try:
+            writer.write((
+                "HTTP/1.1 200 OK\r\n"
+                "Content-Type: text/event-stream\r\n"
+                "Cache-Control: no-cache\r\n"
+                "Connection: keep-alive\r\n"
+                "Access-Control-Allow-Origin: *\r\n\r\n"
+                "retry: 3000\n\n"
+            ).encode())
+            await writer.drain()
+
+            while not self._closing:
+                waiter = asyncio.create_task(wake.wait())
+                done, _ = await asyncio.wait({waiter, client_gone}, timeout=Config.EVENT_KEEPALIVE,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                waiter.cancel()
+                if client_gone in done:
+                    return
+                wake.clear()
+
+                chunks = []
+                drops = sub.dropped - reported_drops
+                if drops:
+                    chunks.append(f"event: dropped\ndata: {json.dumps({'count': drops})}\n\n")
+                    reported_drops += drops
+                events = sub.drain()
+                for event in events:
+                    chunks.append(f"id: {event['id']}\nevent: detection\n"
+                                  f"data: {json.dumps(event, default=str)}\n\n")
+                if not chunks:
+                    chunks.append(": keepalive\n\n")
+                writer.write("".join(chunks).encode("utf-8"))
+                # A slow client blocks only here; its queue keeps dropping the oldest
+                await writer.drain()
+                self.stats["events_sent"] += len(events)
+        except (ConnectionError, RuntimeError):
+            pass
+        finally:
+            sub.close()
+            self._event_streams.discard(wake)
+            client_gone.cancel()
+            writer.close()
+
+    def snapshot(self) -> Dict:
+        return {
+            "port": self.port,
+            "active_streams": sorted(self._connections),
+            "event_clients": len(self._event_streams),
+            **self.stats,
+        }
+
+
+# --------------------------------------------------
+# CLIENT
+# --------------------------------------------------
+
+class StreamClient:
+    """Minimal blocking WebSocket client for one camera stream"""
+
+    def __init__(self, url: str, timeout: float = 30.0):
+        self.url = urlsplit(url)
+        self.timeout = timeout
+        self.sock = None
+        self._buffer = b""
+
+    def connect(self) -> "StreamClient":
+        host, port = self.url.hostname, self.url.port or 80
+        self.sock = socket.create_connection((host, port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        key = base64.b64encode(os.urandom(16)).decode()
+        target = self.url.path + (f"?{self.url.query}" if self.url.query else "")
+        self.sock.sendall((
+            f"GET {target} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        ).encode())
+
+        while b"\r\n\r\n" not in self._buffer:
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                raise ConnectionError("Server closed during handshake")
+            self._buffer += chunk
+        head, self._buffer = self._buffer.split(b"\r\n\r\n", 1)
+        lines = head.decode("latin-1").split("\r\n")
+        if " 101 " not in lines[0] + " ":
+            raise ConnectionError(f"Handshake rejected: {lines[0]}")
+        headers = {k.strip().lower(): v.strip() for k, v in
+                   (line.split(":", 1) for line in lines[1:] if ":" in line)}
+        if headers.get("sec-websocket-accept") != accept_key(key):
+            raise ConnectionError("Bad Sec-WebSocket-Accept")
+        return self
+
+    def _recv_exact(self, n):
+        while len(self._buffer) < n:
+            chunk = self.sock.recv(max(65536, n - len(self._buffer)))
+            if not chunk:
+                raise ConnectionError("Connection closed")
+            self._buffer += chunk
+        data, self._buffer = self._buffer[:n], self._buffer[n:]
+        return data
+
+    def send_frame(self, jpeg: bytes) -> None:
+        self.sock.sendall(encode_frame(OP_BINARY, jpeg, mask=True))
+
+    def recv_result(self) -> Dict:
+        """Next JSON result; answers pings, raises ConnectionError on close"""
+        while True:
+            b0, b1 = self._recv_exact(2)
+            opcode, length = b0 & 0x0F, b1 & 0x7F
+            if length == 126:
+                (length,) = struct.unpack("!H", self._recv_exact(2))
+            elif length == 127:
+                (length,) = struct.unpack("!Q", self._recv_exact(8))
+            payload = self._recv_exact(length)
+            if opcode == OP_PING:
+                self.sock.sendall(encode_frame(OP_PONG, payload, mask=True))
+            elif opcode == OP_CLOSE:
+                code = struct.unpack("!H", payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+                raise ConnectionError(f"Server closed stream ({code}): {payload[2:].decode(errors='replace')}")
+            elif opcode == OP_TEXT:
+                return json.loads(payload.decode("utf-8"))
+
+    def analyze(self, jpeg: bytes) -> Dict:
+        self.send_frame(jpeg)
+        return self.recv_result()
+
+    def close(self) -> None:
+        if self.sock is None:
+            return
+        try:
+            self.sock.sendall(encode_frame(OP_CLOSE, close_payload(CLOSE_NORMAL), mask=True))
+        except OSError:
+            pass
+        self.sock.close()
+        self.sock = None
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_client(url, source, fps=5.0, frames=0):
+    """Stream a camera or video file and print each result"""
+    import cv2
+
+    cap = cv2.VideoCapture(int(source) if str(source).isdigit() else source)
+    latencies = []
+    sent = 0
+    with StreamClient(url) as client:
+        try:
+            while not frames or sent < frames:
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                ok, buffer = cv2.imencode(".jpg", frame)
+                started = time.perf_counter()
+                result = client.analyze(buffer.tobytes())
+                latency = (time.perf_counter() - started) * 1000
+                latencies.append(latency)
+                sent += 1
+                print(f"#{result.get('seq')} {result.get('type')} [{result.get('threat_level')}] "
+                      f"persons={result.get('persons_detected')} {latency:.1f} ms")
+                # Pace by the requested FPS, or slower when the server asks for it
+                interval = max(1.0 / fps if fps else 0.0, result.get("next_analysis_interval") or 0.0)
+                time.sleep(max(interval - latency / 1000, 0.0))
+        finally:
+            cap.release()
+
+    if latencies:
+        latencies.sort()
+        p95 = latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)]
+        print(f"📊 {sent} frames, median {latencies[len(latencies) // 2]:.1f} ms, p95 {p95:.1f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WebSocket camera stream server / client")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    s = sub.add_parser("serve", help="Run only the stream server (loads the detector)")
+    s.add_argument("--port", type=int, default=None)
+
+    c = sub.add_parser("client", help="Stream a camera or video file to a server")
+    c.add_argument("url", help='e.g. "ws://127.0.0.1:8001/stream?camera_id=cam01"')
+    c.add_argument("--source", default="0", help="Camera index or video path")
+    c.add_argument("--fps", type=float, default=5.0)
+    c.add_argument("--frames", type=int, default=0, help="Stop after N frames (0 = until source ends)")
+
+    args = parser.parse_args(argv)
+    if args.command == "client":
+        run_client(args.url, args.source, args.fps, args.frames)
+        return
+
+    import image_detector
+    server = StreamServer(image_detector.process_stream_frame,
+                          reset_history=image_detector.reset_stream_history, port=args.port,
+                          event_bus=image_detector.event_bus)
+    print(f"📡 Stream server on ws://0.0.0.0:{server.port}/stream?camera_id=<id>")
+    print(f"📡 Detection events on http://0.0.0.0:{server.port}/events")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
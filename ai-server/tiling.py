@@ -0,0 +1,252 @@
+"""
+Tiling Module - High-resolution pose inference for crowd scenes
+
+Large frames are normally shrunk to the model's 640 px input, so people far
+from a 4K camera end up a few pixels tall and lose their keypoints. In
+tiled mode the full-resolution frame is cut into overlapping tiles, and all
+tiles plus one whole-frame overview go through the pose model as a single
+batch (one forward pass, not one call per tile).
+
+Detections are mapped back to frame coordinates and duplicates from the
+overlaps are merged by cross-tile NMS: only detections from different
+tiles (or a tile and the overview) are compared, by IoU or, for a person
+cut by an inner tile edge, by containment in their complete detection.
+Each merged person keeps the whole skeleton of whichever duplicate saw
+it most confidently.
+
+Tiling switches on per camera: only for frames of at least
+TILE_MIN_IMAGE_DIM, and only while the people last seen on that camera
+would be smaller than TILE_MIN_PERSON_PX at model resolution. Person
+heights are kept as a fraction of the frame they were measured on, so
+tiled (full-resolution) and untiled (downscaled) results compare directly.
+Frames where nobody is found keep the last estimate; after such frames
+only every TILE_PROBE_INTERVAL-th frame is tiled to look for small people.
+"""
+
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import Config
+
+
+MODEL_INPUT_SIZE = 640  # yolov8 default imgsz
+NUM_KEYPOINTS = 17
+
+
+def tile_grid(height, width, tile_size, overlap, max_tiles) -> List[Tuple[int, int, int, int]]:
+    """
+    Overlapping, equally sized tiles covering the frame (xyxy). The tile
+    size grows until the grid fits in ``max_tiles``.
+    """
+    def axis(length, size, stride):
+        if length <= size:
+            return [0]
+        count = int(math.ceil((length - size) / stride)) + 1
+        # Last tile sits flush with the edge so every tile has the same size
+        return [min(i * stride, length - size) for i in range(count)]
+
+    size = tile_size
+    while True:
+        stride = max(int(size * (1 - overlap)), 1)
+        xs = axis(width, size, stride)
+        ys = axis(height, size, stride)
+        if len(xs) * len(ys) <= max_tiles:
+            break
+        size = int(size * 1.25)
+
+    tw, th = min(size, width), min(size, height)
+    return [(x, y, x + tw, y + th) for y in ys for x in xs]
+
+
+def _pairwise_overlap(boxes):
+    """IoU and intersection-over-smaller-area matrices for xyxy boxes"""
+    x1 = np.maximum(boxes[:, None, 0], boxes[None, :, 0])
+    y1 = np.maximum(boxes[:, None, 1], boxes[None, :, 1])
+    x2 = np.minimum(boxes[:, None, 2], boxes[None, :, 2])
+    y2 = np.minimum(boxes[:, None, 3], boxes[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    union = area[:, None] + area[None, :] - inter
+    iou = inter / np.maximum(union, 1e-6)
+    containment = inter / np.maximum(np.minimum(area[:, None], area[None, :]), 1e-6)
+    return iou, containment
+
+
+def merge_detections(kps, kconf, boxes, rank, source, cut, iou_threshold=0.5,
+                     containment_threshold=0.7):
+    """
+    Cross-tile NMS.
+
+    Only detections from different tiles (or a tile and the overview) can be
+    duplicates: each crop's own output is already de-duplicated by the
+    model, and people standing in front of each other must stay apart.
+    Containment counts only when the smaller box is cut by an inner tile
+    edge. Each merged person keeps the whole skeleton of its most
+    confident duplicate; joints are never mixed between detections.
+
+    Args:
+        kps: (n, 17, 2) keypoints in frame coordinates, (0, 0) = missing
+        kconf: (n, 17) keypoint confidences or None
+        boxes: (n, 4) xyxy
+        rank: (n,) ordering score; truncated detections should rank lower
+        source: (n,) index of the tile (or overview) each detection came from
+        cut: (n,) True where the box touches an inner tile edge
+
+    Returns:
+        (kps, kconf, boxes) for the merged persons
+    """
+    n = len(boxes)
+    if n <= 1:
+        return kps, kconf, boxes
+
+    iou, containment = _pairwise_overlap(boxes)
+    area = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    smaller_cut = np.where(area[:, None] <= area[None, :], cut[:, None], cut[None, :])
+    duplicate = (iou > iou_threshold) | ((containment > containment_threshold) & smaller_cut)
+    duplicate &= source[:, None] != source[None, :]
+
+    if kconf is not None:
+        # Complete, confident skeletons win over cut-off ones
+        quality = np.where(np.any(kps != 0, axis=-1), kconf, 0.0).sum(axis=1)
+    else:
+        quality = rank
+
+    order = np.argsort(-rank, kind="stable")
+    taken = np.zeros(n, dtype=bool)
+    keep = []
+    for i in order:
+        if taken[i]:
+            continue
+        cluster = np.flatnonzero(duplicate[i] & ~taken)
+        cluster = np.concatenate([[i], cluster[cluster != i]])
+        taken[cluster] = True
+        keep.append(cluster[np.argmax(quality[cluster])])
+
+    keep = np.asarray(keep)
+    return (kps[keep].astype(np.float32),
+            kconf[keep].astype(np.float32) if kconf is not None else None,
+            boxes[keep].astype(np.float32))
+
+
+class TiledPoseInference:
+    """Batched tile inference for a PoseCrimeDetector's model"""
+
+    def __init__(self, pose_detector, tile_size=None, overlap=None, min_image_dim=None,
+                 min_person_px=None, max_tiles=None, probe_interval=None):
+        self.pose_detector = pose_detector
+        self.tile_size = tile_size or Config.TILE_SIZE
+        self.overlap = Config.TILE_OVERLAP if overlap is None else overlap
+        self.min_image_dim = min_image_dim or Config.TILE_MIN_IMAGE_DIM
+        self.min_person_px = Config.TILE_MIN_PERSON_PX if min_person_px is None else min_person_px
+        self.max_tiles = max_tiles or Config.TILE_MAX_TILES
+        self.probe_interval = probe_interval or Config.TILE_PROBE_INTERVAL
+
+        self._lock = threading.Lock()
+        self._person_heights: Dict[Optional[str], float] = {}  # median height / frame's longest side
+        self._empty_frames: Dict[Optional[str], int] = {}  # consecutive frames with nobody found
+        self.stats = {"tiled_frames": 0, "tiles": 0, "merged_duplicates": 0}
+
+    # -------------------------------------------------
+    # SWITCHING
+    # -------------------------------------------------
+    def should_tile(self, image, camera_id=None) -> bool:
+        h, w = image.shape[:2]
+        if max(h, w) < self.min_image_dim:
+            return False
+        empty = self._empty_frames.get(camera_id, 0)
+        if empty:
+            # Nobody found lately: probe tiled now and then instead of every frame
+            return empty % self.probe_interval == 0
+        height = self._person_heights.get(camera_id)
+        if height is None:
+            # Nothing seen yet: people may be too small
+            return True
+        return height * MODEL_INPUT_SIZE < self.min_person_px
+
+    def observe(self, camera_id, boxes, frame_dim) -> None:
+        """
+        Update the camera's person-scale estimate from a result's boxes,
+        measured on a frame whose longest side is ``frame_dim`` pixels
+        """
+        with self._lock:
+            if len(boxes) == 0:
+                self._empty_frames[camera_id] = self._empty_frames.get(camera_id, 0) + 1
+                return
+            self._empty_frames.pop(camera_id, None)
+            height = float(np.median(boxes[:, 3] - boxes[:, 1])) / frame_dim
+            previous = self._person_heights.get(camera_id)
+            self._person_heights[camera_id] = height if previous is None \
+                else 0.7 * previous + 0.3 * height
+
+    # -------------------------------------------------
+    # INFERENCE
+    # -------------------------------------------------
+    def infer(self, image, tier=None):
+        """
+        One batched pass over all tiles and the overview (``tier`` as in
+        PoseCrimeDetector.infer).
+
+        Returns:
+            (keypoints, keypoint confidences or None, boxes) in frame pixels
+        """
+        h, w = image.shape[:2]
+        tiles = tile_grid(h, w, self.tile_size, self.overlap, self.max_tiles)
+        crops = [image[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles] + [image]
+        outputs = self.pose_detector.infer_batch(crops, tier=tier)
+
+        all_kps, all_conf, all_boxes, all_rank, all_source, all_cut = [], [], [], [], [], []
+        has_conf = True
+        for source, ((kps, kconf, boxes, scores), region) in enumerate(zip(outputs, tiles + [None])):
+            if len(kps) == 0:
+                continue
+            cut = np.zeros(len(kps), dtype=bool)
+            if region is not None:
+                x1, y1, x2, y2 = region
+                found = np.any(kps != 0, axis=-1, keepdims=True)
+                kps = np.where(found, kps + np.array([x1, y1], dtype=np.float32), 0)
+                boxes = boxes + np.array([x1, y1, x1, y1], dtype=np.float32)
+                # Boxes touching an inner tile edge are probably cut off
+                margin = 2.0
+                cut = ((x1 > 0) & (boxes[:, 0] <= x1 + margin)) | \
+                      ((x2 < w) & (boxes[:, 2] >= x2 - margin)) | \
+                      ((y1 > 0) & (boxes[:, 1] <= y1 + margin)) | \
+                      ((y2 < h) & (boxes[:, 3] >= y2 - margin))
+                scores = np.where(cut, scores * 0.5, scores)
+            all_kps.append(kps)
+            all_boxes.append(boxes)
+            all_rank.append(scores)
+            all_source.append(np.full(len(kps), source))
+            all_cut.append(cut)
+            if kconf is None:
+                has_conf = False
+            else:
+                all_conf.append(kconf)
+
+        with self._lock:
+            self.stats["tiled_frames"] += 1
+            self.stats["tiles"] += len(tiles)
+
+        if not all_kps:
+            return (np.zeros((0, NUM_KEYPOINTS, 2), dtype=np.float32), None,
+                    np.zeros((0, 4), dtype=np.float32))
+
+        kps = np.concatenate(all_kps).astype(np.float32)
+        boxes = np.concatenate(all_boxes).astype(np.float32)
+        kconf = np.concatenate(all_conf).astype(np.float32) if has_conf else None
+        merged = merge_detections(kps, kconf, boxes, np.concatenate(all_rank),
+                                  np.concatenate(all_source), np.concatenate(all_cut))
+        with self._lock:
+            self.stats["merged_duplicates"] += len(kps) - len(merged[0])
+        return merged
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            frames = self.stats["tiled_frames"]
+            return {
+                **self.stats,
+                "avg_tiles": round(self.stats["tiles"] / frames, 2) if frames else 0.0,
+                "cameras_tracked": len(self._person_heights),
+            }
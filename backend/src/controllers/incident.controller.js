@@ -1,6 +1,125 @@
 const cloudinary = require("../config/cloudinary");
 const { admin, db } = require("../config/firebase");
 
+/**
+ * Check the fields every incident payload must carry
+ */
+const hasRequiredFields = ({ type, confidence, cameraId, imageBase64 } = {}) =>
+  Boolean(type && confidence !== undefined && cameraId && imageBase64);
+
+/**
+ * Upload evidence, resolve camera location, save to Firestore
+ * and emit the real-time alert for a single incident payload
+ */
+const saveIncident = async (body, io) => {
+  const {
+    type,
+    confidence,
+    cameraId,
+    imageBase64,
+
+    // AI optional fields
+    threat_level,
+    threat_score,
+    persons_detected,
+    activities,
+    signals,
+    source,
+
+    // Aggregated delivery (AI server incident aggregator)
+    occurrences,
+    firstSeen,
+    lastSeen,
+
+    // Pre/post-event clips written on the AI node
+    evidenceClips,
+  } = body;
+
+  // ---------------- 1️⃣ UPLOAD IMAGE ----------------
+  const uploadResponse =
+    await cloudinary.uploader.upload(imageBase64, {
+      folder: "crime-detection/incidents",
+    });
+
+  // ---------------- 2️⃣ FETCH CAMERA LOCATION ----------------
+  let location = {
+    name: "Unknown Camera",
+    area: "Unknown Area",
+    lat: null,
+    lng: null,
+  };
+
+  const cameraDoc = await db
+    .collection("cameras")
+    .doc(cameraId)
+    .get();
+
+  if (cameraDoc.exists) {
+    const cam = cameraDoc.data();
+
+    location = {
+      name: cam.name || "Camera",
+      area: cam.area || "Unknown Area",
+      lat:
+        typeof cam.latitude === "number"
+          ? cam.latitude
+          : null,
+      lng:
+        typeof cam.longitude === "number"
+          ? cam.longitude
+          : null,
+    };
+  }
+
+  // ---------------- 3️⃣ PREPARE INCIDENT DATA ----------------
+  const incidentData = {
+    // 🔴 Core
+    type,                                // e.g. ASSAULT_WITH_WEAPON
+    confidence: Number(confidence),      // 0.0 – 1.0
+    threat_level: threat_level || "LOW",
+    threat_score: Number(threat_score || 0),
+    crime_detected: true,
+
+    // 🎥 Source
+    cameraId,
+    source: source || "ai-image-detection",
+
+    // 📍 Location (MAP READY)
+    location,
+
+    // 🧠 AI Explainability
+    persons_detected: Number(persons_detected || 0),
+    activities: activities || [],
+    signals: signals || [],
+    occurrences: Number(occurrences || 1),
+    firstSeen: firstSeen || null,
+    lastSeen: lastSeen || null,
+
+    // 🖼 Evidence
+    imageUrl: uploadResponse.secure_url,
+    evidenceClips: Array.isArray(evidenceClips) ? evidenceClips : [],
+
+    // ⏱ Time
+    createdAt: admin.firestore.FieldValue.serverTimestamp(),
+    updatedAt: admin.firestore.FieldValue.serverTimestamp(),
+  };
+
+  // ---------------- 4️⃣ SAVE TO FIRESTORE ----------------
+  const docRef = await db
+    .collection("incidents")
+    .add(incidentData);
+
+  // ---------------- 5️⃣ REAL-TIME ALERT (SOCKET.IO) ----------------
+  if (io) {
+    io.emit("new-incident", {
+      id: docRef.id,
+      ...incidentData,
+    });
+  }
+
+  return { id: docRef.id, incidentData };
+};
+
 /**
  * Create & save crime incident
  * 📍 Location is derived from CAMERA (primary source)
@@ -8,119 +127,25 @@ const { admin, db } = require("../config/firebase");
  */
 exports.createIncident = async (req, res) => {
   try {
-    const {
-      type,
-      confidence,
-      cameraId,
-      imageBase64,
-
-      // AI optional fields
-      threat_level,
-      threat_score,
-      persons_detected,
-      activities,
-      signals,
-      source,
-    } = req.body;
-
     // ---------------- VALIDATION ----------------
-    if (
-      !type ||
-      confidence === undefined ||
-      !cameraId ||
-      !imageBase64
-    ) {
+    if (!hasRequiredFields(req.body)) {
       return res.status(400).json({
         success: false,
         message: "Missing required fields",
       });
     }
 
-    // ---------------- 1️⃣ UPLOAD IMAGE ----------------
-    const uploadResponse =
-      await cloudinary.uploader.upload(imageBase64, {
-        folder: "crime-detection/incidents",
-      });
-
-    // ---------------- 2️⃣ FETCH CAMERA LOCATION ----------------
-    let location = {
-      name: "Unknown Camera",
-      area: "Unknown Area",
-      lat: null,
-      lng: null,
-    };
-
-    const cameraDoc = await db
-      .collection("cameras")
-      .doc(cameraId)
-      .get();
-
-    if (cameraDoc.exists) {
-      const cam = cameraDoc.data();
-
-      location = {
-        name: cam.name || "Camera",
-        area: cam.area || "Unknown Area",
-        lat:
-          typeof cam.latitude === "number"
-            ? cam.latitude
-            : null,
-        lng:
-          typeof cam.longitude === "number"
-            ? cam.longitude
-            : null,
-      };
-    }
-
-    // ---------------- 3️⃣ PREPARE INCIDENT DATA ----------------
-    const incidentData = {
-      // 🔴 Core
-      type,                                // e.g. ASSAULT_WITH_WEAPON
-      confidence: Number(confidence),      // 0.0 – 1.0
-      threat_level: threat_level || "LOW",
-      threat_score: Number(threat_score || 0),
-      crime_detected: true,
-
-      // 🎥 Source
-      cameraId,
-      source: source || "ai-image-detection",
-
-      // 📍 Location (MAP READY)
-      location,
-
-      // 🧠 AI Explainability
-      persons_detected: Number(persons_detected || 0),
-      activities: activities || [],
-      signals: signals || [],
-
-      // 🖼 Evidence
-      imageUrl: uploadResponse.secure_url,
-
-      // ⏱ Time
-      createdAt: admin.firestore.FieldValue.serverTimestamp(),
-      updatedAt: admin.firestore.FieldValue.serverTimestamp(),
-    };
-
-    // ---------------- 4️⃣ SAVE TO FIRESTORE ----------------
-    const docRef = await db
-      .collection("incidents")
-      .add(incidentData);
-
-    // ---------------- 5️⃣ REAL-TIME ALERT (SOCKET.IO) ----------------
-    const io = req.app.get("io");
-    if (io) {
-      io.emit("new-incident", {
-        id: docRef.id,
-        ...incidentData,
-      });
-    }
+    const { id, incidentData } = await saveIncident(
+      req.body,
+      req.app.get("io")
+    );
 
     // ---------------- RESPONSE ----------------
     return res.status(201).json({
       success: true,
-      incidentId: docRef.id,
+      incidentId: id,
       data: {
-        id: docRef.id,
+        id,
         ...incidentData,
       },
     });
@@ -134,3 +159,60 @@ exports.createIncident = async (req, res) => {
     });
   }
 };
+
+/**
+ * Create incidents in bulk (AI server alert archive drain)
+ * 📦 Incidents are processed in order; on failure `processed` tells the
+ *    caller how many leading incidents were handled so it can resume.
+ *    Incidents missing required fields are not saved: their indexes are
+ *    returned in `rejected` (HTTP 207) so the caller can keep track of them.
+ *
+ * Body: { incidents: [ <createIncident body>, ... ] }
+ */
+exports.createIncidentsBulk = async (req, res) => {
+  const { incidents } = req.body || {};
+
+  if (!Array.isArray(incidents) || incidents.length === 0) {
+    return res.status(400).json({
+      success: false,
+      message: "incidents must be a non-empty array",
+    });
+  }
+
+  const io = req.app.get("io");
+  const incidentIds = [];
+  const rejected = [];
+  let processed = 0;
+
+  try {
+    for (const [index, incident] of incidents.entries()) {
+      if (hasRequiredFields(incident)) {
+        const { id } = await saveIncident(incident, io);
+        incidentIds.push(id);
+      } else {
+        rejected.push(index);
+      }
+      processed += 1;
+    }
+
+    return res.status(rejected.length ? 207 : 201).json({
+      success: true,
+      saved: incidentIds.length,
+      processed,
+      rejected,
+      incidentIds,
+      ...(rejected.length && { message: "Some incidents are missing required fields" }),
+    });
+  } catch (error) {
+    console.error("❌ Bulk Incident Error:", error);
+
+    return res.status(500).json({
+      success: false,
+      message: "Failed to create incidents",
+      saved: incidentIds.length,
+      processed,
+      rejected,
+      incidentIds,
+    });
+  }
+};
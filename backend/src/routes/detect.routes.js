@@ -82,9 +82,13 @@ router.post("/image", upload.single("image"), async (req, res) => {
       filename: req.file.originalname,
       contentType: req.file.mimetype,
     });
+    // Lets a shard router keep each camera on one AI server
+    if (location.cameraId) {
+      formData.append("camera_id", String(location.cameraId));
+    }
 
     const aiRes = await axios.post(
-      "http://127.0.0.1:8000/detect-image",
+      `${process.env.AI_SERVER_URL || "http://127.0.0.1:8000"}/detect-image`,
       formData,
       {
         headers: formData.getHeaders(),
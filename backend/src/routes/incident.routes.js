@@ -3,6 +3,7 @@ const router = express.Router();
 
 const {
   createIncident,
+  createIncidentsBulk,
 } = require("../controllers/incident.controller");
 
 // ------------------------------------
@@ -32,4 +33,16 @@ const {
  */
 router.post("/create", createIncident);
 
+/**
+ * 📦 Create incidents in bulk
+ * Used by:
+ *  - AI server alert archive drain (backlog after an outage)
+ *
+ * Body:
+ * {
+ *   incidents: [ { ...same fields as /create } ]
+ * }
+ */
+router.post("/bulk", createIncidentsBulk);
+
 module.exports = router;